@@ -0,0 +1,202 @@
+"""Async database access for the ASGI entry point, see app/asgi.py"""
+import asyncio
+import collections
+import itertools
+import os
+import re
+import time
+
+from sqlalchemy.dialects.postgresql.base import PGDialect
+from sqlalchemy.dialects.sqlite.base import SQLiteDialect
+from sqlalchemy.engine.url import make_url
+
+# asyncpg numbers its parameters $1, $2, the numeric paramstyle writes :1, :2
+NUMERIC_PARAMETER = re.compile(r'(?<![:\w]):(\d+)\b')
+
+
+class SQLitePool(object):
+    """aiosqlite connections handed out from a queue"""
+
+    dialect = SQLiteDialect(paramstyle='qmark')
+
+    def __init__(self, url, size, root_path):
+        self.path = url.database or ':memory:'
+        if self.path != ':memory:' and not os.path.isabs(self.path):
+            # As Flask-SQLAlchemy resolves a relative SQLite path
+            self.path = os.path.join(root_path, self.path)
+        self.size = size
+        self.queue = None
+
+    async def open(self):
+        import aiosqlite
+        queue = asyncio.Queue()
+        for _ in range(self.size):
+            queue.put_nowait(await aiosqlite.connect(self.path))
+        self.queue = queue
+
+    async def acquire(self, timeout):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    async def release(self, connection):
+        self.queue.put_nowait(connection)
+
+    async def execute(self, connection, sql, args):
+        return await connection.execute_fetchall(sql, args)
+
+    async def close(self):
+        while not self.queue.empty():
+            await self.queue.get_nowait().close()
+
+
+class PostgresPool(object):
+    """asyncpg connection pool"""
+
+    dialect = PGDialect(paramstyle='numeric')
+
+    def __init__(self, url, size, max_overflow):
+        # asyncpg reads the DSN's query options, sslmode among them
+        self.dsn = 'postgresql://' + str(url).split('://', 1)[1]
+        self.size = size
+        self.max_size = size + max_overflow
+        self.pool = None
+
+    async def open(self):
+        import asyncpg
+        self.pool = await asyncpg.create_pool(
+            self.dsn, min_size=self.size, max_size=self.max_size)
+
+    async def acquire(self, timeout):
+        return await self.pool.acquire(timeout=timeout)
+
+    async def release(self, connection):
+        await self.pool.release(connection)
+
+    async def execute(self, connection, sql, args):
+        return await connection.fetch(NUMERIC_PARAMETER.sub(r'$\1', sql), *args)
+
+    async def close(self):
+        await self.pool.close()
+
+
+class AsyncEngine(object):
+    """Runs SQLAlchemy Core selects on one database without blocking
+
+    Statements are compiled with SQLAlchemy's dialect for the database and
+    their parameters and results go through the column types' processors,
+    so rows come back as the values the sync engine would give. Each
+    statement checks out its own connection, waiting at most pool_timeout
+    seconds for one.
+    """
+
+    def __init__(self, uri, pool_size, max_overflow, pool_timeout, root_path):
+        url = make_url(uri)
+        if url.get_backend_name() == 'sqlite':
+            self.pool = SQLitePool(url, pool_size + max_overflow, root_path)
+        elif url.get_backend_name() in ('postgresql', 'postgres'):
+            self.pool = PostgresPool(url, pool_size, max_overflow)
+        else:
+            raise ValueError('No async driver for {}'.format(url.drivername))
+        self.dialect = self.pool.dialect
+        self.pool_timeout = pool_timeout
+        self.opened = False
+        self.lock = None
+        self.row_types = {}
+
+    async def open(self):
+        # Made here rather than in __init__ so the lock is on the serving loop
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            if not self.opened:
+                await self.pool.open()
+                self.opened = True
+
+    async def close(self):
+        if self.opened:
+            await self.pool.close()
+            self.opened = False
+
+    def row_type(self, statement):
+        """Named tuple of a select's columns, rows read like the sync engine's"""
+        keys = tuple(column.key for column in statement.columns)
+        row_type = self.row_types.get(keys)
+        if row_type is None:
+            row_type = self.row_types[keys] = collections.namedtuple('Row', keys, rename=True)
+        return row_type
+
+    def compile(self, statement):
+        """(sql, positional args, result processors) of a select"""
+        dialect = self.dialect
+        compiled = statement.compile(dialect=dialect)
+        params = compiled.construct_params()
+        args = []
+        for name in compiled.positiontup:
+            value = params[name]
+            processor = compiled.binds[name].type.dialect_impl(dialect).bind_processor(dialect)
+            args.append(processor(value) if processor is not None else value)
+        processors = [column.type.dialect_impl(dialect).result_processor(dialect, None)
+                      for column in statement.columns]
+        return compiled.string, args, processors
+
+    async def fetch(self, statement, timer=None):
+        """Rows of a select as named tuples, timed into a RequestTimer if given"""
+        sql, args, processors = self.compile(statement)
+        row_type = self.row_type(statement)
+        if not self.opened:
+            await self.open()
+        connection = await self.pool.acquire(self.pool_timeout)
+        try:
+            started = time.perf_counter()
+            rows = await self.pool.execute(connection, sql, args)
+            if timer is not None:
+                timer.record(sql, time.perf_counter() - started)
+        finally:
+            await self.pool.release(connection)
+        if not any(processors):
+            return [row_type._make(row) for row in rows]
+        return [row_type._make(value if processor is None else processor(value)
+                               for processor, value in zip(processors, row)) for row in rows]
+
+    async def fetchone(self, statement, timer=None):
+        rows = await self.fetch(statement, timer)
+        return rows[0] if rows else None
+
+
+class AsyncDatabase(object):
+    """The app's primary database and replicas, for async handlers
+
+    Uses the URIs and pool settings of the sync engines. A SQLite database
+    without SQLALCHEMY_POOL_SIZE gets one connection. Reads are spread over
+    SQLALCHEMY_REPLICA_URIS in turn, as ReplicaRouter does.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+
+        def engine(uri):
+            return AsyncEngine(
+                uri, config.get('SQLALCHEMY_POOL_SIZE') or 1,
+                config.get('SQLALCHEMY_MAX_OVERFLOW') or 0,
+                config.get('SQLALCHEMY_POOL_TIMEOUT'), app.root_path)
+        self.primary = engine(config['SQLALCHEMY_DATABASE_URI'])
+        self.replicas = [engine(uri) for uri in config.get('SQLALCHEMY_REPLICA_URIS') or []]
+        self.turns = itertools.cycle(self.replicas)
+        app.extensions['async_database'] = self
+
+    def reader(self):
+        """Engine a read-only request reads from"""
+        if self.replicas:
+            return next(self.turns)
+        return self.primary
+
+    async def open(self):
+        for engine in [self.primary] + self.replicas:
+            await engine.open()
+
+    async def close(self):
+        for engine in [self.primary] + self.replicas:
+            await engine.close()
@@ -0,0 +1,431 @@
+"""ASGI app answering the read endpoints with async handlers
+
+The GET handlers of lists and items wait on the database without holding
+a thread, so a slow database doesn't cap the requests in flight at the
+number of threads. Every other request, streamed reads included, is
+answered by the Flask app on a pool of ASGI_WSGI_THREADS threads.
+"""
+import asyncio
+import collections
+import datetime
+import re
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+import jwt
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.wsgi import WsgiToAsgi
+from sqlalchemy import and_, func, or_, select
+from werkzeug.http import is_resource_modified
+
+from app.aiodb import AsyncDatabase
+from app.cache import shoppinglists_scope, shoppinglist_scope, items_scope, item_scope
+from app.helpers import page_limit, encode_cursor, decode_cursor, make_etag, validator_headers
+from app.metrics import RequestTimer
+from app.models import ShoppingList, ShoppingListItem, Users, UserToken
+from app.revocation import token_key
+from app.serializers import (
+    shoppinglist_serializer, shoppinglist_detail_serializer, shoppinglistitem_serializer,
+    shoppinglistitem_detail_serializer)
+
+# (rule as in app.url_map, path pattern, handler) of the GETs answered here
+ROUTES = (
+    ('/', re.compile(r'/\Z'), 'home'),
+    ('/shoppinglists', re.compile(r'/shoppinglists\Z'), 'shoppinglists'),
+    ('/shoppinglist/<int:shoppinglist_id>',
+     re.compile(r'/shoppinglist/([0-9]+)\Z'), 'shoppinglist'),
+    ('/shoppinglist/<int:shoppinglist_id>/items',
+     re.compile(r'/shoppinglist/([0-9]+)/items\Z'), 'items'),
+    ('/shoppinglist/<int:shoppinglist_id>/item/<int:shoppinglistitem_id>',
+     re.compile(r'/shoppinglist/([0-9]+)/item/([0-9]+)\Z'), 'item'),
+)
+
+Response = collections.namedtuple('Response', 'body status headers')
+
+
+class Request(object):
+    """The parts of an ASGI http scope the handlers read"""
+
+    def __init__(self, scope, database):
+        self.method = scope['method']
+        self.path = scope['path']
+        query = scope.get('query_string', b'').decode('latin-1')
+        # The first value of a repeated argument, as request.args.get
+        self.args = dict(reversed(parse_qsl(query, keep_blank_values=True)))
+        self.headers = {}
+        for name, value in scope['headers']:
+            self.headers.setdefault(name.decode('latin-1').lower(), value.decode('latin-1'))
+        self.database = database
+        self.timer = RequestTimer()
+
+    def fetch(self, statement):
+        return self.database.fetch(statement, self.timer)
+
+    def fetchone(self, statement):
+        return self.database.fetchone(statement, self.timer)
+
+    def not_modified(self, etag, last_modified=None):
+        """A 304 response if the client's copy is still current, else None"""
+        environ = {'REQUEST_METHOD': self.method}
+        for name, value in self.headers.items():
+            environ['HTTP_' + name.upper().replace('-', '_')] = value
+        if is_resource_modified(environ, etag=etag, last_modified=last_modified):
+            return None
+        # Werkzeug drops Last-Modified from a 304 as an entity header
+        return Response(b'', 304, {'ETag': validator_headers(etag)['ETag']})
+
+
+class AsyncAPI(object):
+    """ASGI app serving a Flask app's routes, reads through async handlers
+
+    Handlers answer with the status codes, bodies and validators of the
+    Flask resources and share their response cache, token caches and
+    metrics. They read from a replica when SQLALCHEMY_REPLICA_URIS are
+    set, and don't cache what they read there, as the Flask ones.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.database = AsyncDatabase(app)
+        self.executor = ThreadPoolExecutor(app.config.get('ASGI_WSGI_THREADS'))
+        self.wsgi = sync_to_async(
+            self.run_wsgi, thread_sensitive=False, executor=self.executor)
+        self.bridge = WsgiToAsgi(app)
+        self.dumps = app.extensions['json_encoding'].dumps
+        self.cache = app.extensions['response_cache']
+        self.token_verifier = app.extensions['token_verifier']
+        self.revoked_tokens = app.extensions['revoked_tokens']
+        self.metrics = app.extensions.get('request_metrics')
+        self.routes = [(rule, pattern, getattr(self, name)) for rule, pattern, name in ROUTES]
+        app.extensions['asgi'] = self
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] == 'http' and scope['method'] == 'GET':
+            for rule, pattern, handler in self.routes:
+                match = pattern.match(scope['path'])
+                if match is not None:
+                    if await self.handle(scope, send, rule, handler, match.groups()):
+                        return
+                    break
+        await self.wsgi(scope, receive, send)
+
+    def run_wsgi(self, scope, receive, send):
+        """Answer a request with the Flask app, on a thread of the executor
+
+        WsgiToAsgi calls the app in thread sensitive mode, which asgiref
+        runs on the thread of the outermost synchronous caller, this one,
+        rather than on its single shared thread. Requests therefore run
+        side by side on ASGI_WSGI_THREADS threads.
+        """
+        async_to_sync(self.bridge.__call__)(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.database.open()
+                except Exception as err:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(err)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.database.close()
+                self.executor.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def handle(self, scope, send, rule, handler, ids):
+        """Answer a request, False when the Flask app should"""
+        request = Request(scope, self.database.reader())
+        if request.args.get('stream', '').lower() in ('1', 'true'):
+            return False
+        try:
+            response = await handler(request, *(int(value) for value in ids))
+        except Exception:
+            if self.app.propagate_exceptions:
+                raise
+            self.app.logger.exception('Exception on %s [%s]', request.path, request.method)
+            response = self.json({'message': 'Internal Server Error'}, 500)
+        if response is None:
+            return False
+        headers = dict(response.headers)
+        if self.metrics is not None:
+            server_timing = self.metrics.record(
+                rule, request.method, request.path, response.status, request.timer)
+            if server_timing is not None:
+                headers['Server-Timing'] = server_timing
+        await send({
+            'type': 'http.response.start',
+            'status': response.status,
+            'headers': [(name.lower().encode('latin-1'), str(value).encode('latin-1'))
+                        for name, value in headers.items()],
+        })
+        await send({'type': 'http.response.body', 'body': response.body})
+        return True
+
+    def json(self, data, status=200, headers=None):
+        body = self.dumps(data)
+        return Response(body, status, dict(
+            headers or {}, **{'Content-Type': 'application/json', 'Content-Length': len(body)}))
+
+    def replay(self, request, cached):
+        """Rebuild a cached response, or a 304 if the client already has it"""
+        unchanged = request.not_modified(cached['etag'], cached['last_modified'])
+        if unchanged is not None:
+            return unchanged
+        return Response(cached['body'], cached['status'], dict(
+            validator_headers(cached['etag'], cached['last_modified']),
+            **{'Content-Type': 'application/json', 'Content-Length': len(cached['body'])}))
+
+    def store(self, request, scope, variant, version, response, etag, last_modified):
+        """Cache a response unless it was read from a replica"""
+        if request.database is not self.database.primary:
+            return
+        self.cache.set(scope, variant, version, response.body, response.status,
+                       etag, last_modified)
+
+    async def authenticate(self, request):
+        """The user id, an error response, or None for Flask to answer"""
+        auth_header = request.headers.get('authorization')
+        if not auth_header:
+            return self.json({
+                'status': 'fail',
+                'message': 'Authorization is not provided'
+            }, 500)
+        parts = auth_header.split(" ")
+        if len(parts) < 2:
+            return None
+        access_token = parts[1]
+        try:
+            payload = self.token_verifier.decode(access_token)
+            if not await self.is_revoked(request, token_key(access_token, payload), payload.get('exp')):
+                return payload['sub']
+            message = 'Token created. Please log in again.'
+        except jwt.ExpiredSignatureError:
+            message = 'Signature expired. Please log in again.'
+        except jwt.InvalidTokenError:
+            message = 'Invalid token. Please log in again.'
+        return self.json({
+            'status': 'fail',
+            'message': message
+        }, 403)
+
+    async def is_revoked(self, request, key, expires_at):
+        """UserToken.check_token, looking the key up without blocking"""
+        revoked_tokens = self.revoked_tokens
+        if revoked_tokens.sync_due():
+            # Once every REVOCATION_REFRESH_SECONDS, on a thread
+            await asyncio.get_event_loop().run_in_executor(self.executor, self.sync_revoked)
+        revoked = revoked_tokens.known(key)
+        if revoked is None:
+            statement = select([UserToken.id]).where(UserToken.jti == key).limit(1)
+            revoked = await request.fetchone(statement) is not None
+            if not revoked and request.database is not self.database.primary:
+                # The replica may lag the revocations the sync read from the primary
+                revoked = await self.database.primary.fetchone(statement, request.timer) is not None
+            if revoked:
+                revoked_tokens.remember(key, expires_at)
+        return revoked
+
+    def sync_revoked(self):
+        from app.app import db
+        with self.app.app_context():
+            try:
+                # From the primary, as UserToken.check_token does
+                self.revoked_tokens.sync(UserToken.revoked_since)
+            finally:
+                db.session.remove()
+
+    async def home(self, request):
+        return self.json({'message': "Welcome to Shopping List API"}, 200)
+
+    async def shoppinglists(self, request):
+        user_id = await self.authenticate(request)
+        if not isinstance(user_id, int):
+            return user_id
+        try:
+            limit = page_limit(
+                request.args.get('limit'),
+                self.app.config.get('PAGE_SIZE'),
+                self.app.config.get('MAX_PAGE_SIZE'))
+            cursor = request.args.get('cursor')
+            if cursor:
+                cursor = decode_cursor(cursor, datetime.datetime, int)
+        except ValueError as err:
+            return self.json({
+                'status': 'fail',
+                'message': str(err)
+            }, 202)
+        scope = shoppinglists_scope(user_id)
+        variant = '{}:{}'.format(limit, request.args.get('cursor') or '')
+        cached = self.cache.get(scope, variant)
+        if cached is not None:
+            return self.replay(request, cached)
+        version = self.cache.version(scope)
+        count, last_modified, last_id, owner_version = await request.fetchone(select([
+            func.count(ShoppingList.id),
+            func.max(ShoppingList.date_modified),
+            func.max(ShoppingList.id),
+            Users.version_subquery(user_id)
+        ]).where(ShoppingList.owner_id == user_id))
+        etag = make_etag(user_id, count, last_modified, last_id, owner_version, limit, request.args.get('cursor'), False)
+        headers = validator_headers(etag, last_modified)
+        unchanged = request.not_modified(etag, last_modified)
+        if unchanged is not None:
+            return unchanged
+        shoppinglists = select(shoppinglist_serializer.columns(ShoppingList)).where(
+            ShoppingList.owner_id == user_id)
+        if cursor:
+            created, last_id = cursor
+            anchor = select([ShoppingList.date_created]).where(
+                ShoppingList.id == last_id).as_scalar()
+            anchor = func.coalesce(anchor, created)
+            shoppinglists = shoppinglists.where(or_(
+                ShoppingList.date_created > anchor,
+                and_(ShoppingList.date_created == anchor, ShoppingList.id > last_id)
+            ))
+        shoppinglists = await request.fetch(shoppinglists.order_by(
+            ShoppingList.date_created, ShoppingList.id).limit(limit + 1))
+        results = shoppinglist_serializer.rows(shoppinglists[:limit])
+        if len(results) == 0:
+            return self.json({
+                'message': "You don't have any shoppinglists for now."
+            }, 200, headers)
+        next_cursor = None
+        if len(shoppinglists) > limit:
+            last = shoppinglists[limit - 1]
+            next_cursor = encode_cursor(last.date_created, last.id)
+        response = self.json({
+            'shoppinglists': results,
+            'next_cursor': next_cursor
+        }, 202, headers)
+        self.store(request, scope, variant, version, response, etag, last_modified)
+        return response
+
+    async def shoppinglist(self, request, shoppinglist_id):
+        user_id = await self.authenticate(request)
+        if not isinstance(user_id, int):
+            return user_id
+        scope = shoppinglist_scope(shoppinglist_id)
+        cached = self.cache.get(scope)
+        if cached is not None:
+            return self.replay(request, cached)
+        version = self.cache.version(scope)
+        shoppinglist = await request.fetchone(select(
+            shoppinglist_detail_serializer.columns(ShoppingList) + [ShoppingList.date_modified]
+        ).where(ShoppingList.id == shoppinglist_id).limit(1))
+        if shoppinglist:
+            etag = make_etag(
+                shoppinglist.id, shoppinglist.owner_id, shoppinglist.title,
+                shoppinglist.description, shoppinglist.date_modified)
+            unchanged = request.not_modified(etag, shoppinglist.date_modified)
+            if unchanged is not None:
+                return unchanged
+            response = self.json(dict(
+                shoppinglist_detail_serializer.row(shoppinglist[:-1]),
+                status='success'), 201, validator_headers(etag, shoppinglist.date_modified))
+            self.store(request, scope, '', version, response, etag, shoppinglist.date_modified)
+            return response
+        return self.json({
+            'message': 'Requested value \'{}\' was not found'.format(shoppinglist_id)
+        }, 202)
+
+    async def items(self, request, shoppinglist_id):
+        user_id = await self.authenticate(request)
+        if not isinstance(user_id, int):
+            return user_id
+        try:
+            limit = page_limit(
+                request.args.get('limit'),
+                self.app.config.get('PAGE_SIZE'),
+                self.app.config.get('MAX_PAGE_SIZE'))
+            cursor = request.args.get('cursor')
+            if cursor:
+                cursor = decode_cursor(cursor, int)
+        except ValueError as err:
+            return self.json({
+                'status': 'fail',
+                'message': str(err)
+            }, 202)
+        scope = items_scope(user_id, shoppinglist_id)
+        variant = '{}:{}'.format(limit, request.args.get('cursor') or '')
+        cached = self.cache.get(scope, variant)
+        if cached is not None:
+            return self.replay(request, cached)
+        version = self.cache.version(scope)
+        count, last_modified, last_id, owner_version = await request.fetchone(select([
+            func.count(ShoppingListItem.item_id),
+            func.max(ShoppingListItem.date_modified),
+            func.max(ShoppingListItem.item_id),
+            Users.version_subquery(user_id)
+        ]).where(and_(
+            ShoppingListItem.shoppinglist_id == shoppinglist_id,
+            ShoppingListItem.owner_id == user_id)))
+        etag = make_etag(shoppinglist_id, user_id, count, last_modified, last_id, owner_version, limit, request.args.get('cursor'), False)
+        headers = validator_headers(etag, last_modified)
+        unchanged = request.not_modified(etag, last_modified)
+        if unchanged is not None:
+            return unchanged
+        shoppinglistitems = select(shoppinglistitem_serializer.columns(ShoppingListItem)).where(and_(
+            ShoppingListItem.shoppinglist_id == shoppinglist_id,
+            ShoppingListItem.owner_id == user_id))
+        if cursor:
+            shoppinglistitems = shoppinglistitems.where(ShoppingListItem.item_id > cursor[0])
+        shoppinglistitems = await request.fetch(shoppinglistitems.order_by(
+            ShoppingListItem.item_id).limit(limit + 1))
+        results = shoppinglistitem_serializer.rows(shoppinglistitems[:limit])
+        if len(results) == 0:
+            return self.json({
+                'status': 'success',
+                'message': "You don't have any items for now"
+            }, 202, headers)
+        next_cursor = None
+        if len(shoppinglistitems) > limit:
+            next_cursor = encode_cursor(shoppinglistitems[limit - 1].item_id)
+        response = self.json({
+            'items': results,
+            'next_cursor': next_cursor
+        }, 202, headers)
+        self.store(request, scope, variant, version, response, etag, last_modified)
+        return response
+
+    async def item(self, request, shoppinglist_id, shoppinglistitem_id):
+        user_id = await self.authenticate(request)
+        if not isinstance(user_id, int):
+            return user_id
+        scope = item_scope(shoppinglist_id)
+        variant = str(shoppinglistitem_id)
+        cached = self.cache.get(scope, variant)
+        if cached is not None:
+            return self.replay(request, cached)
+        version = self.cache.version(scope)
+        shoppinglistitem = await request.fetchone(select(
+            shoppinglistitem_detail_serializer.columns(ShoppingListItem) + [ShoppingListItem.date_modified]
+        ).where(and_(
+            ShoppingListItem.item_id == shoppinglistitem_id,
+            ShoppingListItem.shoppinglist_id == shoppinglist_id)).limit(1))
+        if shoppinglistitem:
+            etag = make_etag(
+                shoppinglistitem.item_id, shoppinglistitem.owner_id,
+                shoppinglistitem.shoppinglist_id, shoppinglistitem.item_title,
+                shoppinglistitem.item_description, shoppinglistitem.date_modified)
+            unchanged = request.not_modified(etag, shoppinglistitem.date_modified)
+            if unchanged is not None:
+                return unchanged
+            response = self.json(dict(
+                shoppinglistitem_detail_serializer.row(shoppinglistitem[:-1]),
+                message='success'), 201, validator_headers(etag, shoppinglistitem.date_modified))
+            self.store(request, scope, variant, version, response, etag, shoppinglistitem.date_modified)
+            return response
+        return self.json({
+            'message': 'Requested value \'{}\' was not found'.format(shoppinglistitem_id)
+        }, 202)
+
+
+def create_asgi_app(config_name):
+    from app.app import create_app
+    return AsyncAPI(create_app(config_name))
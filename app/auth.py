@@ -0,0 +1,62 @@
+"""Token verification with a cache of already verified claims"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+
+
+class TokenVerifier(object):
+    """Verifies auth tokens, remembering the claims of good ones
+
+    A token's signature is checked once, after that its claims are served
+    from a bounded LRU keyed by the token's SHA-256 until the token's exp.
+    Only the signature and expiry checks are cached, revocation is checked
+    by the caller on every request.
+    """
+
+    algorithms = ['HS256']
+
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.secret_key = app.config.get('SECRET_KEY')
+        self.max_size = app.config.get('VERIFIED_TOKEN_CACHE_SIZE')
+        self.claims = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        app.extensions['token_verifier'] = self
+
+    def decode(self, token):
+        """Claims of a valid token, raises jwt.InvalidTokenError otherwise"""
+        if not isinstance(token, bytes):
+            token = str(token).encode('utf-8')
+        digest = hashlib.sha256(token).digest()
+        with self.lock:
+            payload = self.claims.get(digest)
+            if payload is not None:
+                if time.time() < payload['exp']:
+                    self.claims.move_to_end(digest)
+                    self.hits += 1
+                    return payload
+                del self.claims[digest]
+            self.misses += 1
+        payload = jwt.decode(token, self.secret_key, algorithms=self.algorithms)
+        if self.max_size and isinstance(payload.get('exp'), int):
+            with self.lock:
+                self.claims[digest] = payload
+                while len(self.claims) > self.max_size:
+                    self.claims.popitem(last=False)
+        return payload
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self.claims),
+            }
@@ -0,0 +1,223 @@
+"""Cache of serialized read responses, dropped by the writes that stale them"""
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from werkzeug.utils import import_string
+
+logger = logging.getLogger(__name__)
+
+
+def shoppinglists_scope(owner_id):
+    return 'shoppinglists:{}'.format(owner_id)
+
+
+def shoppinglist_scope(shoppinglist_id):
+    return 'shoppinglist:{}'.format(shoppinglist_id)
+
+
+def items_scope(owner_id, shoppinglist_id):
+    return 'items:{}:{}'.format(owner_id, shoppinglist_id)
+
+
+def item_scope(shoppinglist_id):
+    # Single items of a list share a scope so bulk writes can drop them all
+    return 'item:{}'.format(shoppinglist_id)
+
+
+class LRUCacheBackend(object):
+    """Default backend, a bounded in-process LRU
+
+    Entries are dropped ttl seconds after they were stored, None keeps them
+    until evicted.
+
+    Any object with the same get, update and stats methods can stand in
+    for it, see RESPONSE_CACHE_BACKEND. update must apply its function to
+    the current value atomically, as a compare-and-set loop would on a
+    shared store. Values are plain dicts of bytes, ints, strings and
+    datetimes.
+    """
+
+    def __init__(self, max_size, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.expires = {}
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self.lock:
+            value = self._live(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self._store(key, value)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.expires.pop(key, None)
+
+    def update(self, key, function):
+        """Replace a value by function(value) in one step, None deletes it
+
+        Returns the new value.
+        """
+        with self.lock:
+            current = self._live(key)
+            value = function(current)
+            if value is None:
+                self.entries.pop(key, None)
+                self.expires.pop(key, None)
+            elif value is not current:
+                self._store(key, value)
+            return value
+
+    def _live(self, key):
+        value = self.entries.get(key)
+        if value is not None and self.ttl is not None and self.expires[key] <= time.monotonic():
+            del self.entries[key]
+            del self.expires[key]
+            self.expirations += 1
+            return None
+        return value
+
+    def _store(self, key, value):
+        self.entries.pop(key, None)
+        self.entries[key] = value
+        if self.ttl is not None:
+            self.expires[key] = time.monotonic() + self.ttl
+        while len(self.entries) > self.max_size:
+            evicted, _ = self.entries.popitem(last=False)
+            self.expires.pop(evicted, None)
+            self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+class ResponseCache(object):
+    """Serialized GET responses grouped by scope
+
+    A scope is one collection or object, see the *_scope functions, and
+    holds a response per variant such as a page of the collection. Model
+    writes drop the scopes they touch after committing. A response read
+    from the database before such a write is not stored if the write's
+    invalidation happened in between: readers take the scope's version
+    before reading, every invalidation replaces it, and set stores only
+    while it is unchanged. The version lives in the backend entry and is
+    checked and replaced in the backend's atomic update, so this also
+    holds across processes sharing a backend.
+
+    The default backend lives in the process and a write only drops the
+    scopes of the process that served it. Entries expire after
+    RESPONSE_CACHE_TTL seconds, but with APP_PROCESSES above 1 other
+    processes would serve stale responses until then, so the cache is
+    turned off unless RESPONSE_CACHE_BACKEND points at a shared backend.
+    """
+
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config.get('RESPONSE_CACHE_BACKEND')
+        if backend is None:
+            size = app.config.get('RESPONSE_CACHE_SIZE')
+            if (app.config.get('APP_PROCESSES') or 1) > 1:
+                logger.warning(
+                    'Response cache off: %s app processes need a shared '
+                    'RESPONSE_CACHE_BACKEND', app.config['APP_PROCESSES'])
+                # Keeps nothing
+                size = 0
+            self.backend = LRUCacheBackend(size, app.config.get('RESPONSE_CACHE_TTL'))
+        else:
+            # Import string or callable taking the app
+            if isinstance(backend, str):
+                backend = import_string(backend)
+            self.backend = backend(app)
+        self.max_variants = app.config.get('RESPONSE_CACHE_VARIANTS')
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        app.extensions['response_cache'] = self
+
+    def get(self, scope, variant=''):
+        """Cached response dict for a variant of a scope, or None"""
+        entry = self.backend.get(scope)
+        cached = entry['variants'].get(variant) if entry else None
+        with self.lock:
+            if cached is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return cached
+
+    def version(self, scope):
+        """Version of a scope to pass to set, taken before reading the rows"""
+        def claim(entry):
+            if entry is None:
+                return {'version': uuid.uuid4().hex, 'variants': OrderedDict()}
+            return entry
+        return self.backend.update(scope, claim)['version']
+
+    def set(self, scope, variant, version, body, status, etag, last_modified=None):
+        """Store a response read while the scope was at version"""
+        def store(entry):
+            if entry is None or entry['version'] != version:
+                # Something was written since the rows were read
+                return entry
+            variants = OrderedDict(entry['variants'])
+            variants.pop(variant, None)
+            variants[variant] = {
+                'body': body,
+                'status': status,
+                'etag': etag,
+                'last_modified': last_modified,
+            }
+            while len(variants) > self.max_variants:
+                variants.popitem(last=False)
+            return {'version': version, 'variants': variants}
+        self.backend.update(scope, store)
+
+    def invalidate(self, scope, variant=None):
+        """Drop a scope, or only one variant of it"""
+        with self.lock:
+            self.invalidations += 1
+        if variant is None:
+            self.backend.update(scope, lambda entry: None)
+            return
+
+        def drop(entry):
+            if entry is None:
+                return None
+            variants = OrderedDict(entry['variants'])
+            variants.pop(variant, None)
+            # A new version so reads still in flight don't put it back
+            return {'version': uuid.uuid4().hex, 'variants': variants}
+        self.backend.update(scope, drop)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            stats = {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'invalidations': self.invalidations,
+            }
+        stats.update(self.backend.stats())
+        return stats
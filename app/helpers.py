@@ -1,6 +1,13 @@
-from flask import request
+import base64
+import datetime
+import hashlib
+import json
+from flask import current_app, request, make_response
+from werkzeug.http import http_date, is_resource_modified, quote_etag
 from app.models import Users
 
+EPOCH = datetime.datetime(1970, 1, 1)
+
 def middleware():
 		auth_header = request.headers.get('Authorization')
 		if auth_header:
@@ -19,6 +26,42 @@ def middleware():
 		}
 		return response, 500
 
+def make_etag(*parts):
+	"""Strong ETag over the values a representation is built from"""
+	data = json.dumps(parts, default=str, sort_keys=True).encode('utf-8')
+	return hashlib.sha1(data).hexdigest()
+
+def validator_headers(etag, last_modified=None):
+	"""ETag and Last-Modified headers for a GET response"""
+	headers = {'ETag': quote_etag(etag)}
+	if last_modified is not None:
+		headers['Last-Modified'] = http_date(last_modified)
+	return headers
+
+def not_modified(etag, last_modified=None):
+	"""A 304 response if the client's copy is still current, else None"""
+	if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+		return None
+	response = make_response('', 304)
+	response.headers.extend(validator_headers(etag, last_modified))
+	return response
+
+def replay_response(cached):
+	"""Rebuild a cached response, or a 304 if the client already has it"""
+	unchanged = not_modified(cached['etag'], cached['last_modified'])
+	if unchanged is not None:
+		return unchanged
+	response = current_app.response_class(
+		cached['body'], status=cached['status'], mimetype='application/json')
+	response.headers.extend(validator_headers(cached['etag'], cached['last_modified']))
+	return response
+
+def is_unique_violation(err):
+	"""Whether an IntegrityError comes from a unique constraint"""
+	if getattr(err.orig, 'pgcode', None) == '23505':
+		return True
+	return 'UNIQUE' in str(err.orig).upper()
+
 def is_valid(value, min_length, _type):
 	message = []
 	if len(value) != 0:
@@ -32,3 +75,88 @@ def is_valid(value, min_length, _type):
 			return message
 	message.append("Value can't be empty")
 	return message
+
+def page_limit(value, default, maximum):
+	"""Parse the requested page size and clamp it to the server-side cap"""
+	if value is None or value == '':
+		return default
+	try:
+		# isdigit alone lets through digits int() refuses, like '²'
+		limit = int(value) if str(value).isdigit() else 0
+	except ValueError:
+		limit = 0
+	if limit < 1:
+		raise ValueError("Limit should be a positive number")
+	return min(limit, maximum)
+
+def wants_stream():
+	"""Whether the client asked for the whole collection as a stream"""
+	return request.args.get('stream', '').lower() in ('1', 'true')
+
+def sync_version(value):
+	"""Parse the since watermark of /sync, omitted means from the start"""
+	if value is None or value == '':
+		return 0
+	try:
+		if str(value).isdigit():
+			return int(value)
+	except ValueError:
+		pass
+	raise ValueError("Since should be a version number")
+
+def encode_cursor(*keys):
+	"""Serialize the sort key of the last row on a page to an opaque token"""
+	values = []
+	for key in keys:
+		if isinstance(key, datetime.datetime):
+			key = (key - EPOCH) // datetime.timedelta(microseconds=1)
+		values.append(key)
+	raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+	return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, *types):
+	"""Turn a token from encode_cursor back into a sort key of the given types"""
+	cursor = str(cursor)
+	try:
+		raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+		values = json.loads(raw.decode('utf-8'))
+	except (TypeError, ValueError, UnicodeDecodeError):
+		raise ValueError("Invalid cursor")
+	if not isinstance(values, list) or len(values) != len(types):
+		raise ValueError("Invalid cursor")
+	keys = []
+	for value, _type in zip(values, types):
+		if not isinstance(value, int) or isinstance(value, bool):
+			raise ValueError("Invalid cursor")
+		# Ids are BIGINT, datetimes microseconds since the epoch
+		if not -2 ** 63 <= value < 2 ** 63:
+			raise ValueError("Invalid cursor")
+		if _type is datetime.datetime:
+			try:
+				value = EPOCH + datetime.timedelta(microseconds=value)
+			except OverflowError:
+				raise ValueError("Invalid cursor")
+		keys.append(value)
+	return keys
+
+def item_selection(data):
+	"""Read which items a bulk request applies to
+
+	Items are picked either by an 'item_ids' list or by a 'filter' object.
+	An empty filter picks every item on the shoppinglist, 'item_title'
+	narrows it to titles containing that text.
+	"""
+	if not isinstance(data, dict):
+		raise ValueError("Expected a JSON object")
+	if 'item_ids' in data:
+		item_ids = data['item_ids']
+		if not isinstance(item_ids, list) or not all(
+				isinstance(item_id, int) and not isinstance(item_id, bool) for item_id in item_ids):
+			raise ValueError("item_ids should be a list of numbers")
+		return {'item_ids': item_ids}
+	if isinstance(data.get('filter'), dict):
+		item_title = data['filter'].get('item_title')
+		if item_title is not None and not isinstance(item_title, str):
+			raise ValueError("filter item_title should be text")
+		return {'item_title': item_title}
+	raise ValueError("Provide item_ids or a filter")
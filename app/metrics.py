@@ -0,0 +1,297 @@
+"""Per-route request timing and query counts, exported for Prometheus"""
+import logging
+import threading
+import time
+from collections import Counter
+
+from flask import Response, current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.pool import pool_stats
+
+logger = logging.getLogger(__name__)
+
+# Statements are timed on every engine, and counted for the request whose
+# app context runs them. Queries from background threads are not counted.
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _record_statement(conn, statement)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute, drop its start
+    # time so the next statement on the connection isn't timed from it
+    connection = context.connection
+    if connection is not None and connection.info.get('query_started'):
+        _record_statement(connection, context.statement)
+
+
+def _record_statement(conn, statement):
+    seconds = time.perf_counter() - conn.info['query_started'].pop()
+    if has_app_context():
+        timer = g.get('request_timer')
+        if timer is not None:
+            timer.record(statement, seconds)
+
+
+class RequestTimer(object):
+    """Wall time, database time and statements of one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_seconds = 0.0
+        self.statements = []
+
+    def record(self, statement, seconds):
+        self.db_seconds += seconds
+        self.statements.append((statement, seconds))
+
+    @property
+    def queries(self):
+        return len(self.statements)
+
+
+def _labels(labels):
+    return ','.join('{}="{}"'.format(key, str(value).replace('\\', r'\\').replace(
+        '"', r'\"').replace('\n', r'\n')) for key, value in labels)
+
+
+def _metric(lines, name, kind, description, samples):
+    """Prometheus text lines of one metric, samples are (labels, value)"""
+    lines.append('# HELP {} {}'.format(name, description))
+    lines.append('# TYPE {} {}'.format(name, kind))
+    for labels, value in samples:
+        if labels:
+            lines.append('{}{{{}}} {}'.format(name, _labels(labels), value))
+        else:
+            lines.append('{} {}'.format(name, value))
+
+
+# (extension, stats key, metric, type, help) for the counters the other
+# extensions already keep
+EXTENSION_METRICS = (
+    ('token_verifier', 'hits', 'token_verifier_cache_hits_total', 'counter',
+     'Token checks answered from verified claims'),
+    ('token_verifier', 'misses', 'token_verifier_cache_misses_total', 'counter',
+     'Token checks that verified the signature'),
+    ('token_verifier', 'size', 'token_verifier_cache_size', 'gauge',
+     'Verified claims held'),
+    ('revoked_tokens', 'cache_hits', 'revoked_tokens_cache_hits_total', 'counter',
+     'Revocation checks answered from the revoked token cache'),
+    ('revoked_tokens', 'ruled_out', 'revoked_tokens_ruled_out_total', 'counter',
+     'Revocation checks ruled out by the Bloom filter'),
+    ('revoked_tokens', 'lookups', 'revoked_tokens_lookups_total', 'counter',
+     'Revocation checks that queried the database'),
+    ('revoked_tokens', 'cache_size', 'revoked_tokens_cache_size', 'gauge',
+     'Revoked tokens held in the cache'),
+    ('revoked_tokens', 'bloom_keys', 'revoked_tokens_bloom_keys', 'gauge',
+     'Revoked tokens added to the Bloom filter'),
+    ('token_sweeper', 'runs', 'token_sweeper_runs_total', 'counter',
+     'Expired token purges run'),
+    ('token_sweeper', 'purged_total', 'token_sweeper_purged_total', 'counter',
+     'Expired tokens purged'),
+    ('token_sweeper', 'last_duration_seconds', 'token_sweeper_last_duration_seconds', 'gauge',
+     'Duration of the last purge'),
+    ('token_sweeper', 'table_rows', 'token_sweeper_table_rows', 'gauge',
+     'Rows left in user_token after the last purge'),
+    ('response_cache', 'hits', 'response_cache_hits_total', 'counter',
+     'Responses served from the response cache'),
+    ('response_cache', 'misses', 'response_cache_misses_total', 'counter',
+     'Response cache lookups that missed'),
+    ('response_cache', 'invalidations', 'response_cache_invalidations_total', 'counter',
+     'Response cache scopes dropped by writes'),
+    ('response_cache', 'evictions', 'response_cache_evictions_total', 'counter',
+     'Response cache scopes evicted for space'),
+    ('response_cache', 'expirations', 'response_cache_expirations_total', 'counter',
+     'Response cache scopes dropped after RESPONSE_CACHE_TTL'),
+    ('response_cache', 'size', 'response_cache_size', 'gauge',
+     'Response cache scopes held'),
+)
+
+# (stats key, metric, type, help) for the database connection pool
+POOL_METRICS = (
+    ('pool_size', 'db_pool_size', 'gauge', 'Connections the pool keeps open'),
+    ('max_overflow', 'db_pool_max_overflow', 'gauge', 'Connections allowed beyond the pool size'),
+    ('checked_out', 'db_pool_checked_out', 'gauge', 'Connections in use'),
+    ('checked_in', 'db_pool_checked_in', 'gauge', 'Idle connections in the pool'),
+    ('overflow', 'db_pool_overflow', 'gauge', 'Connections open beyond the pool size'),
+    ('checkouts', 'db_pool_checkouts_total', 'counter', 'Connections checked out'),
+    ('timeouts', 'db_pool_timeouts_total', 'counter', 'Checkouts that gave up waiting for a connection'),
+    ('wait_seconds', 'db_pool_wait_seconds_total', 'counter', 'Time spent waiting for a connection'),
+    ('wait_p99', 'db_pool_wait_p99_seconds', 'gauge', 'Checkout wait of recent checkouts, 99th percentile'),
+)
+
+
+def extension_stats(app, name):
+    extension = app.extensions.get(name)
+    if extension is None:
+        return None
+    # The sweeper keeps a dict, the others compute theirs
+    stats = extension.stats
+    return stats() if callable(stats) else dict(stats)
+
+
+class RequestMetrics(object):
+    """Times every request and counts its SQL statements per route
+
+    Responses get a Server-Timing header with the request's wall and
+    database time. Requests slower than SLOW_REQUEST_SECONDS are logged
+    with their statements. Totals per route, and the counters of the other
+    extensions, are served in Prometheus text format at METRICS_PATH.
+
+    Streamed bodies are written after the request is timed, so their
+    queries are not included.
+    """
+
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.slow_seconds = app.config.get('SLOW_REQUEST_SECONDS')
+        self.server_timing = app.config.get('SERVER_TIMING')
+        self.buckets = tuple(app.config.get('REQUEST_DURATION_BUCKETS'))
+        self.routes = {}
+        app.before_request(self.start)
+        app.after_request(self.finish)
+        app.teardown_request(self.teardown)
+        path = app.config.get('METRICS_PATH')
+        if path:
+            app.add_url_rule(path, 'metrics', self.metrics)
+        app.extensions['request_metrics'] = self
+
+    def start(self):
+        g.request_timer = RequestTimer()
+
+    def finish(self, response):
+        timer = g.pop('request_timer', None)
+        if timer is None:
+            return response
+        rule = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+        server_timing = self.record(rule, request.method, request.path, response.status_code, timer)
+        if server_timing is not None:
+            response.headers['Server-Timing'] = server_timing
+        return response
+
+    def teardown(self, exc):
+        # Still set when the request failed without a response going through
+        # after_request, Flask answers those with a 500
+        timer = g.pop('request_timer', None)
+        if timer is None:
+            return
+        rule = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+        self.record(rule, request.method, request.path, 500, timer)
+
+    def record(self, rule, method, path, status, timer):
+        """Count a finished request, returns its Server-Timing header if enabled"""
+        seconds = time.perf_counter() - timer.started
+        self.observe(rule, method, status, seconds, timer)
+        if self.slow_seconds is not None and seconds >= self.slow_seconds:
+            logger.warning(
+                'Slow request %s %s took %.3fs, %d queries in %.3fs:\n%s',
+                method, path, seconds, timer.queries, timer.db_seconds,
+                '\n'.join('{:.3f}s {}'.format(query_seconds, statement)
+                          for statement, query_seconds in timer.statements))
+        if self.server_timing:
+            return 'app;dur={:.2f}, db;dur={:.2f};desc="{} queries"'.format(
+                1000 * seconds, 1000 * timer.db_seconds, timer.queries)
+        return None
+
+    def observe(self, rule, method, status, seconds, timer):
+        with self.lock:
+            route = self.routes.get((rule, method))
+            if route is None:
+                route = self.routes[(rule, method)] = {
+                    'status': Counter(),
+                    'count': 0,
+                    'seconds': 0.0,
+                    'db_seconds': 0.0,
+                    'queries': 0,
+                    'buckets': [0] * len(self.buckets),
+                }
+            route['status'][status] += 1
+            route['count'] += 1
+            route['seconds'] += seconds
+            route['db_seconds'] += timer.db_seconds
+            route['queries'] += timer.queries
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    route['buckets'][index] += 1
+                    break
+
+    def stats(self):
+        """Totals per (rule, method), with non-cumulative bucket counts"""
+        with self.lock:
+            return {key: dict(route, status=dict(route['status']), buckets=list(route['buckets']))
+                    for key, route in self.routes.items()}
+
+    def render(self, app):
+        routes = sorted(self.stats().items())
+        lines = []
+        _metric(lines, 'http_requests_total', 'counter', 'Requests handled', [
+            ((('route', rule), ('method', method), ('status', status)), count)
+            for (rule, method), route in routes
+            for status, count in sorted(route['status'].items())])
+        lines.append('# HELP http_request_duration_seconds Request wall time')
+        lines.append('# TYPE http_request_duration_seconds histogram')
+        for (rule, method), route in routes:
+            cumulative = 0
+            for bound, count in zip(self.buckets, route['buckets']):
+                cumulative += count
+                lines.append('http_request_duration_seconds_bucket{{{}}} {}'.format(
+                    _labels((('route', rule), ('method', method), ('le', bound))), cumulative))
+            labels = _labels((('route', rule), ('method', method)))
+            lines.append('http_request_duration_seconds_bucket{{{},le="+Inf"}} {}'.format(
+                labels, route['count']))
+            lines.append('http_request_duration_seconds_sum{{{}}} {}'.format(labels, route['seconds']))
+            lines.append('http_request_duration_seconds_count{{{}}} {}'.format(labels, route['count']))
+        _metric(lines, 'http_request_db_seconds_total', 'counter', 'Time spent in SQL statements', [
+            ((('route', rule), ('method', method)), route['db_seconds'])
+            for (rule, method), route in routes])
+        _metric(lines, 'http_request_queries_total', 'counter', 'SQL statements issued', [
+            ((('route', rule), ('method', method)), route['queries'])
+            for (rule, method), route in routes])
+
+        stats = {}
+        for extension, key, name, kind, description in EXTENSION_METRICS:
+            if extension not in stats:
+                stats[extension] = extension_stats(app, extension)
+            value = (stats[extension] or {}).get(key)
+            if value is not None:
+                _metric(lines, name, kind, description, [((), value)])
+        state = app.extensions.get('sqlalchemy')
+        pool = pool_stats(state.db.get_engine(app)) if state is not None else None
+        if pool is not None:
+            for key, name, kind, description in POOL_METRICS:
+                _metric(lines, name, kind, description, [((), pool[key])])
+        hasher = app.extensions.get('password_hasher')
+        if hasher is not None:
+            # Hashes hash_cost can't read are reported under cost="unknown", last
+            report = sorted(hasher.latency_report().items(),
+                            key=lambda item: (item[0] is None, item[0] or 0))
+            lines.append('# HELP password_check_seconds Password check latency by bcrypt cost')
+            lines.append('# TYPE password_check_seconds summary')
+            for cost, latency in report:
+                if cost is None:
+                    cost = 'unknown'
+                for quantile in ('0.5', '0.99'):
+                    lines.append('password_check_seconds{{{}}} {}'.format(
+                        _labels((('cost', cost), ('quantile', quantile))),
+                        latency['p50' if quantile == '0.5' else 'p99']))
+                labels = _labels((('cost', cost),))
+                lines.append('password_check_seconds_sum{{{}}} {}'.format(labels, latency['sum']))
+                lines.append('password_check_seconds_count{{{}}} {}'.format(labels, latency['count']))
+        return '\n'.join(lines) + '\n'
+
+    def metrics(self):
+        return Response(self.render(current_app), mimetype='text/plain; version=0.0.4')
@@ -1,11 +1,73 @@
 import datetime
 import jwt
+from contextlib import contextmanager
 from flask import current_app
 from app.app import db
+from app.cache import shoppinglists_scope, shoppinglist_scope, items_scope, item_scope
+from app.replicas import reading_from_primary, reading_from_replica
+from app.revocation import new_jti, token_key, unverified_claims
+from sqlalchemy import DDL, event
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import deferred
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
 
+def commit():
+    """Commit the session, leaving it usable if a constraint fails"""
+    with committing():
+        pass
+
+@contextmanager
+def committing():
+    """Commit the statements run in the block, or roll them back
+
+    Bulk statements raise IntegrityError when executed rather than at the
+    commit, which leaves the transaction aborted on PostgreSQL unless it is
+    rolled back here.
+    """
+    try:
+        yield
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        raise
+
+def invalidate(scope, variant=None):
+    """Drop the cached responses a committed write made stale"""
+    cache = current_app.extensions.get('response_cache')
+    if cache is not None:
+        cache.invalidate(scope, variant)
+
+def search_vector_column():
+    """Weighted tsvector of title and description, kept by a trigger
+
+    Only Postgres fills it, other databases search with LIKE. Deferred so
+    loading a model never reads it.
+    """
+    return deferred(db.Column(db.Text().with_variant(TSVECTOR(), 'postgresql')))
+
+def search_vector_ddl(table, title, description):
+    """Postgres trigger keeping table.search_vector current and its GIN index
+
+    Migration e8c4b2d07a93 runs the same statements on existing databases.
+    """
+    return [
+        'CREATE FUNCTION {0}_search_vector() RETURNS trigger AS $$ BEGIN '
+        "NEW.search_vector := setweight(to_tsvector('pg_catalog.english', coalesce(NEW.{1}, '')), 'A') || "
+        "setweight(to_tsvector('pg_catalog.english', coalesce(NEW.{2}, '')), 'B'); "
+        'RETURN NEW; END $$ LANGUAGE plpgsql'.format(table, title, description),
+        'CREATE TRIGGER {0}_search_vector BEFORE INSERT OR UPDATE OF {1}, {2} ON {0} '
+        'FOR EACH ROW EXECUTE PROCEDURE {0}_search_vector()'.format(table, title, description),
+        'CREATE INDEX ix_{0}_search_vector ON {0} USING gin (search_vector)'.format(table),
+    ]
+
+def listen_search_vector(model, title, description):
+    for statement in search_vector_ddl(model.__tablename__, title, description):
+        event.listen(model.__table__, 'after_create',
+            DDL(statement).execute_if(dialect='postgresql'))
+
 class Users(db.Model):
 
     __tablename__ = "users"
@@ -15,6 +77,8 @@ class Users(db.Model):
     email = db.Column(db.String, nullable=False, unique=True)
     password = db.Column(db.String, nullable=False)
     date_created = db.Column(db.DateTime, default=db.func.current_timestamp())
+    # Change counter of the user's lists and items, see next_version
+    version = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
 
     def __init__(self, username, email, password):
         """Initialize with username, email and password"""
@@ -24,14 +88,35 @@ class Users(db.Model):
 
     def save_user(self):
         db.session.add(self)
-        db.session.commit()
+        commit()
+
+    @staticmethod
+    def next_version(owner_id):
+        """Bump the owner's change counter and return the new value
+
+        The UPDATE locks the owner's row until the transaction ends, so the
+        owner's writes commit in version order and /sync never skips one.
+        """
+        db.session.query(Users).filter(Users.id == owner_id).update(
+            {Users.version: Users.version + 1}, synchronize_session=False)
+        return db.session.query(Users.version).filter(Users.id == owner_id).scalar() or 0
+
+    @staticmethod
+    def current_version(owner_id):
+        return db.session.query(Users.version).filter(Users.id == owner_id).scalar() or 0
+
+    @staticmethod
+    def version_subquery(owner_id):
+        """The owner's change counter as a column of another query"""
+        return db.select([Users.version]).where(Users.id == owner_id).as_scalar()
 
     def encode_token(self, user_id):
         """Generates the Auth Token"""
         payload = {
             'exp': datetime.datetime.utcnow() + datetime.timedelta(days=0, seconds=60),
             'iat': datetime.datetime.utcnow(),
-            'sub': user_id
+            'sub': user_id,
+            'jti': new_jti()
         }
         return jwt.encode(
             payload,
@@ -43,8 +128,9 @@ class Users(db.Model):
     def decode_token(user_id):
         """Validates the auth token"""
         try:
-            payload = jwt.decode(user_id, current_app.config.get('SECRET_KEY'))
-            is_created_token = UserToken.check_token(user_id)
+            payload = current_app.extensions['token_verifier'].decode(user_id)
+            is_created_token = UserToken.check_token(
+                token_key(user_id, payload), payload.get('exp'))
             if is_created_token:
                 return 'Token created. Please log in again.'
             else:
@@ -64,37 +150,89 @@ class UserToken(db.Model):
     __tablename__ = 'user_token'
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    token = db.Column(db.String(500), unique=True, nullable=False)
+    # jti claim, or a digest of the token for tokens issued without one
+    jti = db.Column(db.BigInteger, unique=True, nullable=False)
     created_on = db.Column(db.DateTime, nullable=False)
+    # UTC time of the token's exp claim, the row is useless after it
+    expires_at = db.Column(db.DateTime, index=True)
 
     def __init__(self, token):
-        self.token = token
+        claims = unverified_claims(token)
+        self.jti = token_key(token, claims)
         self.created_on = datetime.datetime.now()    
+        if isinstance(claims.get('exp'), int):
+            self.expires_at = datetime.datetime.utcfromtimestamp(claims['exp'])
 
     @staticmethod
-    def check_token(auth_token):
+    def check_token(jti, expires_at=None):
         # check whether auth token has been created
-        res = UserToken.query.filter_by(token=str(auth_token)).first()
-        if res:
-            return True
-        else:
-            return False
+        def lookup():
+            query = db.session.query(UserToken.id).filter_by(jti=jti)
+            with reading_from_replica():
+                if query.first():
+                    return True
+            # The replica may lag the revocations the sync read from the primary
+            with reading_from_primary():
+                return query.first() is not None
+        revoked_tokens = current_app.extensions['revoked_tokens']
+        # From the primary even in replica_reads handlers, a replica's lag
+        # would delay revocations by as much
+        with reading_from_primary():
+            revoked_tokens.sync(UserToken.revoked_since)
+        return revoked_tokens.is_revoked(jti, expires_at, lookup)
+
+    @staticmethod
+    def revoked_since(last_id):
+        """(id, jti) rows of unexpired tokens added after the given id"""
+        return db.session.query(UserToken.id, UserToken.jti).filter(
+            UserToken.id > last_id,
+            db.or_(UserToken.expires_at.is_(None),
+                   UserToken.expires_at > datetime.datetime.utcnow())
+        ).order_by(UserToken.id).yield_per(1000)
+
+    @staticmethod
+    def purge_expired(batch_size, before=None):
+        """Delete one batch of expired tokens and return how many went
+
+        Each batch is its own short transaction so the table is never
+        locked for long while a large backlog is cleared.
+        """
+        if before is None:
+            before = datetime.datetime.utcnow()
+        ids = [row.id for row in db.session.query(UserToken.id).filter(
+            UserToken.expires_at < before).order_by(UserToken.id).limit(batch_size)]
+        if ids:
+            UserToken.query.filter(UserToken.id.in_(ids)).delete(
+                synchronize_session=False)
+        db.session.commit()
+        return len(ids)
 
     def __repr__(self):
-        return '<token: {}'.format(self.token)
+        return '<token: {}'.format(self.jti)
 
 class ShoppingList(db.Model):
     """Model for Shopping Lists"""
     __tablename__ = 'shoppinglists'
+    __table_args__ = (
+        # Serves the owner's paginated listing, ordered by (date_created, id)
+        db.Index('ix_shoppinglists_owner_id_date_created', 'owner_id', 'date_created', 'id'),
+        # Titles are unique per owner, a check only reads the owner's range
+        db.Index('uq_shoppinglists_owner_id_title', 'owner_id', 'title', unique=True),
+        # Serves /sync, the owner's lists changed after a version
+        db.Index('ix_shoppinglists_owner_id_version', 'owner_id', 'version'),
+    )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     owner_id = db.Column(db.Integer, nullable=False)
-    title = db.Column(db.String(255), nullable=False, unique=True)
+    title = db.Column(db.String(255), nullable=False)
     description = db.Column(db.String(500), nullable=False)
     date_created = db.Column(db.DateTime, default=db.func.current_timestamp())
     date_modified = db.Column(
         db.DateTime, default=db.func.current_timestamp(),
         onupdate=db.func.current_timestamp())
+    # Owner's change counter at the last write
+    version = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    search_vector = search_vector_column()
 
     def __init__(self, owner_id, title, description):
         self.owner_id = owner_id
@@ -102,12 +240,64 @@ class ShoppingList(db.Model):
         self.description = description
 
     def save_shoppinglist(self):
+        self.version = Users.next_version(self.owner_id)
         db.session.add(self)
-        db.session.commit()
+        commit()
+        invalidate(shoppinglists_scope(self.owner_id))
+        invalidate(shoppinglist_scope(self.id))
+
+    @staticmethod
+    def update_shoppinglist(owner_id, shoppinglist_id, title, description):
+        """Rename the owner's list with one UPDATE, returns the row count
+
+        Raises IntegrityError if the title is taken. A list keeping its own
+        title is not updated either, the title counts as taken.
+        """
+        with committing():
+            version = Users.next_version(owner_id)
+            updated = ShoppingList.query.filter(
+                ShoppingList.owner_id == owner_id,
+                ShoppingList.id == shoppinglist_id,
+                ShoppingList.title != title
+            ).update({'title': title, 'description': description, 'version': version},
+                     synchronize_session=False)
+        if updated:
+            invalidate(shoppinglists_scope(owner_id))
+            invalidate(shoppinglist_scope(shoppinglist_id))
+        return updated
+
+    @staticmethod
+    def collection_state(owner_id):
+        """(count, last modified, last id, owner version) of the owner's lists
+
+        In one query. The owner's version moves on every write, the other
+        values miss edits to older rows and edits within the same second.
+        """
+        return db.session.query(
+            db.func.count(ShoppingList.id),
+            db.func.max(ShoppingList.date_modified),
+            db.func.max(ShoppingList.id),
+            Users.version_subquery(owner_id)
+        ).filter(ShoppingList.owner_id == owner_id).one()
+
+    @staticmethod
+    def changed_since(owner_id, since, until):
+        """The owner's lists written at a version in (since, until]"""
+        return ShoppingList.query.filter(
+            ShoppingList.owner_id == owner_id,
+            ShoppingList.version > since,
+            ShoppingList.version <= until
+        ).order_by(ShoppingList.version, ShoppingList.id)
 
     def delete_shoppinglist(self):
+        db.session.add(Tombstone(
+            owner_id=self.owner_id, version=Users.next_version(self.owner_id),
+            kind='shoppinglist', object_id=self.id))
+        scopes = [shoppinglists_scope(self.owner_id), shoppinglist_scope(self.id)]
         db.session.delete(self)
         db.session.commit()
+        for scope in scopes:
+            invalidate(scope)
 
     def __repr__(self):
         return '<title {}'.format(self.title)
@@ -115,16 +305,27 @@ class ShoppingList(db.Model):
 class ShoppingListItem(db.Model):
     """Model for Shopping Lists"""
     __tablename__ = 'shoppinglistitems'
+    __table_args__ = (
+        # Serves the items of one list for its owner, ordered by item_id
+        db.Index('ix_shoppinglistitems_shoppinglist_id_owner_id', 'shoppinglist_id', 'owner_id', 'item_id'),
+        # Item titles are unique per list, a check only reads the list's range
+        db.Index('uq_shoppinglistitems_shoppinglist_id_item_title', 'shoppinglist_id', 'item_title', unique=True),
+        # Serves /sync, the owner's items changed after a version
+        db.Index('ix_shoppinglistitems_owner_id_version', 'owner_id', 'version'),
+    )
 
     item_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     owner_id = db.Column(db.Integer, nullable=False)
     shoppinglist_id = db.Column(db.Integer, nullable=False)
-    item_title = db.Column(db.String(255), nullable=False, unique=True)
+    item_title = db.Column(db.String(255), nullable=False)
     item_description = db.Column(db.String(500), nullable=False)
     date_created = db.Column(db.DateTime, default=db.func.current_timestamp())
     date_modified = db.Column(
         db.DateTime, default=db.func.current_timestamp(),
         onupdate=db.func.current_timestamp())
+    # Owner's change counter at the last write
+    version = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    search_vector = search_vector_column()
 
     def __init__(self, owner_id, shoppinglist_id, item_title, item_description):
         self.owner_id = owner_id
@@ -133,12 +334,182 @@ class ShoppingListItem(db.Model):
         self.item_description = item_description
 
     def save_shoppinglistitem(self):
+        self.version = Users.next_version(self.owner_id)
         db.session.add(self)
-        db.session.commit()
+        commit()
+        invalidate(items_scope(self.owner_id, self.shoppinglist_id))
+        invalidate(item_scope(self.shoppinglist_id), str(self.item_id))
+
+    @staticmethod
+    def save_shoppinglistitems(owner_id, shoppinglist_id, items):
+        """Insert (item_title, item_description) pairs in one statement
+
+        Returns the new item_id of each title.
+        """
+        if not items:
+            return {}
+        with committing():
+            version = Users.next_version(owner_id)
+            db.session.execute(ShoppingListItem.__table__.insert().values([{
+                'owner_id': owner_id,
+                'shoppinglist_id': shoppinglist_id,
+                'item_title': item_title,
+                'item_description': item_description,
+                'version': version
+            } for item_title, item_description in items]))
+            titles = [item_title for item_title, _ in items]
+            item_ids = dict(db.session.query(
+                ShoppingListItem.item_title, ShoppingListItem.item_id).filter(
+                ShoppingListItem.shoppinglist_id == shoppinglist_id,
+                ShoppingListItem.owner_id == owner_id,
+                ShoppingListItem.item_title.in_(titles)))
+        invalidate(items_scope(owner_id, shoppinglist_id))
+        return item_ids
+
+    @staticmethod
+    def update_shoppinglistitem(owner_id, shoppinglist_id, item_id, item_title, item_description):
+        """Rename the owner's item with one UPDATE, returns the row count
+
+        Raises IntegrityError if the title is taken. An item keeping its own
+        title is not updated either, the title counts as taken.
+        """
+        with committing():
+            version = Users.next_version(owner_id)
+            updated = ShoppingListItem.query.filter(
+                ShoppingListItem.owner_id == owner_id,
+                ShoppingListItem.shoppinglist_id == shoppinglist_id,
+                ShoppingListItem.item_id == item_id,
+                ShoppingListItem.item_title != item_title
+            ).update({'item_title': item_title, 'item_description': item_description,
+                      'version': version},
+                     synchronize_session=False)
+        if updated:
+            invalidate(items_scope(owner_id, shoppinglist_id))
+            invalidate(item_scope(shoppinglist_id), str(item_id))
+        return updated
+
+    @staticmethod
+    def collection_state(owner_id, shoppinglist_id):
+        """(count, last modified, last id, owner version) of a list's items
+
+        In one query, see ShoppingList.collection_state.
+        """
+        return db.session.query(
+            db.func.count(ShoppingListItem.item_id),
+            db.func.max(ShoppingListItem.date_modified),
+            db.func.max(ShoppingListItem.item_id),
+            Users.version_subquery(owner_id)
+        ).filter(
+            ShoppingListItem.shoppinglist_id == shoppinglist_id,
+            ShoppingListItem.owner_id == owner_id).one()
+
+    @staticmethod
+    def changed_since(owner_id, since, until):
+        """The owner's items written at a version in (since, until]"""
+        return ShoppingListItem.query.filter(
+            ShoppingListItem.owner_id == owner_id,
+            ShoppingListItem.version > since,
+            ShoppingListItem.version <= until
+        ).order_by(ShoppingListItem.version, ShoppingListItem.item_id)
 
     def delete_shoppinglistitem(self):
+        db.session.add(Tombstone(
+            owner_id=self.owner_id, version=Users.next_version(self.owner_id),
+            kind='shoppinglistitem', object_id=self.item_id,
+            shoppinglist_id=self.shoppinglist_id))
+        scopes = [(items_scope(self.owner_id, self.shoppinglist_id), None),
+                  (item_scope(self.shoppinglist_id), str(self.item_id))]
         db.session.delete(self)
         db.session.commit()
+        for scope, variant in scopes:
+            invalidate(scope, variant)
+
+    @staticmethod
+    def select_shoppinglistitems(owner_id, shoppinglist_id, item_ids=None, item_title=None):
+        """Query for the owner's items on a list picked by id or title"""
+        query = ShoppingListItem.query.filter_by(
+            shoppinglist_id=shoppinglist_id, owner_id=owner_id)
+        if item_ids is not None:
+            query = query.filter(ShoppingListItem.item_id.in_(item_ids))
+        if item_title:
+            pattern = item_title.replace('\\', '\\\\').replace('%', r'\%').replace('_', r'\_')
+            query = query.filter(ShoppingListItem.item_title.ilike(
+                '%{}%'.format(pattern), escape='\\'))
+        return query
+
+    @staticmethod
+    def update_shoppinglistitems(owner_id, shoppinglist_id, values, **selection):
+        """Update the picked items with one UPDATE, returns the row count"""
+        if selection.get('item_ids') == []:
+            return 0
+        values = dict(values, version=Users.next_version(owner_id))
+        updated = ShoppingListItem.select_shoppinglistitems(
+            owner_id, shoppinglist_id, **selection).update(
+            values, synchronize_session=False)
+        db.session.commit()
+        if updated:
+            invalidate(items_scope(owner_id, shoppinglist_id))
+            invalidate(item_scope(shoppinglist_id))
+        return updated
+
+    @staticmethod
+    def delete_shoppinglistitems(owner_id, shoppinglist_id, **selection):
+        """Delete the picked items with one DELETE, returns the row count"""
+        if selection.get('item_ids') == []:
+            return 0
+        version = Users.next_version(owner_id)
+        selected = ShoppingListItem.select_shoppinglistitems(
+            owner_id, shoppinglist_id, **selection)
+        # Tombstones are copied from the rows about to go, in one statement
+        db.session.execute(Tombstone.__table__.insert().from_select(
+            ['owner_id', 'version', 'kind', 'object_id', 'shoppinglist_id'],
+            selected.with_entities(
+                ShoppingListItem.owner_id, db.literal(version, db.BigInteger),
+                db.literal('shoppinglistitem'), ShoppingListItem.item_id,
+                ShoppingListItem.shoppinglist_id).statement))
+        deleted = selected.delete(synchronize_session=False)
+        db.session.commit()
+        if deleted:
+            invalidate(items_scope(owner_id, shoppinglist_id))
+            invalidate(item_scope(shoppinglist_id))
+        return deleted
+
+    def __repr__(self):
+        return '<item_title {}'.format(self.item_title)
+
+listen_search_vector(ShoppingList, 'title', 'description')
+listen_search_vector(ShoppingListItem, 'item_title', 'item_description')
+
+class Tombstone(db.Model):
+    """Deleted list or item, kept so /sync can report the deletion"""
+    __tablename__ = 'tombstones'
+    __table_args__ = (
+        db.Index('ix_tombstones_owner_id_version', 'owner_id', 'version'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    owner_id = db.Column(db.Integer, nullable=False)
+    version = db.Column(db.BigInteger, nullable=False)
+    # 'shoppinglist' or 'shoppinglistitem'
+    kind = db.Column(db.String(20), nullable=False)
+    object_id = db.Column(db.Integer, nullable=False)
+    shoppinglist_id = db.Column(db.Integer)
+
+    def __init__(self, owner_id, version, kind, object_id, shoppinglist_id=None):
+        self.owner_id = owner_id
+        self.version = version
+        self.kind = kind
+        self.object_id = object_id
+        self.shoppinglist_id = shoppinglist_id
+
+    @staticmethod
+    def changed_since(owner_id, since, until):
+        """The owner's deletions at a version in (since, until]"""
+        return Tombstone.query.filter(
+            Tombstone.owner_id == owner_id,
+            Tombstone.version > since,
+            Tombstone.version <= until
+        ).order_by(Tombstone.version, Tombstone.id)
 
     def __repr__(self):
-        return '<item_title {}'.format(self.item_title)
\ No newline at end of file
+        return '<tombstone {} {}'.format(self.kind, self.object_id)
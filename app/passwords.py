@@ -0,0 +1,151 @@
+"""Password hashing policy, run off the request threads"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+
+logger = logging.getLogger(__name__)
+
+
+class HasherBusy(Exception):
+    """Raised when too many hashes are already waiting for the pool"""
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(
+        password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(pw_hash, password):
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), pw_hash.encode('utf-8'))
+    except ValueError:
+        return False
+
+
+def hash_cost(pw_hash):
+    """Log rounds a bcrypt hash was made with, like 12 for $2b$12$..."""
+    parts = str(pw_hash).split('$')
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[int(round(fraction * (len(ordered) - 1)))]
+
+
+class PasswordHasher(object):
+    """Runs bcrypt in a bounded process pool
+
+    HASH_POOL_WORKERS processes do the hashing, None means one per core and
+    0 hashes on the calling thread. At most HASH_POOL_MAX_PENDING hashes may
+    be queued or running at once, beyond that HasherBusy is raised at once
+    instead of tying up another request thread.
+
+    New hashes use BCRYPT_LOG_ROUNDS. Hashes made with another cost are
+    replaced on the next successful login, and the time taken to check a
+    password is kept per cost so BCRYPT_LOG_ROUNDS can be tuned against
+    login latency.
+    """
+
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        self.pool = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        workers = app.config.get('HASH_POOL_WORKERS')
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.slots = threading.BoundedSemaphore(app.config.get('HASH_POOL_MAX_PENDING'))
+        self.rounds = app.config.get('BCRYPT_LOG_ROUNDS')
+        self.latency_samples = app.config.get('HASH_LATENCY_SAMPLES')
+        self.latencies = {}
+        app.extensions['password_hasher'] = self
+
+    def get_pool(self):
+        with self.lock:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self.pool
+
+    def run(self, func, *args):
+        if not self.workers:
+            return func(*args)
+        if not self.slots.acquire(False):
+            raise HasherBusy('Server is busy, please try again.')
+        try:
+            return self.get_pool().submit(func, *args).result()
+        except BrokenProcessPool:
+            # A worker died, start a fresh pool for the next call
+            with self.lock:
+                self.pool = None
+            raise HasherBusy('Server is busy, please try again.')
+        finally:
+            self.slots.release()
+
+    def generate_password_hash(self, password, rounds=None):
+        if not password:
+            raise ValueError('Password must be non-empty.')
+        return self.run(_hash, password, rounds or self.rounds)
+
+    def check_password_hash(self, pw_hash, password):
+        if not password:
+            return False
+        started = time.time()
+        valid = self.run(_check, pw_hash, password)
+        self.record_latency(hash_cost(pw_hash), time.time() - started)
+        return valid
+
+    def needs_rehash(self, pw_hash):
+        return hash_cost(pw_hash) != self.rounds
+
+    def rehash(self, pw_hash, password):
+        """New hash for a just verified password if the policy changed, else None"""
+        if not self.needs_rehash(pw_hash):
+            return None
+        try:
+            new_hash = self.generate_password_hash(password)
+        except HasherBusy:
+            # Not worth failing a login over, it is retried on the next one
+            return None
+        logger.info('Rehashing password from cost %s to %s',
+                    hash_cost(pw_hash), self.rounds)
+        return new_hash
+
+    def record_latency(self, cost, seconds):
+        with self.lock:
+            if cost not in self.latencies:
+                self.latencies[cost] = {
+                    'count': 0, 'seconds': 0.0, 'samples': deque(maxlen=self.latency_samples)}
+            self.latencies[cost]['count'] += 1
+            self.latencies[cost]['seconds'] += seconds
+            self.latencies[cost]['samples'].append(seconds)
+
+    def latency_report(self):
+        """Password check latency in seconds for each stored hash cost"""
+        with self.lock:
+            report = {}
+            for cost, latency in self.latencies.items():
+                samples = list(latency['samples'])
+                report[cost] = {
+                    'count': latency['count'],
+                    'sum': latency['seconds'],
+                    'p50': percentile(samples, 0.5),
+                    'p99': percentile(samples, 0.99),
+                    'max': max(samples),
+                }
+            return report
+
+    def shutdown(self):
+        with self.lock:
+            if self.pool is not None:
+                self.pool.shutdown()
+                self.pool = None
@@ -0,0 +1,120 @@
+"""Connection pool settings per environment and checkout metrics"""
+import threading
+import time
+from collections import deque
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+# Checkout waits kept for the wait percentiles
+WAIT_SAMPLES = 1000
+
+
+def percentile(ordered, fraction):
+    return ordered[int(round(fraction * (len(ordered) - 1)))]
+
+
+def ping(dbapi_connection, connection_record, connection_proxy):
+    """Test a connection as it leaves the pool
+
+    Raising DisconnectionError makes the pool drop the connection and
+    check out a fresh one, so a database restart or an idle timeout on
+    the server side doesn't fail the request that meets it.
+    """
+    try:
+        cursor = dbapi_connection.cursor()
+        cursor.execute('SELECT 1')
+        cursor.close()
+    except Exception:
+        raise exc.DisconnectionError()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool recording how long checkouts wait and how many time out
+
+    With pre_ping every checkout is tested first, see ping.
+    """
+
+    def __init__(self, creator, pre_ping=False, **kw):
+        super(InstrumentedQueuePool, self).__init__(creator, **kw)
+        self.pre_ping = pre_ping
+        self.stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.waits = deque(maxlen=WAIT_SAMPLES)
+        # recreate() passes the listeners on through the dispatch, not pre_ping
+        if pre_ping:
+            event.listen(self, 'checkout', ping)
+
+    def recreate(self):
+        pool = super(InstrumentedQueuePool, self).recreate()
+        pool.pre_ping = self.pre_ping
+        return pool
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super(InstrumentedQueuePool, self)._do_get()
+        except exc.TimeoutError:
+            with self.stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with self.stats_lock:
+                self.checkouts += 1
+                self.wait_seconds += waited
+                self.waits.append(waited)
+
+    def stats(self):
+        with self.stats_lock:
+            waits = sorted(self.waits)
+            stats = {
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_seconds': self.wait_seconds,
+                'wait_p50': percentile(waits, 0.5) if waits else 0.0,
+                'wait_p99': percentile(waits, 0.99) if waits else 0.0,
+                'wait_max': waits[-1] if waits else 0.0,
+            }
+        stats.update({
+            'pool_size': self.size(),
+            'max_overflow': self._max_overflow,
+            'checked_out': self.checkedout(),
+            'checked_in': self.checkedin(),
+            'overflow': max(self.overflow(), 0),
+        })
+        return stats
+
+
+class PooledSQLAlchemy(SQLAlchemy):
+    """SQLAlchemy whose engines check out through InstrumentedQueuePool
+
+    SQLALCHEMY_POOL_SIZE, SQLALCHEMY_MAX_OVERFLOW, SQLALCHEMY_POOL_TIMEOUT
+    and SQLALCHEMY_POOL_RECYCLE are applied by Flask-SQLAlchemy, and
+    SQLALCHEMY_POOL_PRE_PING here. A SQLite file only gets a pool when
+    SQLALCHEMY_POOL_SIZE is set, otherwise it keeps NullPool, and an
+    in-memory SQLite database keeps its single connection.
+    """
+
+    def apply_driver_hacks(self, app, info, options):
+        super(PooledSQLAlchemy, self).apply_driver_hacks(app, info, options)
+        if 'poolclass' in options:
+            # NullPool and StaticPool take none of the queue settings
+            for key in ('pool_size', 'max_overflow', 'pool_timeout'):
+                options.pop(key, None)
+            return
+        if info.drivername.startswith('sqlite'):
+            # Pooled SQLite connections are handed between request threads
+            options.setdefault('connect_args', {})['check_same_thread'] = False
+        options['poolclass'] = InstrumentedQueuePool
+        options['pre_ping'] = bool(app.config.get('SQLALCHEMY_POOL_PRE_PING'))
+
+
+def pool_stats(engine):
+    """Stats of an engine's pool, None when it isn't instrumented"""
+    if isinstance(engine.pool, InstrumentedQueuePool):
+        return engine.pool.stats()
+    return None
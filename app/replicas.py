@@ -0,0 +1,122 @@
+"""Routes the reads of read-only handlers to replica databases"""
+import contextlib
+import itertools
+import threading
+from functools import wraps
+
+from flask import current_app, g, has_app_context
+from flask_sqlalchemy import SignallingSession, get_state
+from sqlalchemy import orm
+from sqlalchemy.sql.expression import UpdateBase
+
+from app.pool import PooledSQLAlchemy
+
+
+class ReplicaRouter(object):
+    """Picks the engine a read-only handler's statements run on
+
+    SQLALCHEMY_REPLICA_URIS are registered as the binds replica_0,
+    replica_1 and so on, with the pool settings of the primary. A request
+    reads from one replica, taken in turn, while it is in replica mode,
+    see replica_reads. It goes back to the primary for good as soon as it
+    flushes or runs an INSERT, UPDATE or DELETE, so whatever it wrote is
+    read back from the primary.
+
+    Replicas lag the primary, a read that must see the latest writes of
+    other requests should not use them.
+    """
+
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        uris = app.config.get('SQLALCHEMY_REPLICA_URIS') or []
+        self.binds = ['replica_{}'.format(index) for index in range(len(uris))]
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        binds.update(zip(self.binds, uris))
+        app.config['SQLALCHEMY_BINDS'] = binds or None
+        self.turns = itertools.cycle(self.binds)
+        if 'replica_router' not in app.extensions:
+            app.before_request(self.reset)
+        app.extensions['replica_router'] = self
+
+    def reset(self):
+        g.replica_reads = False
+        g.primary_pinned = False
+        g.replica_bind = None
+
+    def engine_for(self, session, clause=None):
+        """Replica engine for a statement, None when it belongs on the primary"""
+        if not self.binds or not has_app_context():
+            return None
+        if session._flushing or isinstance(clause, UpdateBase):
+            g.primary_pinned = True
+            return None
+        if not g.get('replica_reads') or g.get('primary_pinned'):
+            return None
+        bind = g.get('replica_bind')
+        if bind is None:
+            with self.lock:
+                bind = g.replica_bind = next(self.turns)
+        return get_state(session.app).db.get_engine(session.app, bind=bind)
+
+    def used_replica(self):
+        """Whether the current request has read from a replica"""
+        return bool(self.binds) and g.get('replica_bind') is not None
+
+
+class RoutingSession(SignallingSession):
+    """Session asking the app's ReplicaRouter for an engine first"""
+
+    def get_bind(self, mapper=None, clause=None):
+        router = self.app.extensions.get('replica_router')
+        if router is not None:
+            engine = router.engine_for(self, clause)
+            if engine is not None:
+                return engine
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(PooledSQLAlchemy):
+    """PooledSQLAlchemy whose sessions route reads to replicas"""
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+@contextlib.contextmanager
+def reading_from_replica():
+    """Run the block's reads on a replica, then restore the request's mode"""
+    previous = g.get('replica_reads', False)
+    g.replica_reads = True
+    try:
+        yield
+    finally:
+        g.replica_reads = previous
+
+
+@contextlib.contextmanager
+def reading_from_primary():
+    """Run the block's reads on the primary, even in a replica_reads handler"""
+    previous = g.get('replica_reads', False)
+    g.replica_reads = False
+    try:
+        yield
+    finally:
+        g.replica_reads = previous
+
+
+def replica_reads(f):
+    """Put the rest of the request in replica mode, a streamed body included"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        g.replica_reads = True
+        return f(*args, **kwargs)
+    return decorated
+
+
+def used_replica():
+    router = current_app.extensions.get('replica_router')
+    return router is not None and router.used_replica()
@@ -0,0 +1,856 @@
+"""Resources served by the API, registered on the app by create_app"""
+import datetime
+from flask import current_app, request, make_response
+from flask_restful import reqparse, Resource
+from sqlalchemy.exc import IntegrityError
+
+from app.app import db
+from app.cache import shoppinglists_scope, shoppinglist_scope, items_scope, item_scope
+from app.models import Users, ShoppingList, ShoppingListItem, UserToken, Tombstone
+from app.helpers import middleware, is_valid, is_unique_violation, page_limit, encode_cursor, decode_cursor, item_selection, make_etag, validator_headers, not_modified, sync_version, replay_response, wants_stream
+from app.passwords import HasherBusy
+from app.revocation import unverified_claims
+from app.replicas import replica_reads, used_replica
+from app.search import search
+from app.serializers import (
+	json_response, stream_response, JSONArray, JSONObject, user_serializer, shoppinglist_serializer, shoppinglist_detail_serializer,
+	shoppinglistitem_serializer, shoppinglistitem_detail_serializer, search_result_serializer)
+
+
+def make_parser(*args):
+	"""Request parser for a fixed set of arguments, built once at import"""
+	parser = reqparse.RequestParser()
+	for arg in args:
+		parser.add_argument(arg)
+	return parser
+
+register_parser = make_parser('username', 'email', 'password', 'confirm_password')
+login_parser = make_parser('email', 'password')
+shoppinglist_parser = make_parser('title', 'description')
+shoppinglistitem_parser = make_parser('item_title', 'item_description')
+
+def cache_response(scope, variant, version, response, etag, last_modified):
+	"""Keep a serialized response for the next reads of its scope
+
+	Not when it was read from a replica, which may not have the write that
+	last invalidated the scope yet.
+	"""
+	if used_replica():
+		return
+	current_app.extensions['response_cache'].set(
+		scope, variant, version, response.get_data(), response.status_code,
+		etag, last_modified)
+
+class Home(Resource):
+	def get(self):
+		response = {'message': "Welcome to Shopping List API"}
+		return response, 200
+
+
+class Register(Resource):
+	"""Register a user account"""
+
+	def post(self):
+		hasher = current_app.extensions['password_hasher']
+		# Get data posted
+		args = register_parser.parse_args()
+		if args['password'] != args['confirm_password']:
+			response = {
+				'status': 'fail',
+				'message': 'Password does not match'
+			}
+			return response, 202
+		# Encrypt password
+
+		try:
+			password = hasher.generate_password_hash(args['password'])
+		except HasherBusy as err:
+			response = {
+				'status': 'fail',
+				'message': str(err)
+			}
+			return response, 503
+		except ValueError as err:
+			response = json_response({
+				'status': 'fail',
+				'message': str(err)
+			})
+			response.status_code = 500
+			return response
+
+		email = args['email']
+		username = args['username']
+		if email and username:
+			user = Users(username=username, email=email, password=password)
+			try:
+				# The unique email constraint tells whether the account exists
+				user.save_user()
+			except IntegrityError as err:
+				if not is_unique_violation(err):
+					raise
+			else:
+				# Return Response
+				response = json_response(dict(
+					user_serializer.one(user),
+					message='User account created successfuly'))
+				response.status_code = 200
+				return response
+			response = json_response({
+                'status': 'fail',
+                'message': 'User account already exists.',
+            })
+			response.status_code = 202
+			return response
+		response = json_response({
+                'status': 'fail',
+                'message': 'Email or Username can\'t be empty.',
+            })
+		response.status_code = 500
+		return response
+
+class Login(Resource):
+
+	def post(self):
+		hasher = current_app.extensions['password_hasher']
+		args = login_parser.parse_args()
+		email = args['email']
+		password = args['password']
+		user = Users.query.filter_by(email=email).first()
+		try:
+			valid_password = user is not None and hasher.check_password_hash(
+				user.password, password)
+		except HasherBusy as err:
+			response = {
+				'status': 'fail',
+				'message': str(err)
+			}
+			return response, 503
+		if valid_password:
+			new_hash = hasher.rehash(user.password, password)
+			if new_hash is not None:
+				user.password = new_hash
+				user.save_user()
+			token = user.encode_token(user.id)
+			response = {
+				'id': user.id,
+                    'message': 'Successfully logged in.',
+                    'token': token.decode()
+                }
+			return response, 200
+		response = {
+			'status': "fail",
+			'message': 'Invalid credentials'
+		}
+		return response, 202
+
+class Logout(Resource):
+
+	def post(self):
+		auth_header = request.headers.get('Authorization')
+		if auth_header:
+			access_token = auth_header.split(" ")[1]
+			user_id = Users.decode_token(access_token)
+			if not isinstance(user_id, int):
+				response = {
+					'status': 'fail',
+					'message': user_id
+				}
+				return response, 403
+			else:
+				save_used_token = UserToken(token=access_token)
+				# insert the token
+				db.session.add(save_used_token)
+				db.session.commit()
+				current_app.extensions['revoked_tokens'].revoke(
+					save_used_token.jti, unverified_claims(access_token).get('exp'))
+				responseObject = {
+					'status': 'success',
+					'message': 'Successfully logged out.'
+				}
+				return json_response(responseObject)
+		response = {
+			'status': 'fail',
+			'message': 'Authorization is not provided'
+		}
+		return response, 500
+	
+class ShoppingListAPI(Resource):
+
+	@replica_reads
+	def get(self):
+		user_id = middleware()					
+		if isinstance(user_id, int):
+			try:
+				limit = page_limit(
+					request.args.get('limit'),
+					current_app.config.get('PAGE_SIZE'),
+					current_app.config.get('MAX_PAGE_SIZE'))
+				cursor = request.args.get('cursor')
+				if cursor:
+					cursor = decode_cursor(cursor, datetime.datetime, int)
+			except ValueError as err:
+				response = {
+					'status': 'fail',
+					'message': str(err)
+				}
+				return response, 202
+			stream = wants_stream()
+			cache = current_app.extensions['response_cache']
+			scope = shoppinglists_scope(user_id)
+			variant = '{}:{}'.format(limit, request.args.get('cursor') or '')
+			if not stream:
+				cached = cache.get(scope, variant)
+				if cached is not None:
+					return replay_response(cached)
+			version = cache.version(scope)
+			# Answer polls from one aggregate query while nothing has changed
+			count, last_modified, last_id, owner_version = ShoppingList.collection_state(owner_id=user_id)
+			etag = make_etag(user_id, count, last_modified, last_id, owner_version, limit, request.args.get('cursor'), stream)
+			headers = validator_headers(etag, last_modified)
+			unchanged = not_modified(etag, last_modified)
+			if unchanged is not None:
+				return unchanged
+			# Select only the serialized columns, rows skip ORM instance state
+			shoppinglists = db.session.query(
+				*shoppinglist_serializer.columns(ShoppingList)).filter(
+				ShoppingList.owner_id == user_id)
+			if cursor:
+				# Compare against the stored timestamp of the last row seen so
+				# ties on date_created are broken by id on every dialect
+				created, last_id = cursor
+				anchor = db.session.query(ShoppingList.date_created).filter(
+					ShoppingList.id == last_id).as_scalar()
+				anchor = db.func.coalesce(anchor, created)
+				shoppinglists = shoppinglists.filter(db.or_(
+					ShoppingList.date_created > anchor,
+					db.and_(ShoppingList.date_created == anchor, ShoppingList.id > last_id)
+				))
+			shoppinglists = shoppinglists.order_by(ShoppingList.date_created, ShoppingList.id)
+			if stream and count:
+				# Everything after the cursor, written while the rows are read
+				return stream_response(JSONObject(
+					('shoppinglists', JSONArray(
+						shoppinglists.yield_per(current_app.config.get('STREAM_CHUNK_SIZE')),
+						shoppinglist_serializer)),
+					('next_cursor', None)), 202, headers)
+			shoppinglists = shoppinglists.limit(limit + 1).all()
+			results = shoppinglist_serializer.rows(shoppinglists[:limit])
+			if len(results) == 0:
+				response = {
+					'message': "You don't have any shoppinglists for now."
+				}
+				return response, 200, headers
+			next_cursor = None
+			if len(shoppinglists) > limit:
+				last = shoppinglists[limit - 1]
+				next_cursor = encode_cursor(last.date_created, last.id)
+			response = json_response({
+				'shoppinglists': results,
+				'next_cursor': next_cursor
+			})
+			response.status_code = 202
+			response.headers.extend(headers)
+			cache_response(scope, variant, version, response, etag, last_modified)
+			return response
+		else:
+			return user_id
+	def post(self):
+		user_id = middleware()					
+		if isinstance(user_id, int):
+			args = shoppinglist_parser.parse_args()
+			title = args['title']
+			description = args['description']
+			valid_title = is_valid(value=title, min_length=10, _type="text")
+			valid_description = is_valid(value=description, min_length=10, _type="text")
+			if valid_title is True and valid_description:
+				shoppinglist = ShoppingList(title=title, description=description, owner_id=user_id)
+				try:
+					shoppinglist.save_shoppinglist()
+				except IntegrityError as err:
+					if not is_unique_violation(err):
+						raise
+				else:
+					# Return Response
+					response = dict(
+						shoppinglist_detail_serializer.one(shoppinglist),
+						message='Shopping List created successfuly')
+					return response, 201
+				response = {
+					'message': 'Shopping List {} already exists'.format(title)
+				}
+				return response, 202
+			response = {
+				'message': valid_title
+			}
+			return response, 202
+		else:
+			return user_id
+
+
+class SingleShoppingListAPI(Resource):	
+
+	@replica_reads
+	def get(self, shoppinglist_id):
+		user_id = middleware()
+		if isinstance(user_id, int):
+			cache = current_app.extensions['response_cache']
+			scope = shoppinglist_scope(shoppinglist_id)
+			cached = cache.get(scope)
+			if cached is not None:
+				return replay_response(cached)
+			version = cache.version(scope)
+			shoppinglist = ShoppingList.query.filter_by(id=shoppinglist_id).first()
+			if shoppinglist:
+				etag = make_etag(
+					shoppinglist.id, shoppinglist.owner_id, shoppinglist.title,
+					shoppinglist.description, shoppinglist.date_modified)
+				unchanged = not_modified(etag, shoppinglist.date_modified)
+				if unchanged is not None:
+					return unchanged
+				response = json_response(dict(
+					shoppinglist_detail_serializer.one(shoppinglist),
+					status='success'))
+				response.status_code = 201
+				response.headers.extend(validator_headers(etag, shoppinglist.date_modified))
+				cache_response(scope, '', version, response, etag, shoppinglist.date_modified)
+				return response
+			response = {
+				'message': 'Requested value \'{}\' was not found'.format(shoppinglist_id)
+			}
+			return response, 202
+		else:
+			return user_id
+
+	def put(self, shoppinglist_id):
+		user_id = middleware()
+		if isinstance(user_id, int):
+			args = shoppinglist_parser.parse_args()
+			title = args['title']
+			description = args['description']
+			valid_title = is_valid(value=title, min_length=10, _type="text")
+			valid_description = is_valid(value=description, min_length=10, _type="text")			
+			if valid_title is True and valid_description is True:
+				try:
+					updated = ShoppingList.update_shoppinglist(
+						owner_id=user_id, shoppinglist_id=shoppinglist_id,
+						title=title, description=description)
+				except IntegrityError as err:
+					if not is_unique_violation(err):
+						raise
+					updated = None
+				if updated:
+					# Return Response
+					response = {
+						'id': shoppinglist_id,
+						'owner': user_id,
+						'title': title,
+						'description': description,
+						'message': 'Shopping List updated successfuly',
+						'status': 'success'
+					}
+					return response, 200
+				# Nothing matched, either the list is missing or keeps its title
+				if updated == 0 and ShoppingList.query.filter_by(owner_id=user_id, title=title).first() is None:
+					response = {
+						'status': "fail",
+						'message': 'Requested value \'{}\' was not found'.format(shoppinglist_id)
+					}
+					return response, 202
+				response = {
+					'status': "fail",
+					'message': 'Shopping List {} already exists'.format(title)
+				}
+				return response, 202					
+			else:
+				if valid_title is True:
+					message = valid_description
+				elif valid_description is True:
+					message = valid_title
+				else:
+					message = [valid_title, valid_description]
+				response = {
+					'message': message,
+					'status': 'fail'						
+				}
+				return response, 202
+		else:
+			return user_id
+
+	def delete(self, shoppinglist_id):
+		user_id = middleware()
+		if isinstance(user_id, int):
+			shoppinglist = ShoppingList.query.filter_by(id=shoppinglist_id).first()
+			if shoppinglist:
+				shoppinglist.delete_shoppinglist()
+				response = {
+					'status': 'success',
+					'message': 'Shopping List \'{}\' deleted successfuly'.format(shoppinglist.title)
+				}
+				return response, 201
+			response = {
+				'status': 'fail',
+				'message': 'Requested value \'{}\' was not found'.format(shoppinglist_id)
+			}
+			return response, 202
+		else:
+			return user_id
+
+class ShoppingListItemsAPI(Resource):
+
+	@replica_reads
+	def get(self, shoppinglist_id):
+		user_id = middleware()			
+		if isinstance(user_id, int):
+			try:
+				limit = page_limit(
+					request.args.get('limit'),
+					current_app.config.get('PAGE_SIZE'),
+					current_app.config.get('MAX_PAGE_SIZE'))
+				cursor = request.args.get('cursor')
+				if cursor:
+					cursor = decode_cursor(cursor, int)
+			except ValueError as err:
+				response = {
+					'status': 'fail',
+					'message': str(err)
+				}
+				return response, 202
+			stream = wants_stream()
+			cache = current_app.extensions['response_cache']
+			scope = items_scope(user_id, shoppinglist_id)
+			variant = '{}:{}'.format(limit, request.args.get('cursor') or '')
+			if not stream:
+				cached = cache.get(scope, variant)
+				if cached is not None:
+					return replay_response(cached)
+			version = cache.version(scope)
+			# Answer polls from one aggregate query while nothing has changed
+			count, last_modified, last_id, owner_version = ShoppingListItem.collection_state(
+				owner_id=user_id, shoppinglist_id=shoppinglist_id)
+			etag = make_etag(shoppinglist_id, user_id, count, last_modified, last_id, owner_version, limit, request.args.get('cursor'), stream)
+			headers = validator_headers(etag, last_modified)
+			unchanged = not_modified(etag, last_modified)
+			if unchanged is not None:
+				return unchanged
+			# Select only the serialized columns, rows skip ORM instance state
+			shoppinglistitems = db.session.query(
+				*shoppinglistitem_serializer.columns(ShoppingListItem)).filter(
+				ShoppingListItem.shoppinglist_id == shoppinglist_id,
+				ShoppingListItem.owner_id == user_id)
+			if cursor:
+				shoppinglistitems = shoppinglistitems.filter(ShoppingListItem.item_id > cursor[0])
+			shoppinglistitems = shoppinglistitems.order_by(ShoppingListItem.item_id)
+			if stream and count:
+				# Everything after the cursor, written while the rows are read
+				return stream_response(JSONObject(
+					('items', JSONArray(
+						shoppinglistitems.yield_per(current_app.config.get('STREAM_CHUNK_SIZE')),
+						shoppinglistitem_serializer)),
+					('next_cursor', None)), 202, headers)
+			shoppinglistitems = shoppinglistitems.limit(limit + 1).all()
+			results = shoppinglistitem_serializer.rows(shoppinglistitems[:limit])
+			if len(results) == 0:
+				response = {
+					'status': 'success',
+					'message': "You don't have any items for now"
+				}
+				return response, 202, headers
+			next_cursor = None
+			if len(shoppinglistitems) > limit:
+				next_cursor = encode_cursor(shoppinglistitems[limit - 1].item_id)
+			response = json_response({
+				'items': results,
+				'next_cursor': next_cursor
+			})
+			response.headers.extend(headers)
+			response.status_code = 202
+			cache_response(scope, variant, version, response, etag, last_modified)
+			return response
+		else:
+			return user_id
+
+	def post(self, shoppinglist_id):
+		user_id = middleware()
+		if isinstance(user_id, int):
+			args = shoppinglistitem_parser.parse_args()
+			item_title = args['item_title']
+			item_description = args['item_description']
+			valid_item_title = is_valid(value=item_title, min_length=10, _type="text")
+			valid_item_description = is_valid(value=item_description, min_length=10, _type="text")
+			if valid_item_title is True and valid_item_description is True:
+				shoppinglistitem = ShoppingListItem(item_title=item_title, item_description=item_description, shoppinglist_id=shoppinglist_id, owner_id=user_id)
+				try:
+					shoppinglistitem.save_shoppinglistitem()
+				except IntegrityError as err:
+					if not is_unique_violation(err):
+						raise
+				else:
+					# Return Response
+					response = dict(
+						shoppinglistitem_detail_serializer.one(shoppinglistitem),
+						message='Shopping list item {} created successfuly'.format(item_title))
+					return response, 201
+				response = {
+					'message': 'Shopping List item {} already exists'.format(item_title)
+				}
+				return response, 202
+			else:
+				if valid_item_title is True:
+					message = valid_item_description
+				elif valid_item_description is True:
+					message = valid_item_title
+				else:
+					message = [valid_item_title, valid_item_description]
+				response = {
+					'message': message,
+					'status': 'fail'
+				}
+				return response, 202
+		else:
+			return user_id
+
+	def patch(self, shoppinglist_id):
+		user_id = middleware()
+		if isinstance(user_id, int):
+			data = request.get_json(silent=True)
+			try:
+				selection = item_selection(data)
+			except ValueError as err:
+				response = {
+					'status': 'fail',
+					'message': str(err)
+				}
+				return response, 202
+			item_description = str(data.get('item_description') or '')
+			valid_item_description = is_valid(value=item_description, min_length=10, _type="text")
+			if valid_item_description is not True:
+				response = {
+					'message': valid_item_description,
+					'status': 'fail'
+				}
+				return response, 202
+			updated = ShoppingListItem.update_shoppinglistitems(
+				owner_id=user_id,
+				shoppinglist_id=shoppinglist_id,
+				values={'item_description': item_description},
+				**selection)
+			response = {
+				'status': 'success',
+				'updated': updated,
+				'message': '{} shopping list items updated successfuly'.format(updated)
+			}
+			return response, 200
+		else:
+			return user_id
+
+	def delete(self, shoppinglist_id):
+		user_id = middleware()
+		if isinstance(user_id, int):
+			try:
+				selection = item_selection(request.get_json(silent=True))
+			except ValueError as err:
+				response = {
+					'status': 'fail',
+					'message': str(err)
+				}
+				return response, 202
+			deleted = ShoppingListItem.delete_shoppinglistitems(
+				owner_id=user_id,
+				shoppinglist_id=shoppinglist_id,
+				**selection)
+			response = {
+				'status': 'success',
+				'deleted': deleted,
+				'message': '{} shopping list items deleted successfuly'.format(deleted)
+			}
+			return response, 200
+		else:
+			return user_id
+
+class ShoppingListItemsBatchAPI(Resource):
+	"""Create many items on a shoppinglist in one request"""
+
+	def post(self, shoppinglist_id):
+		user_id = middleware()
+		if isinstance(user_id, int):
+			items = request.get_json(silent=True)
+			if not isinstance(items, list) or len(items) == 0:
+				response = {
+					'status': 'fail',
+					'message': 'Expected a JSON array of items'
+				}
+				return response, 202
+			max_items = current_app.config.get('MAX_BATCH_SIZE')
+			if len(items) > max_items:
+				response = {
+					'status': 'fail',
+					'message': 'A batch can\'t have more than {} items'.format(max_items)
+				}
+				return response, 202
+			results = []
+			valid_items = []
+			for index, item in enumerate(items):
+				if not isinstance(item, dict):
+					item = {}
+				item_title = str(item.get('item_title') or '')
+				item_description = str(item.get('item_description') or '')
+				valid_item_title = is_valid(value=item_title, min_length=10, _type="text")
+				valid_item_description = is_valid(value=item_description, min_length=10, _type="text")
+				if valid_item_title is True and valid_item_description is True:
+					valid_items.append((index, item_title, item_description))
+					results.append(None)
+					continue
+				if valid_item_title is True:
+					message = valid_item_description
+				elif valid_item_description is True:
+					message = valid_item_title
+				else:
+					message = [valid_item_title, valid_item_description]
+				results.append({
+					'index': index,
+					'status': 'fail',
+					'message': message
+				})
+			# One query finds every title that is already taken
+			titles = set(item_title for _, item_title, _ in valid_items)
+			existing = set()
+			if titles:
+				existing = set(row.item_title for row in db.session.query(
+					ShoppingListItem.item_title).filter(
+					ShoppingListItem.shoppinglist_id == shoppinglist_id,
+					ShoppingListItem.item_title.in_(titles)))
+			new_items = []
+			for index, item_title, item_description in valid_items:
+				if item_title in existing:
+					results[index] = {
+						'index': index,
+						'status': 'fail',
+						'message': 'Shopping List item {} already exists'.format(item_title)
+					}
+					continue
+				# Later duplicates within the batch are rejected too
+				existing.add(item_title)
+				new_items.append((index, item_title, item_description))
+			try:
+				item_ids = ShoppingListItem.save_shoppinglistitems(
+					owner_id=user_id,
+					shoppinglist_id=shoppinglist_id,
+					items=[(item_title, item_description) for _, item_title, item_description in new_items])
+			except IntegrityError as err:
+				if not is_unique_violation(err):
+					raise
+				# A title was taken since it was checked, the batch is all or nothing
+				response = {
+					'status': 'fail',
+					'message': 'A Shopping List item in the batch already exists, please retry'
+				}
+				return response, 202
+			for index, item_title, item_description in new_items:
+				results[index] = {
+					'index': index,
+					'status': 'success',
+					'item_id': item_ids[item_title],
+					'item_title': item_title,
+					'item_description': item_description
+				}
+			response = {
+				'created': len(new_items),
+				'failed': len(items) - len(new_items),
+				'results': results
+			}
+			if new_items:
+				return response, 201
+			return response, 202
+		else:
+			return user_id
+
+class SingleShoppingListItemAPI(Resource):
+	@replica_reads
+	def get(self, shoppinglist_id, shoppinglistitem_id):
+		user_id = middleware()
+		if isinstance(user_id, int):
+			cache = current_app.extensions['response_cache']
+			scope = item_scope(shoppinglist_id)
+			variant = str(shoppinglistitem_id)
+			cached = cache.get(scope, variant)
+			if cached is not None:
+				return replay_response(cached)
+			version = cache.version(scope)
+			shoppinglistitem = ShoppingListItem.query.filter_by(
+				item_id=shoppinglistitem_id,
+				shoppinglist_id=shoppinglist_id
+			).first()
+			if shoppinglistitem:
+				etag = make_etag(
+					shoppinglistitem.item_id, shoppinglistitem.owner_id,
+					shoppinglistitem.shoppinglist_id, shoppinglistitem.item_title,
+					shoppinglistitem.item_description, shoppinglistitem.date_modified)
+				unchanged = not_modified(etag, shoppinglistitem.date_modified)
+				if unchanged is not None:
+					return unchanged
+				response = json_response(dict(
+					shoppinglistitem_detail_serializer.one(shoppinglistitem),
+					message='success'))
+				response.status_code = 201
+				response.headers.extend(validator_headers(etag, shoppinglistitem.date_modified))
+				cache_response(scope, variant, version, response, etag, shoppinglistitem.date_modified)
+				return response
+			response = {
+				'message': 'Requested value \'{}\' was not found'.format(shoppinglistitem_id)
+			}
+			return response, 202
+		else:
+			return user_id
+
+	def put(self, shoppinglist_id, shoppinglistitem_id):
+		user_id = middleware()
+		if isinstance(user_id, int):
+			args = shoppinglistitem_parser.parse_args()
+			item_title = args['item_title']
+			item_description = args['item_description']
+			valid_item_title = is_valid(value=item_title, min_length=10, _type="text")
+			valid_item_description = is_valid(value=item_description, min_length=10, _type="text")
+			if valid_item_title is True and valid_item_description is True:
+				try:
+					updated = ShoppingListItem.update_shoppinglistitem(
+						owner_id=user_id, shoppinglist_id=shoppinglist_id,
+						item_id=shoppinglistitem_id, item_title=item_title,
+						item_description=item_description)
+				except IntegrityError as err:
+					if not is_unique_violation(err):
+						raise
+					updated = None
+				if updated:
+					# Return Response
+					response = {
+						'item_id': shoppinglistitem_id,
+						'item_title': item_title,
+						'item_description': item_description,
+						'message': 'Shopping list item updated successfuly'
+					}
+					return response, 200
+				# Nothing matched, either the item is missing or keeps its title
+				if updated == 0 and ShoppingListItem.query.filter_by(shoppinglist_id=shoppinglist_id, item_title=item_title).first() is None:
+					response = {
+						'message': 'Requested value \'{}\' was not found'.format(shoppinglistitem_id),
+						'status': 'fail'
+					}
+					return response, 202
+				response = {
+					'message': 'Shopping list item {} already exists'.format(item_title),
+					'status': 'fail'
+				}
+				return response, 202
+			else:
+				if valid_item_title is True:
+					message = valid_item_description
+				elif valid_item_description is True:
+					message = valid_item_title
+				else:
+					message = [valid_item_title, valid_item_description]
+				response = json_response({
+					'message': message,
+					'status': "fail"
+				})
+				return make_response(response, 202)
+		else:
+			return user_id
+
+	def delete(self, shoppinglist_id, shoppinglistitem_id):
+		user_id = middleware()
+		if isinstance(user_id, int):
+			shoppinglistitem = ShoppingListItem.query.filter_by(item_id=shoppinglistitem_id, owner_id=user_id, shoppinglist_id=shoppinglist_id).first()
+			if shoppinglistitem:
+				shoppinglistitem.delete_shoppinglistitem()
+				response = {
+					'message': 'Shopping list item \'{}\' deleted successfuly'.format(shoppinglistitem.item_title)
+				}
+				return response, 201
+			response = {
+				'message': 'Requested value \'{}\' was not found'.format(shoppinglistitem_id)
+			}
+			return response, 202
+		else:
+			return user_id
+
+shoppinglist_sync_serializer = shoppinglist_serializer.extend(('version', 'version'))
+shoppinglistitem_sync_serializer = shoppinglistitem_serializer.extend(('version', 'version'))
+
+class SyncAPI(Resource):
+	"""Changes to the user's lists and items since a version watermark"""
+
+	@replica_reads
+	def get(self):
+		user_id = middleware()
+		if isinstance(user_id, int):
+			try:
+				since = sync_version(request.args.get('since'))
+			except ValueError as err:
+				response = {
+					'status': 'fail',
+					'message': str(err)
+				}
+				return response, 202
+			# Read the watermark first, later writes are left for the next sync
+			version = Users.current_version(user_id)
+			chunk_size = current_app.config.get('STREAM_CHUNK_SIZE')
+			shoppinglists = ShoppingList.changed_since(user_id, since, version).with_entities(
+				*shoppinglist_sync_serializer.columns(ShoppingList)).yield_per(chunk_size)
+			items = ShoppingListItem.changed_since(user_id, since, version).with_entities(
+				*shoppinglistitem_sync_serializer.columns(ShoppingListItem)).yield_per(chunk_size)
+			tombstones = Tombstone.changed_since(user_id, since, version).with_entities(
+				Tombstone.object_id)
+			# A first sync returns the whole account, so it is streamed
+			return stream_response(JSONObject(
+				('version', version),
+				('shoppinglists', JSONArray(shoppinglists, shoppinglist_sync_serializer)),
+				('items', JSONArray(items, shoppinglistitem_sync_serializer)),
+				('deleted', JSONObject(
+					('shoppinglists', JSONArray(object_id for object_id, in tombstones.filter(
+						Tombstone.kind == 'shoppinglist').yield_per(chunk_size))),
+					('items', JSONArray(object_id for object_id, in tombstones.filter(
+						Tombstone.kind == 'shoppinglistitem').yield_per(chunk_size)))))
+			), 200)
+		else:
+			return user_id
+
+class SearchAPI(Resource):
+	"""The user's lists and items matching q, best match first"""
+
+	@replica_reads
+	def get(self):
+		user_id = middleware()
+		if isinstance(user_id, int):
+			q = request.args.get('q', '').strip()
+			if not q:
+				response = {
+					'status': 'fail',
+					'message': "Search query can't be empty"
+				}
+				return response, 202
+			try:
+				limit = page_limit(
+					request.args.get('limit'),
+					current_app.config.get('PAGE_SIZE'),
+					current_app.config.get('MAX_PAGE_SIZE'))
+				offset = 0
+				cursor = request.args.get('cursor')
+				if cursor:
+					# Ranks change as rows are written, the cursor is a position
+					offset, = decode_cursor(cursor, int)
+			except ValueError as err:
+				response = {
+					'status': 'fail',
+					'message': str(err)
+				}
+				return response, 202
+			results = search(user_id, q, limit + 1, offset)
+			next_cursor = None
+			if len(results) > limit:
+				next_cursor = encode_cursor(offset + limit)
+			return json_response({
+				'results': search_result_serializer.rows(results[:limit]),
+				'next_cursor': next_cursor
+			}, 200)
+		else:
+			return user_id
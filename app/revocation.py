@@ -0,0 +1,239 @@
+"""In-process view of revoked (logged out) tokens"""
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+import jwt
+
+
+def new_jti():
+    """Random 63 bit token id, fits a signed BIGINT"""
+    return int.from_bytes(os.urandom(8), 'big') >> 1
+
+
+def unverified_claims(token):
+    """Read the claims of a token without verifying it"""
+    try:
+        return jwt.decode(token, verify=False)
+    except jwt.InvalidTokenError:
+        return {}
+
+
+def token_key(token, payload=None):
+    """Fixed size key a token is revoked under
+
+    This is the jti claim, or a 63 bit digest of the raw token for tokens
+    issued without one.
+    """
+    if payload is None:
+        payload = unverified_claims(token)
+    jti = payload.get('jti')
+    if isinstance(jti, int) and not isinstance(jti, bool):
+        return jti
+    if not isinstance(token, bytes):
+        token = str(token).encode('utf-8')
+    return int.from_bytes(hashlib.sha256(token).digest()[:8], 'big') >> 1
+
+
+class BloomFilter(object):
+    """Set membership with false positives but no false negatives"""
+
+    def __init__(self, capacity, error_rate):
+        capacity = max(int(capacity), 1)
+        self.size = int(math.ceil(
+            -capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # Double hashing over two 64 bit halves of the key's digest
+        digest = hashlib.sha256(key.to_bytes(8, 'big')).digest()
+        first = int.from_bytes(digest[:8], 'big')
+        second = int.from_bytes(digest[8:16], 'big') | 1
+        for i in range(self.hashes):
+            yield (first + i * second) % self.size
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        for position in self._positions(key):
+            if not self.bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+class RevocationCache(object):
+    """Bounded LRU of revoked token keys that forgets them once expired"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+
+    def add(self, key, expires_at):
+        self.entries.pop(key, None)
+        self.entries[key] = expires_at
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def __contains__(self, key):
+        if key not in self.entries:
+            return False
+        expires_at = self.entries[key]
+        if expires_at is not None and expires_at <= time.time():
+            # The token is rejected on its exp claim from now on
+            del self.entries[key]
+            return False
+        self.entries.move_to_end(key)
+        return True
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class RevokedTokens(object):
+    """Answers "has this token been revoked" without a query when possible
+
+    Revoked tokens are remembered in a bounded cache. Tokens that were never
+    revoked are ruled out by a Bloom filter kept in sync with the user_token
+    table, so only Bloom filter hits reach the database.
+    """
+
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.cache = RevocationCache(app.config.get('REVOCATION_CACHE_SIZE'))
+        self.capacity = app.config.get('REVOCATION_BLOOM_CAPACITY')
+        self.error_rate = app.config.get('REVOCATION_BLOOM_ERROR_RATE')
+        self.refresh_interval = app.config.get('REVOCATION_REFRESH_SECONDS')
+        self.rebuild_interval = app.config.get('REVOCATION_REBUILD_SECONDS')
+        self.sync_lag = app.config.get('REVOCATION_SYNC_LAG_SECONDS')
+        self.bloom = None
+        self.syncing = False
+        self.last_id = 0
+        # (time, last_id) of recent syncs, oldest first
+        self.watermarks = deque([(0, 0)])
+        self.refreshed_at = 0
+        self.rebuilt_at = 0
+        self.cache_hits = 0
+        self.ruled_out = 0
+        self.lookups = 0
+        app.extensions['revoked_tokens'] = self
+
+    def sync(self, load_revoked):
+        """Bring the Bloom filter up to date with the user_token table
+
+        load_revoked(after_id) returns (id, jti) rows with id > after_id.
+        New rows are added every refresh_interval seconds and the filter is
+        rebuilt from scratch every rebuild_interval seconds so purged rows
+        stop producing false positives. Revocations made by other processes
+        are therefore seen after at most refresh_interval seconds.
+
+        Ids are handed out before commit, so a row can become visible after
+        rows with higher ids. Each refresh reads from the highest id seen
+        sync_lag seconds ago rather than the latest one, which catches rows
+        committed up to sync_lag seconds late.
+        """
+        now = time.time()
+        with self.lock:
+            if self.syncing:
+                return
+            rebuild = self.bloom is None or now - self.rebuilt_at >= self.rebuild_interval
+            if not rebuild and now - self.refreshed_at < self.refresh_interval:
+                return
+            self.syncing = True
+            if rebuild:
+                after_id = 0
+            else:
+                cutoff = now - self.sync_lag
+                while len(self.watermarks) > 1 and self.watermarks[1][0] <= cutoff:
+                    self.watermarks.popleft()
+                after_id = self.watermarks[0][1]
+            last_id = self.last_id
+        try:
+            # Query without holding the lock, requests keep using the old filter
+            keys = []
+            for row_id, key in load_revoked(after_id):
+                keys.append(key)
+                last_id = max(last_id, row_id)
+            if rebuild:
+                bloom = BloomFilter(max(self.capacity, 2 * len(keys)), self.error_rate)
+                for key in keys:
+                    bloom.add(key)
+            with self.lock:
+                if rebuild:
+                    self.bloom, self.rebuilt_at = bloom, now
+                else:
+                    for key in keys:
+                        # Rows are read again for sync_lag seconds
+                        if key not in self.bloom:
+                            self.bloom.add(key)
+                self.last_id, self.refreshed_at = last_id, now
+                self.watermarks.append((now, last_id))
+                if self.bloom.count > self.capacity:
+                    # Rebuild a larger filter on the next sync to keep the error rate
+                    self.capacity = 2 * self.bloom.count
+                    self.rebuilt_at = 0
+        finally:
+            with self.lock:
+                self.syncing = False
+
+    def sync_due(self):
+        """Whether sync would query now, so async callers only hop threads then"""
+        now = time.time()
+        with self.lock:
+            return not self.syncing and (
+                self.bloom is None or now - self.refreshed_at >= self.refresh_interval
+                or now - self.rebuilt_at >= self.rebuild_interval)
+
+    def is_revoked(self, key, expires_at, lookup):
+        """Check a token key, calling lookup() only when the cache can't tell"""
+        revoked = self.known(key)
+        if revoked is None:
+            revoked = lookup()
+            if revoked:
+                self.remember(key, expires_at)
+        return revoked
+
+    def known(self, key):
+        """True or False when the cache can tell, None when the database must"""
+        with self.lock:
+            if key in self.cache:
+                self.cache_hits += 1
+                return True
+            if self.bloom is not None and key not in self.bloom:
+                self.ruled_out += 1
+                return False
+            self.lookups += 1
+        return None
+
+    def remember(self, key, expires_at):
+        """Cache a key the database says is revoked"""
+        with self.lock:
+            self.cache.add(key, expires_at)
+
+    def revoke(self, key, expires_at):
+        """Remember a token key that has just been written to user_token"""
+        with self.lock:
+            self.cache.add(key, expires_at)
+            if self.bloom is not None:
+                self.bloom.add(key)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'cache_hits': self.cache_hits,
+                'ruled_out': self.ruled_out,
+                'lookups': self.lookups,
+                'cache_size': len(self.cache),
+                'bloom_keys': self.bloom.count if self.bloom is not None else 0,
+            }
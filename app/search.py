@@ -0,0 +1,80 @@
+"""Ranked search over an owner's list and item titles and descriptions"""
+import re
+
+from sqlalchemy import Integer, and_, case, literal, null, or_, select, union_all
+
+from app.app import db
+from app.models import ShoppingList, ShoppingListItem
+
+# Words beyond this are ignored, every word adds a condition on SQLite
+MAX_TERMS = 8
+# Weights of a title and a description match in the SQLite fallback,
+# the Postgres vectors weight them A and B
+TITLE_WEIGHT = 2
+DESCRIPTION_WEIGHT = 1
+
+
+def search_terms(q):
+    return re.findall(r'\w+', q.lower(), re.UNICODE)[:MAX_TERMS]
+
+
+def _fulltext(model, id_column, shoppinglist_id, title, description, owner_id, q):
+    query = db.func.plainto_tsquery('english', q)
+    return select([
+        literal(model.__tablename__[:-1]).label('kind'),
+        id_column.label('id'),
+        shoppinglist_id.label('shoppinglist_id'),
+        title.label('title'),
+        description.label('description'),
+        db.func.ts_rank(model.search_vector, query).label('rank'),
+    ]).where(and_(
+        model.owner_id == owner_id,
+        model.search_vector.op('@@')(query)))
+
+
+def _like(model, id_column, shoppinglist_id, title, description, owner_id, terms):
+    conditions = []
+    rank = literal(0)
+    for term in terms:
+        pattern = '%{}%'.format(
+            term.replace('\\', '\\\\').replace('%', r'\%').replace('_', r'\_'))
+        in_title = title.ilike(pattern, escape='\\')
+        in_description = description.ilike(pattern, escape='\\')
+        # Every word has to match, like plainto_tsquery
+        conditions.append(or_(in_title, in_description))
+        rank = rank + case([(in_title, TITLE_WEIGHT)], else_=0) + case(
+            [(in_description, DESCRIPTION_WEIGHT)], else_=0)
+    return select([
+        literal(model.__tablename__[:-1]).label('kind'),
+        id_column.label('id'),
+        shoppinglist_id.label('shoppinglist_id'),
+        title.label('title'),
+        description.label('description'),
+        rank.label('rank'),
+    ]).where(and_(model.owner_id == owner_id, *conditions))
+
+
+def search(owner_id, q, limit, offset=0):
+    """One page of the owner's lists and items matching q, best first
+
+    Postgres matches the search_vector columns through their GIN indexes
+    and ranks with ts_rank. Other databases match each word with LIKE and
+    rank title matches above description matches.
+    """
+    terms = search_terms(q)
+    if not terms:
+        return []
+    if db.engine.dialect.name == 'postgresql':
+        build, match = _fulltext, ' '.join(terms)
+    else:
+        build, match = _like, terms
+    results = union_all(
+        build(ShoppingList, ShoppingList.id, null().cast(Integer),
+              ShoppingList.title, ShoppingList.description, owner_id, match),
+        build(ShoppingListItem, ShoppingListItem.item_id, ShoppingListItem.shoppinglist_id,
+              ShoppingListItem.item_title, ShoppingListItem.item_description, owner_id, match),
+    ).alias('results')
+    return db.session.execute(
+        select([results]).order_by(
+            results.c.rank.desc(), results.c.kind, results.c.id
+        ).limit(limit).offset(offset)).fetchall()
@@ -0,0 +1,246 @@
+"""Model rows to JSON, through fixed field maps and a pluggable encoder"""
+import datetime
+import json
+from operator import attrgetter
+
+from flask import current_app, stream_with_context
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+          'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+def http_datetime(value):
+    """Same text as werkzeug's http_date for a naive UTC datetime, faster"""
+    return '{}, {:02d} {} {:04d} {:02d}:{:02d}:{:02d} GMT'.format(
+        WEEKDAYS[value.weekday()], value.day, MONTHS[value.month - 1],
+        value.year, value.hour, value.minute, value.second)
+
+
+def _default(value):
+    if isinstance(value, datetime.datetime):
+        return http_datetime(value)
+    raise TypeError('{!r} is not JSON serializable'.format(value))
+
+
+_stdlib_encoder = json.JSONEncoder(
+    default=_default, ensure_ascii=False, separators=(',', ':'))
+
+
+def stdlib_dumps(data):
+    return _stdlib_encoder.encode(data).encode('utf-8')
+
+
+ENCODERS = {'json': stdlib_dumps}
+
+if orjson is not None:
+    def orjson_dumps(data):
+        # Datetimes go through _default so both encoders write the same text
+        return orjson.dumps(data, default=_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+
+    ENCODERS['orjson'] = orjson_dumps
+
+
+class Serializer(object):
+    """Turns model instances or row tuples into dicts with a fixed field map
+
+    Each field is (key, attribute) or (key, attribute, converter). The
+    attribute getter and converters are resolved once, here, rather than
+    per row. Converters are skipped for None values.
+    """
+
+    def __init__(self, *fields):
+        self.fields = fields
+        self.keys = tuple(field[0] for field in fields)
+        self.attributes = tuple(field[1] for field in fields)
+        self.getter = attrgetter(*self.attributes)
+        self.converters = tuple(
+            (index, field[2]) for index, field in enumerate(fields) if len(field) > 2)
+
+    def extend(self, *fields):
+        return Serializer(*(self.fields + fields))
+
+    def columns(self, model):
+        """Model columns in field order, for queries that select only them"""
+        return [getattr(model, attribute) for attribute in self.attributes]
+
+    def row(self, values):
+        """Dict for a tuple of values in field order"""
+        if self.converters:
+            values = list(values)
+            for index, converter in self.converters:
+                if values[index] is not None:
+                    values[index] = converter(values[index])
+        return dict(zip(self.keys, values))
+
+    def one(self, obj):
+        return self.row(self.getter(obj))
+
+    def many(self, objs):
+        row, getter = self.row, self.getter
+        return [row(getter(obj)) for obj in objs]
+
+    def rows(self, rows):
+        """Dicts for rows of a query selecting columns(model)"""
+        row = self.row
+        return [row(values) for values in rows]
+
+
+user_serializer = Serializer(
+    ('id', 'id'),
+    ('username', 'username'),
+    ('email', 'email'),
+    ('date_created', 'date_created', http_datetime),
+)
+
+shoppinglist_serializer = Serializer(
+    ('id', 'id'),
+    ('title', 'title'),
+    ('description', 'description'),
+    ('date_created', 'date_created', http_datetime),
+    ('date_modified', 'date_modified', http_datetime),
+    ('owner_id', 'owner_id'),
+)
+
+shoppinglist_detail_serializer = Serializer(
+    ('id', 'id'),
+    ('owner', 'owner_id'),
+    ('title', 'title'),
+    ('description', 'description'),
+)
+
+shoppinglistitem_serializer = Serializer(
+    ('item_id', 'item_id'),
+    ('item_title', 'item_title'),
+    ('item_description', 'item_description'),
+    ('shoppinglist_id', 'shoppinglist_id'),
+    ('date_created', 'date_created', http_datetime),
+    ('date_modified', 'date_modified', http_datetime),
+    ('owner_id', 'owner_id'),
+)
+
+shoppinglistitem_detail_serializer = Serializer(
+    ('item_id', 'item_id'),
+    ('owner_id', 'owner_id'),
+    ('shoppinglist_id', 'shoppinglist_id'),
+    ('item_title', 'item_title'),
+    ('item_description', 'item_description'),
+)
+
+# Rows of app.search.search, shoppinglist_id is None for lists
+search_result_serializer = Serializer(
+    ('kind', 'kind'),
+    ('id', 'id'),
+    ('shoppinglist_id', 'shoppinglist_id'),
+    ('title', 'title'),
+    ('description', 'description'),
+    ('rank', 'rank', float),
+)
+
+
+class JSONEncoding(object):
+    """Picks the encoder every JSON response is written with
+
+    JSON_ENCODER names one of ENCODERS, None takes orjson when it is
+    installed and the standard library otherwise.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        name = app.config.get('JSON_ENCODER')
+        if name is None:
+            name = 'orjson' if 'orjson' in ENCODERS else 'json'
+        self.name = name
+        self.dumps = ENCODERS[name]
+        app.extensions['json_encoding'] = self
+
+
+def dumps(data):
+    return current_app.extensions['json_encoding'].dumps(data)
+
+
+def json_response(data, status=200, headers=None):
+    """Response with a JSON body, the replacement for jsonify"""
+    response = current_app.response_class(
+        dumps(data), status=status, mimetype='application/json')
+    if headers:
+        response.headers.extend(headers)
+    return response
+
+
+class JSONArray(object):
+    """Rows written as a JSON array while they are read, see stream_json
+
+    Rows are dicts made by serializer.row, or written as they are when
+    there is no serializer.
+    """
+
+    def __init__(self, rows, serializer=None):
+        self.rows = rows
+        self.serializer = serializer
+
+
+class JSONObject(object):
+    """Object of (key, value) fields for stream_json"""
+
+    def __init__(self, *fields):
+        self.fields = fields
+
+
+def stream_json(value, encode, chunk_size):
+    """Yield the encoded value in chunks of at most chunk_size array rows
+
+    JSONArray rows are encoded as they are iterated, so memory stays flat
+    whatever the number of rows when they come from a yield_per query.
+    """
+    if isinstance(value, JSONObject):
+        yield b'{'
+        for index, (key, field) in enumerate(value.fields):
+            yield (b',' if index else b'') + encode(key) + b':'
+            for chunk in stream_json(field, encode, chunk_size):
+                yield chunk
+        yield b'}'
+    elif isinstance(value, JSONArray):
+        row = value.serializer.row if value.serializer is not None else None
+        yield b'['
+        separator = b''
+        chunk = []
+        for values in value.rows:
+            chunk.append(encode(row(values) if row else values))
+            if len(chunk) >= chunk_size:
+                yield separator + b','.join(chunk)
+                separator = b','
+                chunk = []
+        if chunk:
+            yield separator + b','.join(chunk)
+        yield b']'
+    else:
+        yield encode(value)
+
+
+def stream_response(value, status=200, headers=None):
+    """Response writing stream_json chunks as they are produced
+
+    The request context, and with it the database session, stays open
+    until the last chunk is sent.
+    """
+    encode = current_app.extensions['json_encoding'].dumps
+    chunks = stream_json(value, encode, current_app.config.get('STREAM_CHUNK_SIZE'))
+    response = current_app.response_class(
+        stream_with_context(chunks), status=status, mimetype='application/json')
+    if headers:
+        response.headers.extend(headers)
+    return response
+
+
+def output_json(data, code, headers=None):
+    """Flask-RESTful representation for resources returning plain dicts"""
+    return json_response(data, code, headers)
@@ -0,0 +1,77 @@
+"""Removes expired rows from the user_token blacklist"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TokenSweeper(object):
+    """Purges expired tokens in batches and keeps counters about it
+
+    Run it once with purge(), or let a serving process do it every
+    TOKEN_PURGE_INTERVAL seconds from a daemon thread.
+    """
+
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stats = {
+            'runs': 0,
+            'purged_total': 0,
+            'last_purged': 0,
+            'last_duration_seconds': 0.0,
+            'table_rows': None,
+        }
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.batch_size = app.config.get('TOKEN_PURGE_BATCH_SIZE')
+        self.pause = app.config.get('TOKEN_PURGE_PAUSE_SECONDS')
+        self.interval = app.config.get('TOKEN_PURGE_INTERVAL')
+        app.extensions['token_sweeper'] = self
+        if self.interval:
+            app.before_first_request(self.start)
+
+    def purge(self):
+        """Delete every expired token, one batch at a time"""
+        from app.app import db
+        from app.models import UserToken
+        with self.lock:
+            started = time.time()
+            purged = 0
+            while True:
+                deleted = UserToken.purge_expired(self.batch_size)
+                purged += deleted
+                if deleted < self.batch_size:
+                    break
+                # Give other writers a chance at the table between batches
+                time.sleep(self.pause)
+            table_rows = db.session.query(db.func.count(UserToken.id)).scalar()
+            db.session.remove()
+            self.stats['runs'] += 1
+            self.stats['purged_total'] += purged
+            self.stats['last_purged'] = purged
+            self.stats['last_duration_seconds'] = time.time() - started
+            self.stats['table_rows'] = table_rows
+        logger.info('Purged %d expired tokens, %d remain', purged, table_rows)
+        return dict(self.stats)
+
+    def start(self):
+        """Purge from a background thread every interval seconds"""
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self.run, name='token-sweeper')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                with self.app.app_context():
+                    self.purge()
+            except Exception:
+                logger.exception('Purging expired tokens failed')
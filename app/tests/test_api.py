@@ -1,8 +1,11 @@
 import unittest
+import base64
 import os
 import json
 import time
+import threading
 from flask import Flask
+from sqlalchemy import event
 from app.app import create_app, db
 from app.models import Users
 
@@ -205,6 +208,78 @@ class ApiTestCase(unittest.TestCase):
 		self.assertIn(b'Shopping List My favorite meal already exists', response.data)
 		self.assertEqual(response.status_code, 202)
 		
+	def test_same_title_for_different_owners(self):
+		"""Test titles only need to be unique for their owner"""
+		self.register_user()
+		access_token = self.access_token()
+		self.client().post('/auth/register', data={
+			'username': 'Runner',
+			'email': 'runner@test.com',
+			'password': 'secret',
+			'confirm_password': 'secret'
+		})
+		res = self.login_user(email='runner@test.com')
+		other_access_token = "Bearer " + json.loads(res.data.decode())['token']
+		for token in (access_token, other_access_token):
+			response = self.client().post(
+				'/shoppinglists',
+				headers=dict(Authorization=token),
+				data=self.shoppinglist
+			)
+			self.assertEqual(response.status_code, 201)
+		response = self.client().post(
+			'/shoppinglists',
+			headers=dict(Authorization=other_access_token),
+			data=self.shoppinglist
+		)
+		self.assertIn(b'Shopping List My favorite meal already exists', response.data)
+		self.assertEqual(response.status_code, 202)
+
+	def test_concurrent_duplicate_shoppinglist(self):
+		"""Test racing requests for one title create exactly one shoppinglist"""
+		self.register_user()
+		access_token = self.access_token()
+		threads_count = 8
+		barrier = threading.Barrier(threads_count)
+		responses = []
+		def post_shoppinglist():
+			client = self.client()
+			barrier.wait()
+			responses.append(client.post(
+				'/shoppinglists',
+				headers=dict(Authorization=access_token),
+				data=self.shoppinglist
+			))
+		threads = [threading.Thread(target=post_shoppinglist) for _ in range(threads_count)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		status_codes = sorted(response.status_code for response in responses)
+		self.assertEqual(status_codes, [201] + [202] * (threads_count - 1))
+		for response in responses:
+			if response.status_code == 202:
+				self.assertIn(b'Shopping List My favorite meal already exists', response.data)
+
+	def test_concurrent_register(self):
+		"""Test racing registrations for one email create exactly one account"""
+		threads_count = 8
+		barrier = threading.Barrier(threads_count)
+		responses = []
+		def register():
+			client = self.client()
+			barrier.wait()
+			responses.append(client.post('/auth/register', data=self.user))
+		threads = [threading.Thread(target=register) for _ in range(threads_count)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		status_codes = sorted(response.status_code for response in responses)
+		self.assertEqual(status_codes, [200] + [202] * (threads_count - 1))
+		with self.app.app_context():
+			self.assertEqual(Users.query.filter_by(email=self.user['email']).count(), 1)
+
 	def test_fetch_all_shoppinglists(self):
 		"""Test user is able to display all shopping lists"""
 		self.register_user()
@@ -657,6 +732,44 @@ class ApiTestCase(unittest.TestCase):
 		self.assertTrue(b"Shopping list item Sausages and stuff already exists" in non_existing_updates.data)
 		self.assertEqual(non_existing_updates.status_code, 202)
 
+	def test_rename_to_taken_title(self):
+		"""Test renaming to another list's or item's title is refused
+
+		On PostgreSQL the failed UPDATE aborts the transaction, which must be
+		rolled back before the handler and the next requests query again.
+		"""
+		self.register_user()
+		access_token = self.access_token()
+		headers = dict(Authorization=access_token)
+		shoppinglist_ids = []
+		for title in ('My favorite meal', 'Weekly groceries'):
+			response = self.client().post('/shoppinglists', headers=headers, data={
+				'title': title, 'description': 'Items to cook my favorite meal'})
+			shoppinglist_ids.append(json.loads(response.data.decode())['id'])
+		response = self.client().put(
+			'/shoppinglist/{0}'.format(shoppinglist_ids[1]),
+			headers=headers,
+			data={'title': 'My favorite meal', 'description': 'Everything for the week'})
+		self.assertEqual(response.status_code, 202)
+		self.assertIn(b'Shopping List My favorite meal already exists', response.data)
+		response = self.client().get('/shoppinglist/{0}'.format(shoppinglist_ids[1]), headers=headers)
+		self.assertEqual(json.loads(response.data.decode())['title'], 'Weekly groceries')
+		item_ids = []
+		for item_title in ('Vegetables', 'Fresh fruits'):
+			response = self.client().post(
+				'/shoppinglist/{0}/items'.format(shoppinglist_ids[0]), headers=headers,
+				data={'item_title': item_title, 'item_description': 'Carrots and Cabbages'})
+			item_ids.append(json.loads(response.data.decode())['item_id'])
+		response = self.client().put(
+			'/shoppinglist/{0}/item/{1}'.format(shoppinglist_ids[0], item_ids[1]),
+			headers=headers,
+			data={'item_title': 'Vegetables', 'item_description': 'Apples and Oranges'})
+		self.assertEqual(response.status_code, 202)
+		self.assertIn(b'Shopping list item Vegetables already exists', response.data)
+		response = self.client().get(
+			'/shoppinglist/{0}/item/{1}'.format(shoppinglist_ids[0], item_ids[1]), headers=headers)
+		self.assertEqual(json.loads(response.data.decode())['item_title'], 'Fresh fruits')
+
 	def test_invalid_item_update(self):
 		"""Test user can't update item with invalid title or description"""
 		self.register_user()
@@ -871,6 +984,521 @@ class ApiTestCase(unittest.TestCase):
 		self.assertIn(b"Signature expired. Please log in again.", response.data)
 
 
+	def test_paginate_shoppinglists(self):
+		"""Test shoppinglists are returned in pages linked by a cursor"""
+		self.register_user()
+		access_token = self.access_token()
+		for title in ['My favorite meal', 'My favorite shoes', 'My favorite books']:
+			self.client().post(
+				'/shoppinglists',
+				headers=dict(Authorization=access_token),
+				data={'title': title, 'description': 'Things I like the most'}
+			)
+		first_page = self.client().get(
+			'/shoppinglists?limit=2',
+			headers=dict(Authorization=access_token)
+		)
+		self.assertEqual(first_page.status_code, 202)
+		first = json.loads(first_page.data.decode())
+		self.assertEqual(
+			[sl['title'] for sl in first['shoppinglists']],
+			['My favorite meal', 'My favorite shoes'])
+		self.assertTrue(first['next_cursor'])
+		second_page = self.client().get(
+			'/shoppinglists?limit=2&cursor={}'.format(first['next_cursor']),
+			headers=dict(Authorization=access_token)
+		)
+		second = json.loads(second_page.data.decode())
+		self.assertEqual(
+			[sl['title'] for sl in second['shoppinglists']], ['My favorite books'])
+		self.assertIsNone(second['next_cursor'])
+		# Test the page size can't exceed the server-side cap
+		self.app.config['MAX_PAGE_SIZE'] = 1
+		capped_page = self.client().get(
+			'/shoppinglists?limit=50',
+			headers=dict(Authorization=access_token)
+		)
+		self.assertEqual(len(json.loads(capped_page.data.decode())['shoppinglists']), 1)
+		# Test malformed paging arguments are rejected
+		invalid_cursor = self.client().get(
+			'/shoppinglists?cursor=not-a-cursor',
+			headers=dict(Authorization=access_token)
+		)
+		self.assertIn(b"Invalid cursor", invalid_cursor.data)
+		self.assertEqual(invalid_cursor.status_code, 202)
+		# Test crafted cursors out of the datetime and BIGINT ranges are rejected
+		for values in ('[1000000000000000000, 1]', '[100000000000000000000, 1]', '[0, 9223372036854775808]'):
+			cursor = base64.urlsafe_b64encode(values.encode()).decode().rstrip('=')
+			invalid_cursor = self.client().get(
+				'/shoppinglists?cursor=' + cursor,
+				headers=dict(Authorization=access_token)
+			)
+			self.assertIn(b"Invalid cursor", invalid_cursor.data)
+			self.assertEqual(invalid_cursor.status_code, 202)
+		invalid_limit = self.client().get(
+			'/shoppinglists?limit=-1',
+			headers=dict(Authorization=access_token)
+		)
+		self.assertIn(b"Limit should be a positive number", invalid_limit.data)
+		self.assertEqual(invalid_limit.status_code, 202)
+		# Test digits int() refuses get the same message
+		invalid_limit = self.client().get(
+			'/shoppinglists?limit=\u00b2',
+			headers=dict(Authorization=access_token)
+		)
+		self.assertEqual(json.loads(invalid_limit.data.decode())['message'], "Limit should be a positive number")
+		self.assertEqual(invalid_limit.status_code, 202)
+
+	def test_paginate_shoppinglist_items(self):
+		"""Test shoppinglist items are returned in pages linked by a cursor"""
+		self.register_user()
+		access_token = self.access_token()
+		response = self.client().post(
+			'/shoppinglists',
+			headers=dict(Authorization=access_token),
+			data=self.shoppinglist
+		)
+		results = json.loads(response.data.decode())
+		for item_title in ['Vegetables and fruits', 'Fresh milk and bread', 'Cereals for breakfast']:
+			self.client().post(
+				'/shoppinglist/{0}/items'.format(results['id']),
+				headers=dict(Authorization=access_token),
+				data={'item_title': item_title, 'item_description': 'From the market'}
+			)
+		first_page = self.client().get(
+			'/shoppinglist/{0}/items?limit=2'.format(results['id']),
+			headers=dict(Authorization=access_token)
+		)
+		self.assertEqual(first_page.status_code, 202)
+		first = json.loads(first_page.data.decode())
+		self.assertEqual(len(first['items']), 2)
+		second_page = self.client().get(
+			'/shoppinglist/{0}/items?limit=2&cursor={1}'.format(results['id'], first['next_cursor']),
+			headers=dict(Authorization=access_token)
+		)
+		second = json.loads(second_page.data.decode())
+		self.assertEqual(
+			[item['item_title'] for item in second['items']], ['Cereals for breakfast'])
+		self.assertIsNone(second['next_cursor'])
+
+
+	def test_conditional_get_shoppinglists(self):
+		"""Test unchanged shoppinglists are answered with 304"""
+		self.register_user()
+		access_token = self.access_token()
+		self.client().post(
+			'/shoppinglists',
+			headers=dict(Authorization=access_token),
+			data=self.shoppinglist
+		)
+		response = self.client().get('/shoppinglists', headers=dict(Authorization=access_token))
+		self.assertEqual(response.status_code, 202)
+		etag = response.headers['ETag']
+		self.assertIn('Last-Modified', response.headers)
+		response = self.client().get('/shoppinglists', headers={
+			'Authorization': access_token, 'If-None-Match': etag})
+		self.assertEqual(response.status_code, 304)
+		self.assertEqual(response.data, b'')
+		self.assertEqual(response.headers['ETag'], etag)
+		response = self.client().get('/shoppinglists?limit=1', headers={
+			'Authorization': access_token, 'If-None-Match': etag})
+		self.assertEqual(response.status_code, 202)
+		self.client().post(
+			'/shoppinglists',
+			headers=dict(Authorization=access_token),
+			data={'title': 'Weekly groceries', 'description': 'Everything for the week'}
+		)
+		response = self.client().get('/shoppinglists', headers={
+			'Authorization': access_token, 'If-None-Match': etag})
+		self.assertEqual(response.status_code, 202)
+		self.assertEqual(len(json.loads(response.data.decode())['shoppinglists']), 2)
+
+	def test_conditional_get_after_renaming_older_row(self):
+		"""Test renaming a list or item that isn't the newest changes the collection's ETag"""
+		self.register_user()
+		headers = dict(Authorization=self.access_token())
+		shoppinglist_ids = []
+		for title in ('My favorite meal', 'Weekly groceries'):
+			response = self.client().post('/shoppinglists', headers=headers, data={
+				'title': title, 'description': 'Items to cook my favorite meal'})
+			shoppinglist_ids.append(json.loads(response.data.decode())['id'])
+		item_ids = []
+		for item_title in ('Vegetables', 'Fresh fruits'):
+			response = self.client().post(
+				'/shoppinglist/{0}/items'.format(shoppinglist_ids[0]), headers=headers,
+				data={'item_title': item_title, 'item_description': 'Carrots and Cabbages'})
+			item_ids.append(json.loads(response.data.decode())['item_id'])
+		lists_url = '/shoppinglists'
+		items_url = '/shoppinglist/{0}/items'.format(shoppinglist_ids[0])
+		etags = dict((url, self.client().get(url, headers=headers).headers['ETag'])
+			for url in (lists_url, items_url))
+		self.client().put(
+			'/shoppinglist/{0}'.format(shoppinglist_ids[0]), headers=headers,
+			data={'title': 'Monthly groceries', 'description': 'Everything for the month'})
+		self.client().put(
+			'/shoppinglist/{0}/item/{1}'.format(shoppinglist_ids[0], item_ids[0]), headers=headers,
+			data={'item_title': 'Green vegetables', 'item_description': 'Carrots and Cabbages'})
+		for url, title in ((lists_url, b'Monthly groceries'), (items_url, b'Green vegetables')):
+			response = self.client().get(url, headers=dict(headers, **{'If-None-Match': etags[url]}))
+			self.assertEqual(response.status_code, 202, url)
+			self.assertIn(title, response.data)
+			self.assertNotEqual(response.headers['ETag'], etags[url], url)
+
+	def test_conditional_get_single_shoppinglist_and_item(self):
+		"""Test an unchanged shoppinglist or item is answered with 304"""
+		self.register_user()
+		access_token = self.access_token()
+		response = self.client().post(
+			'/shoppinglists',
+			headers=dict(Authorization=access_token),
+			data=self.shoppinglist
+		)
+		shoppinglist_id = json.loads(response.data.decode())['id']
+		response = self.client().post(
+			'/shoppinglist/{0}/items'.format(shoppinglist_id),
+			headers=dict(Authorization=access_token),
+			data=self.shoppinglistitem
+		)
+		item_id = json.loads(response.data.decode())['item_id']
+		for url in ['/shoppinglist/{0}'.format(shoppinglist_id),
+				'/shoppinglist/{0}/items'.format(shoppinglist_id),
+				'/shoppinglist/{0}/item/{1}'.format(shoppinglist_id, item_id)]:
+			response = self.client().get(url, headers=dict(Authorization=access_token))
+			etag = response.headers['ETag']
+			response = self.client().get(url, headers={
+				'Authorization': access_token, 'If-None-Match': etag})
+			self.assertEqual(response.status_code, 304)
+			response = self.client().get(url, headers={
+				'Authorization': access_token, 'If-None-Match': '"stale"'})
+			self.assertNotEqual(response.status_code, 304)
+		response = self.client().get(
+			'/shoppinglist/{0}'.format(shoppinglist_id), headers=dict(Authorization=access_token))
+		etag = response.headers['ETag']
+		self.client().put(
+			'/shoppinglist/{0}'.format(shoppinglist_id),
+			headers=dict(Authorization=access_token),
+			data={'title': 'Weekly groceries', 'description': 'Everything for the week'}
+		)
+		response = self.client().get('/shoppinglist/{0}'.format(shoppinglist_id), headers={
+			'Authorization': access_token, 'If-None-Match': etag})
+		self.assertEqual(response.status_code, 201)
+		self.assertIn(b'Weekly groceries', response.data)
+
+	def test_sync_changes_since_version(self):
+		"""Test /sync only returns what changed after the client's version"""
+		self.register_user()
+		access_token = self.access_token()
+		response = self.client().post(
+			'/shoppinglists',
+			headers=dict(Authorization=access_token),
+			data=self.shoppinglist
+		)
+		shoppinglist_id = json.loads(response.data.decode())['id']
+		for item_title in ['Vegetables and fruits', 'Fresh milk and bread']:
+			self.client().post(
+				'/shoppinglist/{0}/items'.format(shoppinglist_id),
+				headers=dict(Authorization=access_token),
+				data={'item_title': item_title, 'item_description': 'From the market'}
+			)
+		response = self.client().get('/sync', headers=dict(Authorization=access_token))
+		self.assertEqual(response.status_code, 200)
+		full = json.loads(response.data.decode())
+		self.assertEqual(len(full['shoppinglists']), 1)
+		self.assertEqual(len(full['items']), 2)
+		self.assertEqual(full['deleted'], {'shoppinglists': [], 'items': []})
+		response = self.client().get(
+			'/sync?since={0}'.format(full['version']), headers=dict(Authorization=access_token))
+		unchanged = json.loads(response.data.decode())
+		self.assertEqual(unchanged['version'], full['version'])
+		self.assertEqual(unchanged['shoppinglists'] + unchanged['items'], [])
+		deleted_item, kept_item = full['items']
+		self.client().delete(
+			'/shoppinglist/{0}/item/{1}'.format(shoppinglist_id, deleted_item['item_id']),
+			headers=dict(Authorization=access_token))
+		self.client().put(
+			'/shoppinglist/{0}/item/{1}'.format(shoppinglist_id, kept_item['item_id']),
+			headers=dict(Authorization=access_token),
+			data={'item_title': 'Fresh milk and cheese', 'item_description': 'From the market'})
+		response = self.client().get(
+			'/sync?since={0}'.format(full['version']), headers=dict(Authorization=access_token))
+		delta = json.loads(response.data.decode())
+		self.assertGreater(delta['version'], full['version'])
+		self.assertEqual(delta['shoppinglists'], [])
+		self.assertEqual([item['item_title'] for item in delta['items']], ['Fresh milk and cheese'])
+		self.assertEqual(delta['deleted'], {'shoppinglists': [], 'items': [deleted_item['item_id']]})
+		self.client().patch(
+			'/shoppinglist/{0}/items'.format(shoppinglist_id),
+			headers=dict(Authorization=access_token),
+			data=json.dumps({'item_ids': [kept_item['item_id']], 'item_description': 'From the shop'}),
+			content_type='application/json')
+		self.client().delete(
+			'/shoppinglist/{0}'.format(shoppinglist_id), headers=dict(Authorization=access_token))
+		response = self.client().get(
+			'/sync?since={0}'.format(delta['version']), headers=dict(Authorization=access_token))
+		latest = json.loads(response.data.decode())
+		self.assertEqual([item['item_description'] for item in latest['items']], ['From the shop'])
+		self.assertEqual(latest['deleted']['shoppinglists'], [shoppinglist_id])
+		response = self.client().get('/sync?since=latest', headers=dict(Authorization=access_token))
+		self.assertEqual(response.status_code, 202)
+		self.assertIn(b'Since should be a version number', response.data)
+
+	def test_stream_shoppinglist_items(self):
+		"""Test a streamed collection returns every item past the page size"""
+		self.app.config['STREAM_CHUNK_SIZE'] = 2
+		self.register_user()
+		access_token = self.access_token()
+		response = self.client().post(
+			'/shoppinglists',
+			headers=dict(Authorization=access_token),
+			data=self.shoppinglist
+		)
+		shoppinglist_id = json.loads(response.data.decode())['id']
+		item_titles = ['Vegetables and fruits', 'Fresh milk and bread', 'Cereals for breakfast']
+		for item_title in item_titles:
+			self.client().post(
+				'/shoppinglist/{0}/items'.format(shoppinglist_id),
+				headers=dict(Authorization=access_token),
+				data={'item_title': item_title, 'item_description': 'From the market'}
+			)
+		response = self.client().get(
+			'/shoppinglist/{0}/items?limit=1&stream=true'.format(shoppinglist_id),
+			headers=dict(Authorization=access_token)
+		)
+		self.assertEqual(response.status_code, 202)
+		self.assertTrue(response.is_streamed)
+		self.assertIn('ETag', response.headers)
+		results = json.loads(response.data.decode())
+		self.assertEqual([item['item_title'] for item in results['items']], item_titles)
+		self.assertIsNone(results['next_cursor'])
+		response = self.client().get(
+			'/shoppinglists?stream=true', headers=dict(Authorization=access_token))
+		self.assertEqual(len(json.loads(response.data.decode())['shoppinglists']), 1)
+
+	def test_search_lists_and_items(self):
+		"""Test /search ranks title matches first and pages through results"""
+		self.register_user()
+		access_token = self.access_token()
+		response = self.client().post(
+			'/shoppinglists',
+			headers=dict(Authorization=access_token),
+			data={'title': 'Weekend market', 'description': 'Fresh vegetables for the week'}
+		)
+		shoppinglist_id = json.loads(response.data.decode())['id']
+		for item_title, item_description in [
+				('Vegetables', 'Carrots and cabbages'),
+				('Fruit basket', 'Apples, and vegetables for soup'),
+				('Bread and butter', 'Whole grain loaf')]:
+			self.client().post(
+				'/shoppinglist/{0}/items'.format(shoppinglist_id),
+				headers=dict(Authorization=access_token),
+				data={'item_title': item_title, 'item_description': item_description}
+			)
+		response = self.client().get('/search?q=Vegetables', headers=dict(Authorization=access_token))
+		self.assertEqual(response.status_code, 200)
+		data = json.loads(response.data.decode())
+		self.assertEqual(
+			[(result['kind'], result['title']) for result in data['results']],
+			[('shoppinglistitem', 'Vegetables'), ('shoppinglist', 'Weekend market'), ('shoppinglistitem', 'Fruit basket')])
+		self.assertEqual(data['results'][0]['shoppinglist_id'], shoppinglist_id)
+		self.assertIsNone(data['results'][1]['shoppinglist_id'])
+		self.assertIsNone(data['next_cursor'])
+		# Every word has to match
+		response = self.client().get('/search?q=vegetables+soup', headers=dict(Authorization=access_token))
+		self.assertEqual([result['title'] for result in json.loads(response.data.decode())['results']], ['Fruit basket'])
+		response = self.client().get('/search?q=vegetables&limit=2', headers=dict(Authorization=access_token))
+		first = json.loads(response.data.decode())
+		self.assertEqual(len(first['results']), 2)
+		response = self.client().get(
+			'/search?q=vegetables&limit=2&cursor={0}'.format(first['next_cursor']),
+			headers=dict(Authorization=access_token))
+		second = json.loads(response.data.decode())
+		self.assertEqual([result['title'] for result in second['results']], ['Fruit basket'])
+		self.assertIsNone(second['next_cursor'])
+		# LIKE wildcards are matched literally
+		response = self.client().get('/search?q=%25', headers=dict(Authorization=access_token))
+		self.assertEqual(json.loads(response.data.decode())['results'], [])
+		response = self.client().get('/search?q=veg_tables', headers=dict(Authorization=access_token))
+		self.assertEqual(json.loads(response.data.decode())['results'], [])
+		response = self.client().get('/search?q=', headers=dict(Authorization=access_token))
+		self.assertEqual(response.status_code, 202)
+		self.assertEqual(json.loads(response.data.decode())['message'], "Search query can't be empty")
+
+	def test_search_scoped_to_owner(self):
+		"""Test /search never returns another user's lists"""
+		self.register_user()
+		self.client().post(
+			'/shoppinglists',
+			headers=dict(Authorization=self.access_token()),
+			data=self.shoppinglist
+		)
+		self.client().post('/auth/register', data={
+			'username': 'Runner',
+			'email': 'runner@test.com',
+			'password': 'secret',
+			'confirm_password': 'secret'
+		})
+		res = self.login_user(email='runner@test.com')
+		other_access_token = "Bearer " + json.loads(res.data.decode())['token']
+		response = self.client().get('/search?q=meal', headers=dict(Authorization=other_access_token))
+		self.assertEqual(json.loads(response.data.decode())['results'], [])
+
+	def test_batch_create_shoppinglistitems(self):
+		"""Test a user can add many items to a shoppinglist at once"""
+		self.register_user()
+		access_token = self.access_token()
+		response = self.client().post(
+			'/shoppinglists',
+			headers=dict(Authorization=access_token),
+			data=self.shoppinglist
+		)
+		results = json.loads(response.data.decode())
+		self.client().post(
+			'/shoppinglist/{0}/items'.format(results['id']),
+			headers=dict(Authorization=access_token),
+			data=self.shoppinglistitem
+		)
+		statements = []
+		def record(conn, cursor, statement, *args):
+			statements.append(statement)
+		with self.app.app_context():
+			engine = db.get_engine(self.app)
+		event.listen(engine, 'before_cursor_execute', record)
+		try:
+			batch = self.client().post(
+				'/shoppinglist/{0}/items/batch'.format(results['id']),
+				headers=dict(Authorization=access_token),
+				data=json.dumps([
+					{'item_title': 'Fresh milk and bread', 'item_description': 'From the bakery'},
+					{'item_title': 'Meat', 'item_description': 'From the butcher'},
+					{'item_title': 'Vegetables', 'item_description': 'Carrots and Cabbages'},
+					{'item_title': 'Cereals for breakfast', 'item_description': 'Oats and cornflakes'},
+					{'item_title': 'Fresh milk and bread', 'item_description': 'Again'}
+				]),
+				content_type='application/json'
+			)
+		finally:
+			event.remove(engine, 'before_cursor_execute', record)
+		self.assertEqual(batch.status_code, 201)
+		batch_results = json.loads(batch.data.decode())
+		self.assertEqual(batch_results['created'], 2)
+		self.assertEqual(batch_results['failed'], 3)
+		statuses = [result['status'] for result in batch_results['results']]
+		self.assertEqual(statuses, ['success', 'fail', 'fail', 'success', 'fail'])
+		self.assertIn('Value should be more than 10 characters', batch_results['results'][1]['message'])
+		self.assertEqual(
+			batch_results['results'][2]['message'], 'Shopping List item Vegetables already exists')
+		# Every new item is inserted by a single statement
+		inserts = [s for s in statements if s.startswith('INSERT INTO shoppinglistitems')]
+		self.assertEqual(len(inserts), 1)
+		get_items = self.client().get(
+			'/shoppinglist/{0}/items'.format(results['id']),
+			headers=dict(Authorization=access_token)
+		)
+		self.assertEqual(len(json.loads(get_items.data.decode())['items']), 3)
+		# Test the body has to be a list of items
+		invalid_batch = self.client().post(
+			'/shoppinglist/{0}/items/batch'.format(results['id']),
+			headers=dict(Authorization=access_token),
+			data=json.dumps({'item_title': 'Fresh milk and bread'}),
+			content_type='application/json'
+		)
+		self.assertIn(b'Expected a JSON array of items', invalid_batch.data)
+		self.assertEqual(invalid_batch.status_code, 202)
+
+
+	def test_bulk_update_and_delete_shoppinglistitems(self):
+		"""Test a user can update and delete many items at once"""
+		self.register_user()
+		access_token = self.access_token()
+		response = self.client().post(
+			'/shoppinglists',
+			headers=dict(Authorization=access_token),
+			data=self.shoppinglist
+		)
+		results = json.loads(response.data.decode())
+		batch = self.client().post(
+			'/shoppinglist/{0}/items/batch'.format(results['id']),
+			headers=dict(Authorization=access_token),
+			data=json.dumps([
+				{'item_title': 'Fresh milk and bread', 'item_description': 'From the bakery'},
+				{'item_title': 'Fresh fish from the lake', 'item_description': 'From the market'},
+				{'item_title': 'Cereals for breakfast', 'item_description': 'Oats and cornflakes'}
+			]),
+			content_type='application/json'
+		)
+		item_ids = [result['item_id'] for result in json.loads(batch.data.decode())['results']]
+		update_resp = self.client().patch(
+			'/shoppinglist/{0}/items'.format(results['id']),
+			headers=dict(Authorization=access_token),
+			data=json.dumps({'item_ids': item_ids[:2], 'item_description': 'Already bought'}),
+			content_type='application/json'
+		)
+		self.assertEqual(update_resp.status_code, 200)
+		self.assertEqual(json.loads(update_resp.data.decode())['updated'], 2)
+		get_item = self.client().get(
+			'/shoppinglist/{0}/item/{1}'.format(results['id'], item_ids[1]),
+			headers=dict(Authorization=access_token)
+		)
+		self.assertIn(b'Already bought', get_item.data)
+		# Test another user's token doesn't reach these items
+		self.client().post('/auth/register', data={
+			'username': 'Rocky',
+			'email': 'balboa@test.com',
+			'password': 'secret',
+			'confirm_password': 'secret'
+		})
+		other_token = "Bearer " + json.loads(self.login_user(email='balboa@test.com').data.decode())['token']
+		other_delete = self.client().delete(
+			'/shoppinglist/{0}/items'.format(results['id']),
+			headers=dict(Authorization=other_token),
+			data=json.dumps({'filter': {}}),
+			content_type='application/json'
+		)
+		self.assertEqual(json.loads(other_delete.data.decode())['deleted'], 0)
+		delete_resp = self.client().delete(
+			'/shoppinglist/{0}/items'.format(results['id']),
+			headers=dict(Authorization=access_token),
+			data=json.dumps({'filter': {'item_title': 'fresh'}}),
+			content_type='application/json'
+		)
+		self.assertEqual(delete_resp.status_code, 200)
+		self.assertEqual(json.loads(delete_resp.data.decode())['deleted'], 2)
+		get_items = self.client().get(
+			'/shoppinglist/{0}/items'.format(results['id']),
+			headers=dict(Authorization=access_token)
+		)
+		self.assertEqual(
+			[item['item_title'] for item in json.loads(get_items.data.decode())['items']],
+			['Cereals for breakfast'])
+		# Test a selection is required
+		invalid_delete = self.client().delete(
+			'/shoppinglist/{0}/items'.format(results['id']),
+			headers=dict(Authorization=access_token),
+			data=json.dumps({}),
+			content_type='application/json'
+		)
+		self.assertIn(b'Provide item_ids or a filter', invalid_delete.data)
+		self.assertEqual(invalid_delete.status_code, 202)
+		invalid_update = self.client().patch(
+			'/shoppinglist/{0}/items'.format(results['id']),
+			headers=dict(Authorization=access_token),
+			data=json.dumps({'item_ids': item_ids, 'item_description': 'Short'}),
+			content_type='application/json'
+		)
+		self.assertIn(b'Value should be more than 10 characters', invalid_update.data)
+		self.assertEqual(invalid_update.status_code, 202)
+
+
+	def test_parsers_built_once(self):
+		"""Test handling requests doesn't add arguments to the parsers"""
+		from app.resources import register_parser, login_parser
+		self.register_user()
+		for _ in range(3):
+			self.login_user()
+		self.assertEqual(len(register_parser.args), 4)
+		self.assertEqual(len(login_parser.args), 2)
+
+
 	def tearDown(self):
 	    """teardown all initialized variables."""
 	    with self.app.app_context():
@@ -0,0 +1,217 @@
+import unittest
+import asyncio
+import json
+import os
+import tempfile
+from unittest import mock
+from sqlalchemy import create_engine
+from urllib.parse import urlencode
+from app.app import create_app, db
+try:
+	import aiosqlite
+	from app.asgi import AsyncAPI
+except ImportError:
+	# Not installed unless requirements-asgi.txt is
+	AsyncAPI = None
+
+@unittest.skipIf(AsyncAPI is None, 'requirements-asgi.txt is not installed')
+class AsyncAPITestCase(unittest.TestCase):
+	"""Test the ASGI app answers as the Flask app does"""
+
+	def setUp(self):
+		self.app = create_app(config_name="testing")
+		self.asgi = AsyncAPI(self.app)
+		self.client = self.app.test_client
+		self.loop = asyncio.new_event_loop()
+		with self.app.app_context():
+			db.create_all()
+
+	def call(self, method, path, headers=None, data=None):
+		"""(status, headers, body) of a request sent through the ASGI app"""
+		path, _, query = path.partition('?')
+		headers = dict(headers or {})
+		body = b''
+		if data is not None:
+			body = urlencode(data).encode()
+			headers['Content-Type'] = 'application/x-www-form-urlencoded'
+			headers['Content-Length'] = str(len(body))
+		scope = {
+			'type': 'http',
+			'http_version': '1.1',
+			'method': method,
+			'scheme': 'http',
+			'path': path,
+			'root_path': '',
+			'query_string': query.encode(),
+			'headers': [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+			'server': ('localhost', 80),
+			'client': ('127.0.0.1', 5000),
+		}
+		messages = []
+
+		async def receive():
+			return {'type': 'http.request', 'body': body, 'more_body': False}
+
+		async def send(message):
+			messages.append(message)
+		self.loop.run_until_complete(self.asgi(scope, receive, send))
+		response_headers = dict((name.decode().lower(), value.decode())
+			for name, value in messages[0]['headers'])
+		return messages[0]['status'], response_headers, b''.join(
+			message.get('body', b'') for message in messages[1:])
+
+	def access_token(self):
+		self.call('POST', '/auth/register', data={
+			'username': 'Stallion',
+			'email': 'rocky@test.com',
+			'password': 'secret',
+			'confirm_password': 'secret'
+		})
+		status, _, body = self.call('POST', '/auth/login', data={'email': 'rocky@test.com', 'password': 'secret'})
+		self.assertEqual(status, 200)
+		return "Bearer " + json.loads(body.decode())['token']
+
+	def assert_same(self, path, headers):
+		"""Test a GET is answered natively with the Flask app's response"""
+		cache = self.app.extensions['response_cache']
+		with mock.patch.object(self.asgi, 'wsgi', side_effect=AssertionError('not native')):
+			status, asgi_headers, body = self.call('GET', path, headers)
+		cache.backend.entries.clear()
+		response = self.client().get(path, headers=headers)
+		cache.backend.entries.clear()
+		self.assertEqual(status, response.status_code, path)
+		self.assertEqual(body, response.get_data(), path)
+		self.assertEqual(asgi_headers.get('etag'), response.headers.get('ETag'), path)
+		self.assertEqual(asgi_headers.get('last-modified'), response.headers.get('Last-Modified'), path)
+		self.assertEqual(asgi_headers['content-type'], response.headers['Content-Type'], path)
+		return status, asgi_headers, body
+
+	def test_reads_match_flask(self):
+		"""Test the async handlers return the Flask handlers' status, body and validators"""
+		access_token = self.access_token()
+		headers = dict(Authorization=access_token)
+		self.assert_same('/shoppinglists', headers)
+		for title in ('My favorite meal', 'Weekly groceries'):
+			status, _, _ = self.call('POST', '/shoppinglists', headers, data={
+				'title': title, 'description': 'Items to cook my favorite meal'})
+			self.assertEqual(status, 201)
+		self.assert_same('/shoppinglist/1/items', headers)
+		for item_title in ('Vegetables', 'Fresh fruits'):
+			self.call('POST', '/shoppinglist/1/items', headers, data={
+				'item_title': item_title, 'item_description': 'Carrots and Cabbages'})
+		self.assert_same('/', {})
+		self.assert_same('/shoppinglists', headers)
+		_, _, body = self.assert_same('/shoppinglists?limit=1', headers)
+		next_cursor = json.loads(body.decode())['next_cursor']
+		_, _, body = self.assert_same('/shoppinglists?limit=1&cursor=' + next_cursor, headers)
+		self.assertEqual(json.loads(body.decode())['shoppinglists'][0]['title'], 'Weekly groceries')
+		self.assert_same('/shoppinglists?cursor=garbage', headers)
+		# 10**18 microseconds is past datetime.max
+		self.assert_same('/shoppinglists?cursor=WzEwMDAwMDAwMDAwMDAwMDAwMDAsIDFd', headers)
+		self.assert_same('/shoppinglists?limit=0', headers)
+		self.assert_same('/shoppinglist/1', headers)
+		self.assert_same('/shoppinglist/99', headers)
+		_, _, body = self.assert_same('/shoppinglist/1/items?limit=1', headers)
+		next_cursor = json.loads(body.decode())['next_cursor']
+		self.assert_same('/shoppinglist/1/items?limit=1&cursor=' + next_cursor, headers)
+		self.assert_same('/shoppinglist/1/item/1', headers)
+		self.assert_same('/shoppinglist/1/item/99', headers)
+
+	def test_auth_errors_match_flask(self):
+		"""Test missing, invalid and logged out tokens are refused as by the Flask app"""
+		access_token = self.access_token()
+		self.assert_same('/shoppinglists', {})
+		self.assert_same('/shoppinglists', dict(Authorization='Bearer invalid'))
+		status, _, _ = self.call('POST', '/auth/logout', dict(Authorization=access_token))
+		self.assertEqual(status, 200)
+		status, _, body = self.assert_same('/shoppinglists', dict(Authorization=access_token))
+		self.assertEqual(status, 403)
+		self.assertIn(b'Token created. Please log in again.', body)
+
+	def test_cached_and_not_modified(self):
+		"""Test responses are cached and revalidated with the Flask app's validators"""
+		headers = dict(Authorization=self.access_token())
+		self.call('POST', '/shoppinglists', headers, data={
+			'title': 'My favorite meal', 'description': 'Items to cook my favorite meal'})
+		status, response_headers, body = self.call('GET', '/shoppinglists', headers)
+		self.assertEqual(status, 202)
+		self.assertIn('app;dur=', response_headers['server-timing'])
+		self.assertIn('desc="2 queries"', response_headers['server-timing'])
+		# Served from the cache the async handler filled
+		response = self.client().get('/shoppinglists', headers=headers)
+		self.assertEqual(response.get_data(), body)
+		self.assertIn('db;dur=0.00;desc="0 queries"', response.headers['Server-Timing'])
+		status, _, body = self.call('GET', '/shoppinglists', dict(
+			headers, **{'If-None-Match': response_headers['etag']}))
+		self.assertEqual((status, body), (304, b''))
+		self.app.extensions['response_cache'].backend.entries.clear()
+		status, _, _ = self.call('GET', '/shoppinglists', dict(
+			headers, **{'If-None-Match': response_headers['etag']}))
+		self.assertEqual(status, 304)
+		stats = self.app.extensions['request_metrics'].stats()
+		self.assertEqual(stats[('/shoppinglists', 'GET')]['status'], {202: 2, 304: 2})
+
+	def test_stream_and_writes_through_flask(self):
+		"""Test streamed reads and writes are answered by the Flask app"""
+		headers = dict(Authorization=self.access_token())
+		status, _, body = self.call('POST', '/shoppinglists', headers, data={
+			'title': 'My favorite meal', 'description': 'Items to cook my favorite meal'})
+		self.assertEqual(status, 201)
+		self.assertIn(b'Shopping List created successfuly', body)
+		status, _, body = self.call('GET', '/shoppinglists?stream=true', headers)
+		self.assertEqual(status, 202)
+		self.assertEqual(len(json.loads(body.decode())['shoppinglists']), 1)
+		status, _, body = self.call('GET', '/metrics')
+		self.assertEqual(status, 200)
+		self.assertIn(b'http_requests_total{route="/shoppinglists",method="POST",status="201"} 1', body)
+
+	def test_reads_from_replica(self):
+		"""Test the async handlers read from a replica and don't cache what they read there"""
+		handle, replica_path = tempfile.mkstemp(suffix='.db')
+		os.close(handle)
+		self.addCleanup(os.remove, replica_path)
+		replica = create_engine('sqlite:///' + replica_path)
+		self.addCleanup(replica.dispose)
+		# Stands in for replication of the schema
+		db.Model.metadata.create_all(bind=replica)
+		self.app.config['SQLALCHEMY_REPLICA_URIS'] = ['sqlite:///' + replica_path]
+		self.asgi.executor.shutdown()
+		self.asgi = AsyncAPI(self.app)
+		headers = dict(Authorization=self.access_token())
+		self.call('POST', '/shoppinglists', headers, data={
+			'title': 'My favorite meal', 'description': 'Items to cook my favorite meal'})
+		status, _, body = self.call('GET', '/shoppinglists', headers)
+		self.assertEqual(status, 200)
+		self.assertIn(b"You don't have any shoppinglists", body)
+		entries = self.app.extensions['response_cache'].backend.entries.values()
+		self.assertFalse(any(entry['variants'] for entry in entries))
+		# A revocation the replica hasn't got is still honoured
+		other_app = create_app(config_name="testing")
+		other_app.test_client().post('/auth/logout', headers=headers)
+		self.app.extensions['revoked_tokens'].refreshed_at = 0
+		status, _, body = self.call('GET', '/shoppinglists', headers)
+		self.assertEqual(status, 403)
+		self.assertIn(b'Token created. Please log in again.', body)
+
+	def test_lifespan(self):
+		"""Test the database is opened on startup and closed on shutdown"""
+		messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+		sent = []
+
+		async def receive():
+			return messages.pop(0)
+
+		async def send(message):
+			sent.append(message['type'])
+		self.loop.run_until_complete(self.asgi({'type': 'lifespan'}, receive, send))
+		self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+		self.assertFalse(self.asgi.database.primary.opened)
+
+	def tearDown(self):
+		"""teardown all initialized variables."""
+		self.loop.run_until_complete(self.asgi.database.close())
+		self.loop.close()
+		self.asgi.executor.shutdown()
+		with self.app.app_context():
+			db.session.remove()
+			db.drop_all()
@@ -0,0 +1,75 @@
+import unittest
+import json
+import time
+from app.app import create_app, db
+
+class TokenVerifierTestCase(unittest.TestCase):
+	"""Test verified token claims are cached"""
+
+	def setUp(self):
+		self.app = create_app(config_name="testing")
+		self.client = self.app.test_client
+		self.verifier = self.app.extensions['token_verifier']
+		self.user = {
+			'username': 'Stallion',
+			'email': 'rocky@test.com',
+			'password': 'secret',
+			'confirm_password': 'secret'
+		}
+		with self.app.app_context():
+			db.create_all()
+
+	def access_token(self):
+		self.client().post('/auth/register', data=self.user)
+		res = self.client().post('/auth/login', data={
+			'email': self.user['email'],
+			'password': self.user['password']
+		})
+		return "Bearer " + json.loads(res.data.decode())['token']
+
+	def test_claims_cached(self):
+		"""Test a token's signature is only verified on its first use"""
+		access_token = self.access_token()
+		for _ in range(3):
+			response = self.client().get('/shoppinglists', headers=dict(Authorization=access_token))
+			self.assertEqual(response.status_code, 200)
+		self.assertEqual(self.verifier.stats(), {'hits': 2, 'misses': 1, 'size': 1})
+
+	def test_tampered_token_not_cached(self):
+		"""Test a modified token is verified again and rejected"""
+		access_token = self.access_token()
+		self.client().get('/shoppinglists', headers=dict(Authorization=access_token))
+		response = self.client().get('/shoppinglists', headers=dict(Authorization=access_token + 'x'))
+		self.assertIn(b"Invalid token. Please log in again.", response.data)
+		self.assertEqual(self.verifier.stats()['size'], 1)
+
+	def test_revocation_honored(self):
+		"""Test a cached token is rejected once logged out"""
+		access_token = self.access_token()
+		self.client().get('/shoppinglists', headers=dict(Authorization=access_token))
+		self.client().post('/auth/logout', headers=dict(Authorization=access_token))
+		response = self.client().get('/shoppinglists', headers=dict(Authorization=access_token))
+		self.assertIn(b"Token created. Please log in again.", response.data)
+		self.assertEqual(response.status_code, 403)
+
+	def test_expired_claims_dropped(self):
+		"""Test cached claims aren't served past the token's exp"""
+		access_token = self.access_token()
+		self.client().get('/shoppinglists', headers=dict(Authorization=access_token))
+		for payload in self.verifier.claims.values():
+			payload['exp'] = int(time.time()) - 1
+		self.client().get('/shoppinglists', headers=dict(Authorization=access_token))
+		self.assertEqual(self.verifier.stats()['misses'], 2)
+
+	def test_cache_bounded(self):
+		"""Test the cache holds at most VERIFIED_TOKEN_CACHE_SIZE tokens"""
+		self.verifier.max_size = 1
+		for _ in range(3):
+			self.client().get('/shoppinglists', headers=dict(Authorization=self.access_token()))
+		self.assertEqual(self.verifier.stats()['size'], 1)
+
+	def tearDown(self):
+		"""teardown all initialized variables."""
+		with self.app.app_context():
+			db.session.remove()
+			db.drop_all()
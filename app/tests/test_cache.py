@@ -0,0 +1,198 @@
+import unittest
+import json
+import threading
+from unittest import mock
+from app.app import create_app, db
+from app.cache import LRUCacheBackend, ResponseCache
+
+class DictCacheBackend(object):
+	"""Stand-in backend without eviction"""
+
+	def __init__(self, app):
+		self.entries = {}
+
+	def get(self, key):
+		return self.entries.get(key)
+
+	def set(self, key, value):
+		self.entries[key] = value
+
+	def delete(self, key):
+		self.entries.pop(key, None)
+
+	def update(self, key, function):
+		value = function(self.entries.get(key))
+		if value is None:
+			self.entries.pop(key, None)
+		else:
+			self.entries[key] = value
+		return value
+
+	def stats(self):
+		return {'size': len(self.entries), 'evictions': 0}
+
+class ResponseCacheTestCase(unittest.TestCase):
+	"""Test read responses are cached and dropped on writes"""
+
+	def setUp(self):
+		self.app = create_app(config_name="testing")
+		self.client = self.app.test_client
+		self.cache = self.app.extensions['response_cache']
+		self.user = {
+			'username': 'Stallion',
+			'email': 'rocky@test.com',
+			'password': 'secret',
+			'confirm_password': 'secret'
+		}
+		self.shoppinglist = {
+			'title': "My favorite meal",
+			'description': 'Items to cook my favorite meal'
+		}
+		with self.app.app_context():
+			db.create_all()
+
+	def access_token(self):
+		self.client().post('/auth/register', data=self.user)
+		res = self.client().post('/auth/login', data={
+			'email': self.user['email'],
+			'password': self.user['password']
+		})
+		return "Bearer " + json.loads(res.data.decode())['token']
+
+	def test_lru_backend_evicts(self):
+		"""Test the default backend keeps the most recently used scopes"""
+		backend = LRUCacheBackend(2)
+		backend.set('a', {'': 1})
+		backend.set('b', {'': 2})
+		backend.get('a')
+		backend.set('c', {'': 3})
+		self.assertIsNone(backend.get('b'))
+		self.assertEqual(backend.get('a'), {'': 1})
+		self.assertEqual(backend.stats(), {'size': 2, 'evictions': 1, 'expirations': 0})
+
+	def test_lru_backend_expires(self):
+		"""Test the default backend drops entries RESPONSE_CACHE_TTL seconds after storing them"""
+		backend = LRUCacheBackend(2, ttl=60)
+		with mock.patch('app.cache.time.monotonic', return_value=1000):
+			backend.set('a', {'': 1})
+		with mock.patch('app.cache.time.monotonic', return_value=1059):
+			self.assertEqual(backend.get('a'), {'': 1})
+		with mock.patch('app.cache.time.monotonic', return_value=1060):
+			self.assertIsNone(backend.get('a'))
+			self.assertIsNone(backend.update('a', lambda value: value))
+		self.assertEqual(backend.stats(), {'size': 0, 'evictions': 0, 'expirations': 1})
+
+	def test_off_with_several_processes(self):
+		"""Test the in-process backend keeps nothing when other processes could serve stale responses"""
+		self.app.config['APP_PROCESSES'] = 2
+		with self.assertLogs('app.cache', 'WARNING'):
+			cache = ResponseCache(self.app)
+		cache.set('shoppinglists:1', '', cache.version('shoppinglists:1'), b'{}', 200, 'etag')
+		self.assertIsNone(cache.get('shoppinglists:1'))
+
+	def test_stale_read_not_stored(self):
+		"""Test a response read before a write isn't cached after it"""
+		version = self.cache.version('shoppinglists:1')
+		self.cache.invalidate('shoppinglists:1')
+		self.cache.set('shoppinglists:1', '', version, b'{}', 200, 'etag')
+		self.assertIsNone(self.cache.get('shoppinglists:1'))
+		self.cache.set('shoppinglists:1', '', self.cache.version('shoppinglists:1'), b'{}', 200, 'etag')
+		self.assertIsNotNone(self.cache.get('shoppinglists:1'))
+		version = self.cache.version('shoppinglists:1')
+		self.cache.invalidate('shoppinglists:1', '')
+		self.cache.set('shoppinglists:1', '', version, b'{}', 200, 'etag')
+		self.assertIsNone(self.cache.get('shoppinglists:1'))
+
+	def test_invalidate_waits_for_store(self):
+		"""Test an invalidation racing a store lands after it and drops it"""
+		scope = 'shoppinglists:1'
+		version = self.cache.version(scope)
+		backend = self.cache.backend
+		update = backend.update
+		invalidations = []
+
+		def racing_update(key, function):
+			def decide(entry):
+				value = function(entry)
+				if not invalidations:
+					# A write commits right after the version was checked
+					invalidation = threading.Thread(target=self.cache.invalidate, args=(scope,))
+					invalidations.append(invalidation)
+					invalidation.start()
+					invalidation.join(0.2)
+				return value
+			return update(key, decide)
+		backend.update = racing_update
+		self.cache.set(scope, '', version, b'{}', 200, 'etag')
+		invalidations[0].join()
+		self.assertIsNone(self.cache.get(scope))
+		self.assertEqual(self.cache.stats()['invalidations'], 1)
+
+	def test_collection_cached_until_write(self):
+		"""Test repeated reads are served from the cache until a write"""
+		access_token = self.access_token()
+		self.client().post(
+			'/shoppinglists',
+			headers=dict(Authorization=access_token),
+			data=self.shoppinglist
+		)
+		first = self.client().get('/shoppinglists', headers=dict(Authorization=access_token))
+		second = self.client().get('/shoppinglists', headers=dict(Authorization=access_token))
+		self.assertEqual(second.status_code, 202)
+		self.assertEqual(first.data, second.data)
+		self.assertEqual(first.headers['ETag'], second.headers['ETag'])
+		stats = self.cache.stats()
+		self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+		self.assertEqual(stats['hit_rate'], 0.5)
+		response = self.client().get('/shoppinglists', headers={
+			'Authorization': access_token, 'If-None-Match': first.headers['ETag']})
+		self.assertEqual(response.status_code, 304)
+		shoppinglist_id = json.loads(first.data.decode())['shoppinglists'][0]['id']
+		self.client().put(
+			'/shoppinglist/{0}'.format(shoppinglist_id),
+			headers=dict(Authorization=access_token),
+			data={'title': 'Weekly groceries', 'description': 'Everything for the week'}
+		)
+		response = self.client().get('/shoppinglists', headers=dict(Authorization=access_token))
+		self.assertIn(b'Weekly groceries', response.data)
+
+	def test_single_item_dropped_on_bulk_update(self):
+		"""Test bulk item writes drop the cached items of the list"""
+		access_token = self.access_token()
+		response = self.client().post(
+			'/shoppinglists',
+			headers=dict(Authorization=access_token),
+			data=self.shoppinglist
+		)
+		shoppinglist_id = json.loads(response.data.decode())['id']
+		response = self.client().post(
+			'/shoppinglist/{0}/items'.format(shoppinglist_id),
+			headers=dict(Authorization=access_token),
+			data={'item_title': 'Vegetables and fruits', 'item_description': 'From the market'}
+		)
+		item_id = json.loads(response.data.decode())['item_id']
+		url = '/shoppinglist/{0}/item/{1}'.format(shoppinglist_id, item_id)
+		self.client().get(url, headers=dict(Authorization=access_token))
+		self.client().patch(
+			'/shoppinglist/{0}/items'.format(shoppinglist_id),
+			headers=dict(Authorization=access_token),
+			data=json.dumps({'item_ids': [item_id], 'item_description': 'From the shop'}),
+			content_type='application/json')
+		response = self.client().get(url, headers=dict(Authorization=access_token))
+		self.assertIn(b'From the shop', response.data)
+		self.assertEqual(self.cache.stats()['hits'], 0)
+		self.client().get(url, headers=dict(Authorization=access_token))
+		self.assertEqual(self.cache.stats()['hits'], 1)
+
+	def test_pluggable_backend(self):
+		"""Test RESPONSE_CACHE_BACKEND replaces the default LRU"""
+		self.app.config['RESPONSE_CACHE_BACKEND'] = DictCacheBackend
+		cache = ResponseCache(self.app)
+		self.assertIsInstance(cache.backend, DictCacheBackend)
+		self.assertIs(self.app.extensions['response_cache'], cache)
+
+	def tearDown(self):
+		"""teardown all initialized variables."""
+		with self.app.app_context():
+			db.session.remove()
+			db.drop_all()
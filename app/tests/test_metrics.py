@@ -0,0 +1,128 @@
+import unittest
+import json
+from flask import g
+from sqlalchemy.exc import OperationalError
+from app.app import create_app, db
+from app.metrics import RequestTimer
+
+class RequestMetricsTestCase(unittest.TestCase):
+	"""Test requests are timed, their queries counted and exported"""
+
+	def setUp(self):
+		self.app = create_app(config_name="testing")
+		self.client = self.app.test_client
+		self.metrics = self.app.extensions['request_metrics']
+		self.user = {
+			'username': 'Stallion',
+			'email': 'rocky@test.com',
+			'password': 'secret',
+			'confirm_password': 'secret'
+		}
+		with self.app.app_context():
+			db.create_all()
+
+	def access_token(self):
+		self.client().post('/auth/register', data=self.user)
+		res = self.client().post('/auth/login', data={
+			'email': self.user['email'],
+			'password': self.user['password']
+		})
+		return "Bearer " + json.loads(res.data.decode())['token']
+
+	def test_server_timing(self):
+		"""Test responses report their wall and database time"""
+		response = self.client().get('/')
+		self.assertRegex(response.headers['Server-Timing'], r'^app;dur=[\d.]+, db;dur=0.00;desc="0 queries"$')
+		response = self.client().get('/shoppinglists', headers=dict(Authorization=self.access_token()))
+		self.assertRegex(response.headers['Server-Timing'], r'db;dur=[\d.]+;desc="[1-9]\d* queries"$')
+
+	def test_queries_counted_per_route(self):
+		"""Test each route's requests and statements are totalled"""
+		access_token = self.access_token()
+		response = self.client().post(
+			'/shoppinglists',
+			headers=dict(Authorization=access_token),
+			data={'title': 'My favorite meal', 'description': 'Items to cook my favorite meal'}
+		)
+		shoppinglist_id = json.loads(response.data.decode())['id']
+		for title in ['Weekly groceries', 'Monthly groceries']:
+			self.client().put(
+				'/shoppinglist/{0}'.format(shoppinglist_id),
+				headers=dict(Authorization=access_token),
+				data={'title': title, 'description': 'Everything for the week'}
+			)
+		stats = self.metrics.stats()
+		route = stats[('/shoppinglist/<int:shoppinglist_id>', 'PUT')]
+		self.assertEqual(route['count'], 2)
+		self.assertEqual(route['status'], {200: 2})
+		self.assertGreater(route['queries'], 0)
+		self.assertEqual(route['queries'] % 2, 0)
+		self.assertEqual(stats[('/auth/register', 'POST')]['count'], 1)
+		self.assertLessEqual(sum(route['buckets']), route['count'])
+
+	def test_slow_requests_logged(self):
+		"""Test requests over the threshold are logged with their statements"""
+		self.metrics.slow_seconds = 0
+		with self.assertLogs('app.metrics', 'WARNING') as logs:
+			self.client().get('/shoppinglists', headers=dict(Authorization=self.access_token()))
+		self.assertIn('Slow request GET /shoppinglists', logs.output[-1])
+		self.assertIn('SELECT', logs.output[-1])
+
+	def test_prometheus_endpoint(self):
+		"""Test /metrics exports route totals and extension counters"""
+		self.client().get('/shoppinglists', headers=dict(Authorization=self.access_token()))
+		response = self.client().get('/metrics')
+		self.assertEqual(response.status_code, 200)
+		self.assertTrue(response.content_type.startswith('text/plain'))
+		body = response.data.decode()
+		self.assertIn('http_requests_total{route="/shoppinglists",method="GET",status="200"} 1', body)
+		self.assertIn('http_request_duration_seconds_bucket{route="/shoppinglists",method="GET",le="+Inf"} 1', body)
+		self.assertIn('http_request_duration_seconds_count{route="/auth/login",method="POST"} 1', body)
+		self.assertRegex(body, r'http_request_queries_total\{route="/shoppinglists",method="GET"\} [1-9]')
+		for name in ['token_verifier_cache_misses_total', 'revoked_tokens_lookups_total',
+				'token_sweeper_runs_total', 'response_cache_misses_total',
+				'password_check_seconds_sum{cost="4"} ',
+				'password_check_seconds_count{cost="4"} 1']:
+			self.assertIn(name, body)
+		self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+
+	def test_failed_statement_timing(self):
+		"""Test a statement that raises doesn't leave its start time behind"""
+		with self.app.test_request_context():
+			g.request_timer = timer = RequestTimer()
+			with db.get_engine(self.app).connect() as connection:
+				with self.assertRaises(OperationalError):
+					connection.execute('SELECT * FROM no_such_table')
+				self.assertEqual(connection.info['query_started'], [])
+				connection.execute('SELECT 1')
+				self.assertEqual(connection.info['query_started'], [])
+		self.assertEqual([statement for statement, _ in timer.statements],
+			['SELECT * FROM no_such_table', 'SELECT 1'])
+
+	def test_failed_request_counted(self):
+		"""Test a request ending in an unhandled exception is counted as a 500"""
+		def fail():
+			raise RuntimeError('boom')
+		self.app.add_url_rule('/fail', 'fail', fail)
+		# Tests keep the context of a failed request, which delays its teardown
+		self.app.config['PRESERVE_CONTEXT_ON_EXCEPTION'] = False
+		with self.assertRaises(RuntimeError):
+			self.client().get('/fail')
+		self.assertEqual(self.metrics.stats()[('/fail', 'GET')]['status'], {500: 1})
+
+	def test_unknown_password_cost(self):
+		"""Test checks against hashes without a readable cost don't break /metrics"""
+		hasher = self.app.extensions['password_hasher']
+		hasher.record_latency(4, 0.01)
+		hasher.record_latency(None, 0.02)
+		response = self.client().get('/metrics')
+		self.assertEqual(response.status_code, 200)
+		body = response.data.decode()
+		self.assertIn('password_check_seconds_count{cost="unknown"} 1', body)
+		self.assertLess(body.index('cost="4"'), body.index('cost="unknown"'))
+
+	def tearDown(self):
+		"""teardown all initialized variables."""
+		with self.app.app_context():
+			db.session.remove()
+			db.drop_all()
@@ -1,9 +1,11 @@
 import unittest
 import os
 import json
+import jwt
 from flask import Flask
 from app.app import create_app, db
 from app.models import Users, ShoppingList, ShoppingListItem, UserToken
+from app.revocation import token_key
 
 class ModelsTestCase(unittest.TestCase):
 	"""Models Test Case"""
@@ -36,7 +38,16 @@ class ModelsTestCase(unittest.TestCase):
 	def test_user_token_model(self):
 		usertoken = self.usertoken
 		# Test Shopping list item model presentation
-		self.assertEquals(str(usertoken), "<token: a_certain_token")
+		self.assertEquals(str(usertoken), "<token: {}".format(token_key("a_certain_token")))
+
+	def test_user_token_jti(self):
+		with self.app.app_context():
+			token = self.user.encode_token(1)
+		# Tokens are stored under their jti claim, not the raw token
+		usertoken = UserToken(token=token)
+		self.assertNotEqual(usertoken.jti, token_key("a_certain_token"))
+		self.assertEqual(usertoken.jti, jwt.decode(token, verify=False)['jti'])
+		self.assertLess(usertoken.jti, 2 ** 63)
 
 
 	def tearDown(self):
@@ -0,0 +1,97 @@
+import unittest
+import json
+from app.app import create_app, db
+from app.models import Users
+from app.passwords import HasherBusy, hash_cost
+
+class PasswordHasherTestCase(unittest.TestCase):
+	"""Test passwords are hashed in the process pool"""
+
+	def setUp(self):
+		self.app = create_app(config_name="testing")
+		self.app.config['HASH_POOL_WORKERS'] = 1
+		self.app.config['HASH_POOL_MAX_PENDING'] = 1
+		self.hasher = self.app.extensions['password_hasher']
+		self.hasher.init_app(self.app)
+		self.client = self.app.test_client
+		self.user = {
+			'username': 'Stallion',
+			'email': 'rocky@test.com',
+			'password': 'secret',
+			'confirm_password': 'secret'
+		}
+		with self.app.app_context():
+			db.create_all()
+
+	def test_hash_in_pool(self):
+		"""Test a hash made by a worker process verifies"""
+		pw_hash = self.hasher.generate_password_hash('secret')
+		self.assertTrue(pw_hash.startswith('$2b$04$'))
+		self.assertTrue(self.hasher.check_password_hash(pw_hash, 'secret'))
+		self.assertFalse(self.hasher.check_password_hash(pw_hash, 'secreto'))
+		self.assertFalse(self.hasher.check_password_hash('not a hash', 'secret'))
+		with self.assertRaises(ValueError):
+			self.hasher.generate_password_hash('')
+
+	def test_register_and_login_through_pool(self):
+		"""Test users can register and log in with the pool enabled"""
+		response = self.client().post('/auth/register', data=self.user)
+		self.assertEqual(response.status_code, 200)
+		response = self.client().post('/auth/login', data={
+			'email': self.user['email'],
+			'password': self.user['password']
+		})
+		self.assertEqual(response.status_code, 200)
+		self.assertIn('token', json.loads(response.data.decode()))
+
+	def test_saturated_pool(self):
+		"""Test hashing is refused with a 503 once the queue is full"""
+		self.client().post('/auth/register', data=self.user)
+		self.hasher.slots.acquire()
+		try:
+			with self.assertRaises(HasherBusy):
+				self.hasher.generate_password_hash('secret')
+			response = self.client().post('/auth/register', data=dict(self.user, email='stallion@test.com'))
+			self.assertEqual(response.status_code, 503)
+			self.assertIn(b"Server is busy, please try again.", response.data)
+			response = self.client().post('/auth/login', data={
+				'email': self.user['email'],
+				'password': self.user['password']
+			})
+			self.assertEqual(response.status_code, 503)
+		finally:
+			self.hasher.slots.release()
+
+	def test_hash_cost(self):
+		"""Test the cost is read from a stored hash"""
+		self.assertEqual(hash_cost(self.hasher.generate_password_hash('secret', 5)), 5)
+		self.assertIsNone(hash_cost('not a hash'))
+
+	def test_rehash_on_login(self):
+		"""Test a hash made with another cost is upgraded on login"""
+		with self.app.app_context():
+			Users(
+				username='Stallion',
+				email='rocky@test.com',
+				password=self.hasher.generate_password_hash('secret', 5)
+			).save_user()
+		for _ in range(2):
+			response = self.client().post('/auth/login', data={
+				'email': self.user['email'],
+				'password': self.user['password']
+			})
+			self.assertEqual(response.status_code, 200)
+		with self.app.app_context():
+			user = Users.query.filter_by(email='rocky@test.com').first()
+			self.assertEqual(hash_cost(user.password), 4)
+		report = self.hasher.latency_report()
+		self.assertEqual(report[5]['count'], 1)
+		self.assertEqual(report[4]['count'], 1)
+		self.assertLessEqual(report[5]['p50'], report[5]['p99'])
+
+	def tearDown(self):
+		"""teardown all initialized variables."""
+		self.hasher.shutdown()
+		with self.app.app_context():
+			db.session.remove()
+			db.drop_all()
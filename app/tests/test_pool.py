@@ -0,0 +1,114 @@
+import unittest
+import json
+import sqlite3
+import threading
+import time
+from sqlalchemy import exc
+from app.app import create_app, db
+from app.pool import InstrumentedQueuePool, ping, pool_stats
+
+class ConnectionPoolTestCase(unittest.TestCase):
+	"""Test checkouts wait and time out as configured and are measured"""
+
+	def setUp(self):
+		self.app = create_app(config_name="testing")
+		# Before the engine is made, one connection and a short wait
+		self.app.config['SQLALCHEMY_POOL_SIZE'] = 1
+		self.app.config['SQLALCHEMY_MAX_OVERFLOW'] = 0
+		self.app.config['SQLALCHEMY_POOL_TIMEOUT'] = 0.2
+		self.client = self.app.test_client
+		with self.app.app_context():
+			self.engine = db.get_engine(self.app)
+			db.create_all()
+
+	def access_token(self):
+		self.client().post('/auth/register', data={
+			'username': 'Stallion',
+			'email': 'rocky@test.com',
+			'password': 'secret',
+			'confirm_password': 'secret'
+		})
+		res = self.client().post('/auth/login', data={'email': 'rocky@test.com', 'password': 'secret'})
+		return "Bearer " + json.loads(res.data.decode())['token']
+
+	def test_pool_configured(self):
+		"""Test the engine pools with the configured settings"""
+		self.assertIsInstance(self.engine.pool, InstrumentedQueuePool)
+		stats = pool_stats(self.engine)
+		self.assertEqual((stats['pool_size'], stats['max_overflow']), (1, 0))
+		self.assertEqual(self.engine.pool._timeout, 0.2)
+		self.assertNotIn(ping, list(self.engine.pool.dispatch.checkout))
+
+	def test_saturated_pool_times_out(self):
+		"""Test a checkout gives up after the pool timeout when all connections are in use"""
+		held = self.engine.connect()
+		waited = []
+
+		def checkout():
+			started = time.time()
+			try:
+				self.engine.connect().close()
+			except exc.TimeoutError:
+				waited.append(time.time() - started)
+		thread = threading.Thread(target=checkout)
+		thread.start()
+		thread.join()
+		self.assertEqual(len(waited), 1)
+		self.assertGreaterEqual(waited[0], 0.2)
+		self.assertLess(waited[0], 2)
+		stats = pool_stats(self.engine)
+		self.assertEqual((stats['checked_out'], stats['timeouts']), (1, 1))
+		held.close()
+		self.engine.connect().close()
+		self.assertEqual(pool_stats(self.engine)['checked_out'], 0)
+
+	def test_request_waits_for_connection(self):
+		"""Test a request queues for a connection released within the timeout"""
+		access_token = self.access_token()
+		held = self.engine.connect()
+		responses = []
+		thread = threading.Thread(target=lambda: responses.append(
+			self.client().get('/shoppinglists', headers=dict(Authorization=access_token))))
+		thread.start()
+		time.sleep(0.05)
+		held.close()
+		thread.join()
+		self.assertEqual(responses[0].status_code, 200)
+		stats = pool_stats(self.engine)
+		self.assertEqual(stats['timeouts'], 0)
+		self.assertGreaterEqual(stats['wait_max'], 0.04)
+		body = self.client().get('/metrics').data.decode()
+		self.assertIn('db_pool_size 1', body)
+		self.assertIn('db_pool_timeouts_total 0', body)
+
+	def test_pre_ping(self):
+		"""Test connections are pinged on checkout when configured"""
+		app = create_app(config_name="testing")
+		app.config.update(SQLALCHEMY_POOL_SIZE=1, SQLALCHEMY_POOL_PRE_PING=True)
+		with app.app_context():
+			engine = db.get_engine(app)
+			self.assertEqual(list(engine.pool.dispatch.checkout), [ping])
+			self.assertEqual(engine.execute('SELECT 1').scalar(), 1)
+			engine.dispose()
+			# The recreated pool keeps pinging, once
+			self.assertEqual(list(engine.pool.dispatch.checkout), [ping])
+			self.assertTrue(engine.pool.pre_ping)
+		dead = sqlite3.connect(':memory:')
+		dead.close()
+		with self.assertRaises(exc.DisconnectionError):
+			ping(dead, None, None)
+
+	def test_unpooled_sqlite_by_default(self):
+		"""Test the testing config keeps SQLite on NullPool"""
+		app = create_app(config_name="testing")
+		with app.app_context():
+			engine = db.get_engine(app)
+			if engine.url.drivername.startswith('sqlite'):
+				self.assertIsNone(pool_stats(engine))
+
+	def tearDown(self):
+		"""teardown all initialized variables."""
+		with self.app.app_context():
+			db.session.remove()
+			db.drop_all()
+			self.engine.dispose()
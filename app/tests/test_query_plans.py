@@ -0,0 +1,64 @@
+import unittest
+from app.app import create_app, db
+from app.models import ShoppingList, ShoppingListItem
+
+class QueryPlanTestCase(unittest.TestCase):
+	"""Test the owner scoped queries are served by an index"""
+
+	def setUp(self):
+		self.app = create_app(config_name="testing")
+		self.app_context = self.app.app_context()
+		self.app_context.push()
+		db.create_all()
+
+	def explain(self, query):
+		"""Return the database's plan for a query as a single string"""
+		sql = str(query.statement.compile(
+			db.engine, compile_kwargs={'literal_binds': True}))
+		if db.engine.dialect.name == 'sqlite':
+			rows = db.session.execute('EXPLAIN QUERY PLAN ' + sql).fetchall()
+			return ' '.join(str(row[-1]) for row in rows)
+		# Tables are tiny in tests so make sure a usable index is picked
+		db.session.execute('SET enable_seqscan = off')
+		rows = db.session.execute('EXPLAIN ' + sql).fetchall()
+		return ' '.join(row[0] for row in rows)
+
+	def test_shoppinglists_by_owner(self):
+		"""Test listing an owner's shoppinglists doesn't scan the table"""
+		query = ShoppingList.query.filter_by(owner_id=1).order_by(
+			ShoppingList.date_created, ShoppingList.id)
+		plan = self.explain(query)
+		self.assertIn('ix_shoppinglists_owner_id_date_created', plan)
+		self.assertNotIn('Seq Scan', plan)
+		self.assertNotIn('SCAN shoppinglists', plan)
+
+	def test_shoppinglistitems_by_list_and_owner(self):
+		"""Test listing a shoppinglist's items doesn't scan the table"""
+		query = ShoppingListItem.query.filter_by(
+			shoppinglist_id=1, owner_id=1).order_by(ShoppingListItem.item_id)
+		plan = self.explain(query)
+		self.assertIn('ix_shoppinglistitems_shoppinglist_id_owner_id', plan)
+		self.assertNotIn('Seq Scan', plan)
+		self.assertNotIn('SCAN shoppinglistitems', plan)
+
+	def test_shoppinglist_title_check(self):
+		"""Test checking a title only reads the owner's titles"""
+		query = ShoppingList.query.filter_by(owner_id=1, title='Weekly groceries')
+		plan = self.explain(query)
+		self.assertIn('uq_shoppinglists_owner_id_title', plan)
+		self.assertNotIn('Seq Scan', plan)
+		self.assertNotIn('SCAN shoppinglists', plan)
+
+	def test_shoppinglistitem_title_check(self):
+		"""Test checking an item title only reads the list's titles"""
+		query = ShoppingListItem.query.filter_by(shoppinglist_id=1, item_title='Carrots and peas')
+		plan = self.explain(query)
+		self.assertIn('uq_shoppinglistitems_shoppinglist_id_item_title', plan)
+		self.assertNotIn('Seq Scan', plan)
+		self.assertNotIn('SCAN shoppinglistitems', plan)
+
+	def tearDown(self):
+		"""teardown all initialized variables."""
+		db.session.remove()
+		db.drop_all()
+		self.app_context.pop()
@@ -0,0 +1,133 @@
+import unittest
+import datetime
+import json
+import os
+import tempfile
+from flask import g
+from app.app import create_app, db
+from app.models import ShoppingList
+from app.replicas import ReplicaRouter
+
+class ReplicaRouterTestCase(unittest.TestCase):
+	"""Test read-only handlers read from the replica and writes stay on the primary"""
+
+	def setUp(self):
+		self.app = create_app(config_name="testing")
+		handle, self.replica_path = tempfile.mkstemp(suffix='.db')
+		os.close(handle)
+		self.app.config['SQLALCHEMY_REPLICA_URIS'] = ['sqlite:///' + self.replica_path]
+		self.router = ReplicaRouter(self.app)
+		self.client = self.app.test_client
+		with self.app.app_context():
+			db.create_all()
+			self.primary = db.get_engine(self.app)
+			self.replica = db.get_engine(self.app, bind='replica_0')
+			# Stands in for replication of the schema
+			db.Model.metadata.create_all(bind=self.replica)
+
+	def access_token(self):
+		self.client().post('/auth/register', data={
+			'username': 'Stallion',
+			'email': 'rocky@test.com',
+			'password': 'secret',
+			'confirm_password': 'secret'
+		})
+		res = self.client().post('/auth/login', data={'email': 'rocky@test.com', 'password': 'secret'})
+		return "Bearer " + json.loads(res.data.decode())['token']
+
+	def replicate_list(self, title):
+		now = datetime.datetime.utcnow()
+		return self.replica.execute(ShoppingList.__table__.insert().values(
+			owner_id=1, title=title, description='Copied to the replica',
+			date_created=now, date_modified=now)).inserted_primary_key[0]
+
+	def test_reads_from_replica(self):
+		"""Test list and item GETs read what the replica has"""
+		access_token = self.access_token()
+		response = self.client().post(
+			'/shoppinglists',
+			headers=dict(Authorization=access_token),
+			data={'title': 'My favorite meal', 'description': 'Items to cook my favorite meal'}
+		)
+		self.assertEqual(response.status_code, 201)
+		self.assertEqual(self.primary.execute('SELECT count(*) FROM shoppinglists').scalar(), 1)
+		response = self.client().get('/shoppinglists', headers=dict(Authorization=access_token))
+		self.assertIn(b"You don't have any shoppinglists", response.data)
+		shoppinglist_id = self.replicate_list('Replicated groceries')
+		response = self.client().get('/shoppinglists', headers=dict(Authorization=access_token))
+		titles = [result['title'] for result in json.loads(response.data.decode())['shoppinglists']]
+		self.assertEqual(titles, ['Replicated groceries'])
+		response = self.client().get(
+			'/shoppinglist/{0}'.format(shoppinglist_id), headers=dict(Authorization=access_token))
+		self.assertEqual(json.loads(response.data.decode())['title'], 'Replicated groceries')
+		# Nothing read from the replica is cached
+		entries = self.app.extensions['response_cache'].backend.entries.values()
+		self.assertFalse(any(entry['variants'] for entry in entries))
+
+	def test_writes_on_primary(self):
+		"""Test write handlers never touch the replica"""
+		access_token = self.access_token()
+		shoppinglist_id = self.replicate_list('Replicated groceries')
+		response = self.client().put(
+			'/shoppinglist/{0}'.format(shoppinglist_id),
+			headers=dict(Authorization=access_token),
+			data={'title': 'Weekly groceries', 'description': 'Everything for the week'}
+		)
+		self.assertIn(b"Requested value '1' was not found", response.data)
+		self.assertEqual(self.replica.execute('SELECT count(*) FROM users').scalar(), 0)
+
+	def test_read_after_write_on_primary(self):
+		"""Test a request that wrote reads the rest from the primary"""
+		select = ShoppingList.__table__.select()
+		update = ShoppingList.__table__.update().values(title='Weekly groceries')
+		with self.app.test_request_context():
+			self.app.preprocess_request()
+			self.assertIs(db.session.get_bind(clause=select), self.primary)
+			g.replica_reads = True
+			self.assertIs(db.session.get_bind(clause=select), self.replica)
+			self.assertIs(db.session.get_bind(clause=update), self.primary)
+			self.assertIs(db.session.get_bind(clause=select), self.primary)
+			db.session.remove()
+
+	def test_replicas_in_turn(self):
+		"""Test requests take the replicas in turn"""
+		self.app.config['SQLALCHEMY_REPLICA_URIS'] = ['sqlite:///' + self.replica_path] * 2
+		router = ReplicaRouter(self.app)
+		self.assertEqual(router.binds, ['replica_0', 'replica_1'])
+		binds = []
+		for _ in range(3):
+			with self.app.test_request_context():
+				self.app.preprocess_request()
+				g.replica_reads = True
+				db.session.get_bind(clause=ShoppingList.__table__.select())
+				binds.append(g.replica_bind)
+				db.session.remove()
+		self.assertEqual(binds, ['replica_0', 'replica_1', 'replica_0'])
+
+	def test_revocation_not_delayed_by_replica(self):
+		"""Test a token revoked elsewhere is refused though the replica hasn't the revocation"""
+		access_token = self.access_token()
+		response = self.client().get('/shoppinglists', headers=dict(Authorization=access_token))
+		self.assertEqual(response.status_code, 200)
+		# Another process logs the token out, the replica never gets the row
+		other_app = create_app(config_name="testing")
+		other_app.test_client().post('/auth/logout', headers=dict(Authorization=access_token))
+		self.assertEqual(self.replica.execute('SELECT count(*) FROM user_token').scalar(), 0)
+		self.app.extensions['revoked_tokens'].refreshed_at = 0
+		response = self.client().get('/shoppinglists', headers=dict(Authorization=access_token))
+		self.assertEqual(response.status_code, 403)
+		self.assertIn(b"Token created. Please log in again.", response.data)
+		response = self.client().post(
+			'/shoppinglists',
+			headers=dict(Authorization=access_token),
+			data={'title': 'My favorite meal', 'description': 'Items to cook my favorite meal'}
+		)
+		self.assertEqual(response.status_code, 403)
+
+	def tearDown(self):
+		"""teardown all initialized variables."""
+		with self.app.app_context():
+			db.session.remove()
+			db.drop_all()
+			self.replica.dispose()
+		os.remove(self.replica_path)
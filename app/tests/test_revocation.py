@@ -0,0 +1,138 @@
+import unittest
+import json
+import time
+from collections import deque
+from sqlalchemy import event
+from app.app import create_app, db
+from app.revocation import BloomFilter, RevocationCache, RevokedTokens, token_key
+
+class RevocationTestCase(unittest.TestCase):
+	"""Test the revoked token cache"""
+
+	def setUp(self):
+		self.app = create_app(config_name="testing")
+		self.client = self.app.test_client
+		self.user = {
+			'username': 'Stallion',
+			'email': 'rocky@test.com',
+			'password': 'secret',
+			'confirm_password': 'secret'
+		}
+		with self.app.app_context():
+			db.create_all()
+
+	def access_token(self):
+		self.client().post('/auth/register', data=self.user)
+		res = self.client().post('/auth/login', data={
+			'email': self.user['email'],
+			'password': self.user['password']
+		})
+		return "Bearer " + json.loads(res.data.decode())['token']
+
+	def count_queries(self, url, token):
+		"""Count the statements issued to serve a GET request"""
+		statements = []
+		def record(conn, cursor, statement, *args):
+			statements.append(statement)
+		with self.app.app_context():
+			engine = db.get_engine(self.app)
+		event.listen(engine, 'before_cursor_execute', record)
+		try:
+			response = self.client().get(url, headers=dict(Authorization=token))
+		finally:
+			event.remove(engine, 'before_cursor_execute', record)
+		return response, [s for s in statements if 'user_token' in s]
+
+	def test_bloom_filter(self):
+		"""Test added keys are always found"""
+		bloom = BloomFilter(capacity=1000, error_rate=0.01)
+		keys = [token_key('token-{}'.format(i)) for i in range(1000)]
+		for key in keys:
+			bloom.add(key)
+		self.assertTrue(all(key in bloom for key in keys))
+		false_positives = sum(
+			token_key('other-{}'.format(i)) in bloom for i in range(1000))
+		self.assertLess(false_positives, 50)
+
+	def test_revocation_cache_bounds(self):
+		"""Test the cache evicts least recently used and expired keys"""
+		cache = RevocationCache(max_size=2)
+		cache.add(1, time.time() + 60)
+		cache.add(2, time.time() + 60)
+		self.assertIn(1, cache)
+		cache.add(3, time.time() + 60)
+		self.assertNotIn(2, cache)
+		self.assertIn(1, cache)
+		cache.add(4, time.time() - 1)
+		self.assertNotIn(4, cache)
+		self.assertEqual(len(cache), 1)
+
+	def test_sync_picks_up_late_commits(self):
+		"""Test a row committed after one with a higher id still reaches the filter"""
+		revoked_tokens = RevokedTokens(self.app)
+		rows = [(1, 101), (3, 103)]
+		after_ids = []
+
+		def load_revoked(after_id):
+			after_ids.append(after_id)
+			return [row for row in rows if row[0] > after_id]
+		revoked_tokens.sync(load_revoked)
+		# Row 2 was taken before row 3 but committed after the first sync
+		rows.append((2, 102))
+		revoked_tokens.refreshed_at = 0
+		revoked_tokens.sync(load_revoked)
+		self.assertIn(102, revoked_tokens.bloom)
+		self.assertEqual(revoked_tokens.bloom.count, 3)
+		# Once sync_lag has passed only newer rows are read
+		revoked_tokens.watermarks = deque(
+			(at - revoked_tokens.sync_lag, last_id) for at, last_id in revoked_tokens.watermarks)
+		revoked_tokens.refreshed_at = 0
+		revoked_tokens.sync(load_revoked)
+		self.assertEqual(after_ids, [0, 0, 3])
+
+	def test_unrevoked_token_skips_database(self):
+		"""Test a token that was never revoked doesn't query user_token"""
+		access_token = self.access_token()
+		response, queries = self.count_queries('/shoppinglists', access_token)
+		self.assertEqual(response.status_code, 200)
+		# The first request loads the Bloom filter
+		self.assertEqual(len(queries), 1)
+		response, queries = self.count_queries('/shoppinglists', access_token)
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(queries, [])
+
+	def test_revoked_token_served_from_cache(self):
+		"""Test a logged out token is rejected without querying user_token"""
+		access_token = self.access_token()
+		self.client().get('/shoppinglists', headers=dict(Authorization=access_token))
+		self.client().post('/auth/logout', headers=dict(Authorization=access_token))
+		response, queries = self.count_queries('/shoppinglists', access_token)
+		self.assertIn(b"Token created. Please log in again.", response.data)
+		self.assertEqual(response.status_code, 403)
+		self.assertEqual(queries, [])
+
+	def test_revocation_from_another_process(self):
+		"""Test tokens revoked elsewhere are picked up from the database"""
+		access_token = self.access_token()
+		self.client().get('/shoppinglists', headers=dict(Authorization=access_token))
+		# Simulate another process logging the token out
+		other_app = create_app(config_name="testing")
+		other_app.test_client().post('/auth/logout', headers=dict(Authorization=access_token))
+		self.app.extensions['revoked_tokens'].refreshed_at = 0
+		response = self.client().get('/shoppinglists', headers=dict(Authorization=access_token))
+		self.assertIn(b"Token created. Please log in again.", response.data)
+
+	def test_logout_keeps_other_sessions(self):
+		"""Test logging out one token leaves tokens issued in the same second valid"""
+		first_token = self.access_token()
+		second_token = self.access_token()
+		self.assertNotEqual(first_token, second_token)
+		self.client().post('/auth/logout', headers=dict(Authorization=first_token))
+		response = self.client().get('/shoppinglists', headers=dict(Authorization=second_token))
+		self.assertEqual(response.status_code, 200)
+
+	def tearDown(self):
+		"""teardown all initialized variables."""
+		with self.app.app_context():
+			db.session.remove()
+			db.drop_all()
@@ -0,0 +1,102 @@
+import unittest
+import datetime
+import json
+from werkzeug.http import http_date
+from app.app import create_app, db
+from app.models import ShoppingListItem
+from app.serializers import (
+	ENCODERS, JSONArray, JSONEncoding, JSONObject, Serializer, http_datetime,
+	shoppinglistitem_serializer, stream_json)
+
+class SerializersTestCase(unittest.TestCase):
+	"""Test model rows are serialized through the field maps"""
+
+	def setUp(self):
+		self.app = create_app(config_name="testing")
+		self.shoppinglistitem = ShoppingListItem(
+			owner_id=1, shoppinglist_id=2, item_title="Vegetables",
+			item_description="Carrots and Cabbages")
+		self.shoppinglistitem.item_id = 3
+		self.shoppinglistitem.date_created = datetime.datetime(2017, 11, 22, 7, 26, 30, 882578)
+		self.shoppinglistitem.date_modified = None
+
+	def test_http_datetime(self):
+		"""Test dates keep the format jsonify wrote them in"""
+		for value in [datetime.datetime(2017, 11, 22, 7, 26, 30, 882578),
+				datetime.datetime(2026, 1, 4, 23, 59, 59)]:
+			self.assertEqual(http_datetime(value), http_date(value))
+
+	def test_serialize_model(self):
+		"""Test instances and row tuples give the same dict"""
+		expected = {
+			'item_id': 3,
+			'item_title': 'Vegetables',
+			'item_description': 'Carrots and Cabbages',
+			'shoppinglist_id': 2,
+			'date_created': 'Wed, 22 Nov 2017 07:26:30 GMT',
+			'date_modified': None,
+			'owner_id': 1
+		}
+		self.assertEqual(shoppinglistitem_serializer.one(self.shoppinglistitem), expected)
+		row = tuple(getattr(self.shoppinglistitem, attribute)
+			for attribute in shoppinglistitem_serializer.attributes)
+		self.assertEqual(shoppinglistitem_serializer.row(row), expected)
+
+	def test_projected_rows(self):
+		"""Test a column-projected query serializes like full instances"""
+		with self.app.app_context():
+			db.create_all()
+			try:
+				db.session.add(self.shoppinglistitem)
+				db.session.commit()
+				projected = db.session.query(
+					*shoppinglistitem_serializer.columns(ShoppingListItem)).all()
+				self.assertEqual(
+					shoppinglistitem_serializer.rows(projected),
+					shoppinglistitem_serializer.many(ShoppingListItem.query.all()))
+			finally:
+				db.session.remove()
+				db.drop_all()
+
+	def test_stream_json(self):
+		"""Test streamed chunks join to the same document as a single dump"""
+		rows = [(i, 'Item {}'.format(i)) for i in range(7)]
+		serializer = Serializer(('id', 'item_id'), ('title', 'item_title'))
+		value = JSONObject(
+			('version', 3),
+			('items', JSONArray(iter(rows), serializer)),
+			('deleted', JSONObject(('items', JSONArray(iter([4, 5]))), ('empty', JSONArray([])))))
+		chunks = list(stream_json(value, ENCODERS['json'], 3))
+		self.assertEqual(json.loads(b''.join(chunks).decode('utf-8')), {
+			'version': 3,
+			'items': serializer.rows(rows),
+			'deleted': {'items': [4, 5], 'empty': []}
+		})
+		# Seven rows in chunks of three
+		self.assertEqual(len([chunk for chunk in chunks if b'Item' in chunk]), 3)
+
+	def test_extend(self):
+		"""Test a serializer can be extended with more fields"""
+		serializer = Serializer(('id', 'item_id')).extend(('title', 'item_title'))
+		self.assertEqual(serializer.one(self.shoppinglistitem), {'id': 3, 'title': 'Vegetables'})
+
+	def test_encoders_agree(self):
+		"""Test every encoder writes the same document"""
+		data = {'items': [shoppinglistitem_serializer.one(self.shoppinglistitem)],
+			'when': datetime.datetime(2017, 11, 22, 7, 26, 30), 'title': 'Crème brûlée'}
+		documents = [json.loads(dumps(data).decode('utf-8')) for dumps in ENCODERS.values()]
+		for document in documents:
+			self.assertEqual(document, documents[0])
+		self.assertEqual(documents[0]['when'], 'Wed, 22 Nov 2017 07:26:30 GMT')
+		self.assertEqual(documents[0]['title'], 'Crème brûlée')
+
+	def test_encoder_config(self):
+		"""Test JSON_ENCODER picks the encoder"""
+		self.app.config['JSON_ENCODER'] = 'json'
+		encoding = JSONEncoding(self.app)
+		self.assertIs(encoding.dumps, ENCODERS['json'])
+		self.assertIs(self.app.extensions['json_encoding'], encoding)
+		with self.app.test_client() as client:
+			response = client.get('/')
+			self.assertEqual(response.content_type, 'application/json')
+			self.assertEqual(json.loads(response.data.decode()), {'message': 'Welcome to Shopping List API'})
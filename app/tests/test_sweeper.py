@@ -0,0 +1,56 @@
+import unittest
+import datetime
+from app.app import create_app, db
+from app.models import Users, UserToken
+
+class TokenSweeperTestCase(unittest.TestCase):
+	"""Test expired tokens are purged from the blacklist"""
+
+	def setUp(self):
+		self.app = create_app(config_name="testing")
+		self.app.extensions['token_sweeper'].batch_size = 2
+		self.app_context = self.app.app_context()
+		self.app_context.push()
+		db.create_all()
+		self.user = Users(username="John Doe", email="johndoe@sl.com", password="secret")
+
+	def revoke(self, expires_at):
+		usertoken = UserToken(token=self.user.encode_token(1))
+		usertoken.expires_at = expires_at
+		db.session.add(usertoken)
+		db.session.commit()
+
+	def test_expires_at_from_token(self):
+		"""Test a revoked token records the expiry of its exp claim"""
+		usertoken = UserToken(token=self.user.encode_token(1))
+		remaining = usertoken.expires_at - datetime.datetime.utcnow()
+		self.assertTrue(0 < remaining.total_seconds() <= 60)
+
+	def test_purge_expired_tokens(self):
+		"""Test only expired tokens are deleted, in batches"""
+		now = datetime.datetime.utcnow()
+		for _ in range(5):
+			self.revoke(now - datetime.timedelta(seconds=1))
+		self.revoke(now + datetime.timedelta(seconds=60))
+		stats = self.app.extensions['token_sweeper'].purge()
+		self.assertEqual(stats['last_purged'], 5)
+		self.assertEqual(stats['purged_total'], 5)
+		self.assertEqual(stats['table_rows'], 1)
+		self.assertEqual(UserToken.query.count(), 1)
+		stats = self.app.extensions['token_sweeper'].purge()
+		self.assertEqual(stats['last_purged'], 0)
+		self.assertEqual(stats['runs'], 2)
+
+	def test_purge_batch(self):
+		"""Test a single batch removes at most batch_size rows"""
+		for _ in range(3):
+			self.revoke(datetime.datetime.utcnow() - datetime.timedelta(seconds=1))
+		self.assertEqual(UserToken.purge_expired(2), 2)
+		self.assertEqual(UserToken.purge_expired(2), 1)
+		self.assertEqual(UserToken.purge_expired(2), 0)
+
+	def tearDown(self):
+		"""teardown all initialized variables."""
+		db.session.remove()
+		db.drop_all()
+		self.app_context.pop()
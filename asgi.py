@@ -0,0 +1,14 @@
+import os
+from flasgger import Swagger
+
+from app.app import create_app
+from app.asgi import AsyncAPI
+# Get the configuration name
+config_name = os.getenv('APP_SETTINGS')
+flask_app = create_app(config_name)
+
+# Initialize Flasgger for Swagger documentation
+Swagger(flask_app, template_file='../docs/index.yml')
+
+# Serve with an ASGI server, e.g. uvicorn asgi:app
+app = AsyncAPI(flask_app)
@@ -0,0 +1 @@
+"""Performance benchmarks, run each module with python -m benchmarks.<name>"""
@@ -0,0 +1,111 @@
+"""Compare serving the read endpoints from waitress and from uvicorn
+
+Usage: python -m benchmarks.asgi [--users 4] [--lists 20] [--items 20]
+       [--requests 1000] [--concurrency 64] [--threads 8]
+       [--db-latency 0.005] [--cache] [--database-url URL]
+
+Sends --requests GETs to each list and item read endpoint from
+--concurrency keep-alive clients, once to waitress running --threads
+threads as the Procfile does, and once to uvicorn serving AsyncAPI as
+asgi.py does. --db-latency adds that many seconds to every statement, on
+the sync engine with a sleep and on the async one with asyncio.sleep, to
+stand in for the round trip to a database on another host. The response
+cache is off unless --cache is given, so every request reaches the
+database.
+
+Reports throughput and p50/p95/p99 latency per endpoint and server, and
+uvicorn's throughput as a multiple of waitress's.
+"""
+import argparse
+import asyncio
+import collections
+import json
+import time
+
+from benchmarks.common import make_app, drop_app
+from benchmarks.load import Context, SCENARIOS, UvicornTransport, WaitressTransport, run, seed
+
+ENDPOINTS = (
+    'GET /shoppinglists',
+    'GET /shoppinglist/<int:shoppinglist_id>',
+    'GET /shoppinglist/<int:shoppinglist_id>/items',
+    'GET /shoppinglist/<int:shoppinglist_id>/item/<int:shoppinglistitem_id>',
+)
+
+
+def sync_latency(seconds):
+    """Engine listener sleeping before every statement"""
+    def sleep(conn, cursor, statement, parameters, context, executemany):
+        time.sleep(seconds)
+    return sleep
+
+
+def add_async_latency(asgi, seconds):
+    for engine in [asgi.database.primary] + asgi.database.replicas:
+        execute = engine.pool.execute
+
+        async def delayed(connection, sql, args, execute=execute):
+            await asyncio.sleep(seconds)
+            return await execute(connection, sql, args)
+        engine.pool.execute = delayed
+
+
+def measure(transport_class, args):
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from app.cache import LRUCacheBackend
+    app = make_app(args.database_url)
+    transport = None
+    sleep = sync_latency(args.db_latency)
+    try:
+        accounts = seed(app, args.users, args.lists, args.items)
+        if not args.cache:
+            # Keeps nothing, every read reaches the database
+            app.extensions['response_cache'].backend = LRUCacheBackend(0)
+        transport = transport_class(app, args.concurrency, args.threads)
+        if args.db_latency:
+            event.listen(Engine, 'before_cursor_execute', sleep)
+            if transport_class is UvicornTransport:
+                add_async_latency(transport.asgi, args.db_latency)
+        ctx = Context(transport, accounts)
+        return collections.OrderedDict(
+            (name, run(ctx, name, SCENARIOS[name], args.requests, args.concurrency))
+            for name in ENDPOINTS)
+    finally:
+        if args.db_latency and event.contains(Engine, 'before_cursor_execute', sleep):
+            event.remove(Engine, 'before_cursor_execute', sleep)
+        if transport is not None:
+            transport.close()
+        drop_app(app)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--users', type=int, default=4)
+    parser.add_argument('--lists', type=int, default=20)
+    parser.add_argument('--items', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--db-latency', type=float, default=0.005)
+    parser.add_argument('--cache', action='store_true')
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    servers = collections.OrderedDict(
+        (transport_class.name, measure(transport_class, args))
+        for transport_class in (WaitressTransport, UvicornTransport))
+    print(json.dumps({
+        'concurrency': args.concurrency,
+        'threads': args.threads,
+        'db_latency': args.db_latency,
+        'cache': args.cache,
+        'servers': servers,
+        'speedup': collections.OrderedDict(
+            (name, servers['uvicorn'][name]['throughput'] / servers['waitress'][name]['throughput'])
+            for name in ENDPOINTS),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Compare per-item and bulk update/delete of shoppinglist items
+
+Usage: python -m benchmarks.bulk_items [--items 200] [--database-url URL]
+
+Updates and then deletes every item of a list, once with one request per
+item and once with a single PATCH and DELETE on /shoppinglist/<id>/items,
+and reports requests, SQL statements and wall time for each.
+"""
+import argparse
+import json
+import time
+
+from benchmarks.common import make_app, drop_app, register, count_statements
+
+
+def seed(client, headers, title, items):
+    response = client.post(
+        '/shoppinglists', headers=headers,
+        data={'title': title, 'description': 'Items to benchmark'})
+    shoppinglist_id = json.loads(response.data.decode())['id']
+    response = client.post(
+        '/shoppinglist/{}/items/batch'.format(shoppinglist_id), headers=headers,
+        data=json.dumps([{
+            'item_title': 'Benchmark item number {}'.format(i),
+            'item_description': 'Benchmark description'
+        } for i in range(items)]),
+        content_type='application/json')
+    item_ids = [r['item_id'] for r in json.loads(response.data.decode())['results']]
+    return shoppinglist_id, item_ids
+
+
+def measure(app, func):
+    with count_statements(app) as statements:
+        start = time.perf_counter()
+        requests = func()
+        seconds = time.perf_counter() - start
+    return {'requests': requests, 'statements': len(statements), 'seconds': seconds}
+
+
+def per_item(app, client, headers, items):
+    shoppinglist_id, item_ids = seed(client, headers, 'Per item benchmark', items)
+
+    def update():
+        for item_id in item_ids:
+            client.put(
+                '/shoppinglist/{}/item/{}'.format(shoppinglist_id, item_id), headers=headers,
+                data={'item_title': 'Renamed item number {}'.format(item_id),
+                      'item_description': 'Already bought'})
+        return len(item_ids)
+
+    def delete():
+        for item_id in item_ids:
+            client.delete(
+                '/shoppinglist/{}/item/{}'.format(shoppinglist_id, item_id), headers=headers)
+        return len(item_ids)
+    return {'update': measure(app, update), 'delete': measure(app, delete)}
+
+
+def bulk(app, client, headers, items):
+    shoppinglist_id, item_ids = seed(client, headers, 'Bulk benchmark list', items)
+    url = '/shoppinglist/{}/items'.format(shoppinglist_id)
+
+    def update():
+        client.patch(
+            url, headers=headers, content_type='application/json',
+            data=json.dumps({'item_ids': item_ids, 'item_description': 'Already bought'}))
+        return 1
+
+    def delete():
+        client.delete(
+            url, headers=headers, content_type='application/json',
+            data=json.dumps({'filter': {}}))
+        return 1
+    return {'update': measure(app, update), 'delete': measure(app, delete)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--items', type=int, default=200)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    app = make_app(args.database_url)
+    try:
+        client = app.test_client()
+        headers = register(client, 'benchmark@test.com')
+        results = {
+            'items': args.items,
+            'per_item': per_item(app, client, headers, args.items),
+            'bulk': bulk(app, client, headers, args.items),
+        }
+        print(json.dumps(results, indent=2))
+    finally:
+        drop_app(app)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Shared setup for benchmarks that drive the app through its test client"""
+import contextlib
+import json
+import os
+import tempfile
+
+PASSWORD = 'benchmark'
+
+
+def make_app(database_url=None):
+    """App on the testing config with empty tables
+
+    Without a database_url a throwaway SQLite file is used. The testing
+    config appends _test to the database name so a Postgres URL points at
+    the test database and real data is never dropped.
+    """
+    if database_url is None:
+        handle, path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        database_url = 'sqlite:///' + path
+    os.environ['DATABASE_URL'] = database_url
+    os.environ.setdefault('SECRET', 'benchmark')
+    from app.app import create_app, db
+    app = create_app(config_name='testing')
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    return app
+
+
+def drop_app(app):
+    from app.app import db
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        url = db.engine.url
+        db.engine.dispose()
+    if url.drivername == 'sqlite' and url.database and os.path.exists(url.database):
+        os.remove(url.database)
+
+
+def register(client, email, username='Benchmark'):
+    client.post('/auth/register', data={
+        'username': username,
+        'email': email,
+        'password': PASSWORD,
+        'confirm_password': PASSWORD
+    })
+    return login(client, email)
+
+
+def login(client, email):
+    """Authorization header for a registered user"""
+    response = client.post('/auth/login', data={'email': email, 'password': PASSWORD})
+    return {'Authorization': 'Bearer ' + json.loads(response.data.decode())['token']}
+
+
+@contextlib.contextmanager
+def count_statements(app):
+    """Collect the SQL statements issued inside the block"""
+    from sqlalchemy import event
+    from app.app import db
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+    with app.app_context():
+        engine = db.get_engine(app)
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
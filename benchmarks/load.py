@@ -0,0 +1,539 @@
+"""Load-test every API route under concurrency
+
+Usage: python -m benchmarks.load [--users 4] [--lists 20] [--items 20]
+       [--requests 200] [--concurrency 8] [--server test-client|waitress|uvicorn]
+       [--only 'GET /shoppinglists' ...] [--database-url URL]
+       [--output FILE] [--baseline FILE] [--tolerance 0.25]
+
+Seeds --users accounts with --lists shopping lists of --items items each,
+then sends --requests requests to every route registered by create_app
+from --concurrency threads. Requests go through the Flask test client, or
+over HTTP to waitress serving the app in this process with --concurrency
+threads, as the Procfile does, or to uvicorn serving it as asgi.py does.
+
+Objects a request consumes (a list to delete, a token to log out) are
+made before the clock starts, so only the measured request is timed.
+Reports throughput and p50/p95/p99 latency per endpoint as JSON, and with
+--baseline the endpoints slower than a stored report by more than
+--tolerance, exiting with status 1 when there are any.
+"""
+import argparse
+import asyncio
+import collections
+import datetime
+import http.client
+import itertools
+import json
+import queue
+import socket
+import sys
+import threading
+import time
+from urllib.parse import urlencode
+
+from benchmarks.common import make_app, drop_app, register
+
+# Methods every route answers without a handler of ours
+IMPLICIT_METHODS = {'HEAD', 'OPTIONS'}
+
+
+class TestClientTransport(object):
+    """Requests through the WSGI app in the calling thread"""
+    name = 'test-client'
+
+    def __init__(self, app, concurrency):
+        self.app = app
+        self.local = threading.local()
+
+    def request(self, method, path, headers=None, data=None, json_body=None):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        if json_body is not None:
+            response = client.open(
+                path, method=method, headers=headers,
+                data=json.dumps(json_body), content_type='application/json')
+        else:
+            response = client.open(path, method=method, headers=headers, data=data)
+        return response.status_code, response.get_data()
+
+    def close(self):
+        pass
+
+
+class HTTPTransport(object):
+    """Requests over keep-alive HTTP connections to a server on self.port"""
+
+    def request(self, method, path, headers=None, data=None, json_body=None):
+        headers = dict(headers or {})
+        body = None
+        if json_body is not None:
+            body = json.dumps(json_body)
+            headers['Content-Type'] = 'application/json'
+        elif data is not None:
+            body = urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        for attempt in (1, 2):
+            connection = getattr(self.local, 'connection', None)
+            if connection is None:
+                connection = self.local.connection = http.client.HTTPConnection(
+                    '127.0.0.1', self.port)
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, ConnectionError):
+                # The server closed the kept-alive connection, reconnect once
+                connection.close()
+                self.local.connection = None
+                if attempt == 2:
+                    raise
+
+
+class WaitressTransport(HTTPTransport):
+    """waitress serving the app in this process, threads default to concurrency"""
+    name = 'waitress'
+
+    def __init__(self, app, concurrency, threads=None):
+        try:
+            from waitress import create_server
+        except ImportError:
+            sys.exit('--server waitress needs waitress installed (pip install waitress)')
+        self.server = create_server(app, host='127.0.0.1', port=0, threads=threads or concurrency)
+        self.port = self.server.effective_port
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+        self.thread.start()
+        self.local = threading.local()
+
+    def close(self):
+        self.server.close()
+
+
+class UvicornTransport(HTTPTransport):
+    """uvicorn serving the app's AsyncAPI from a thread of this process"""
+    name = 'uvicorn'
+
+    def __init__(self, app, concurrency, threads=None):
+        try:
+            import uvicorn
+        except ImportError:
+            sys.exit('--server uvicorn needs pip install -r requirements-asgi.txt')
+        from app.asgi import AsyncAPI
+        if not app.config.get('SQLALCHEMY_POOL_SIZE'):
+            # The testing config leaves SQLite unpooled, give every client a connection
+            app.config['SQLALCHEMY_POOL_SIZE'] = concurrency
+        app.config['ASGI_WSGI_THREADS'] = threads or concurrency
+        self.asgi = AsyncAPI(app)
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        self.port = listener.getsockname()[1]
+        self.server = uvicorn.Server(uvicorn.Config(self.asgi, log_level='warning'))
+        self.thread = threading.Thread(target=self.serve, args=(listener,), daemon=True)
+        self.thread.start()
+        while not self.server.started and self.thread.is_alive():
+            time.sleep(0.01)
+        if not self.server.started:
+            sys.exit('uvicorn failed to start')
+        self.local = threading.local()
+
+    def serve(self, listener):
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        self.server.run(sockets=[listener])
+
+    def close(self):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+TRANSPORTS = {
+    'test-client': TestClientTransport,
+    'waitress': WaitressTransport,
+    'uvicorn': UvicornTransport,
+}
+
+
+def seed(app, users, lists, items):
+    """Accounts, lists and items to run against
+
+    Accounts register through the API so their passwords are hashed as
+    usual, lists and items are inserted directly so seeding stays fast.
+    """
+    from app.app import db
+    from app.models import ShoppingList, ShoppingListItem, Users
+    accounts = []
+    for index in range(users):
+        email = 'load{}@test.com'.format(index)
+        client = app.test_client()
+        accounts.append({'email': email, 'headers': register(client, email, 'Load user')})
+    now = datetime.datetime.utcnow()
+    with app.app_context():
+        for account in accounts:
+            owner_id = Users.query.filter_by(email=account['email']).first().id
+            db.session.execute(ShoppingList.__table__.insert().values([{
+                'owner_id': owner_id,
+                'title': 'Seeded list number {}'.format(i),
+                'description': 'Groceries seeded for load tests',
+                'date_created': now,
+                'date_modified': now,
+            } for i in range(lists)]))
+            list_ids = [shoppinglist_id for shoppinglist_id, in db.session.query(
+                ShoppingList.id).filter(ShoppingList.owner_id == owner_id).order_by(ShoppingList.id)]
+            rows = [{
+                'owner_id': owner_id,
+                'shoppinglist_id': shoppinglist_id,
+                'item_title': 'Seeded item number {}'.format(i),
+                'item_description': 'Vegetables seeded for load tests',
+                'date_created': now,
+                'date_modified': now,
+            } for shoppinglist_id in list_ids for i in range(items)]
+            for start in range(0, len(rows), 10000):
+                db.session.execute(ShoppingListItem.__table__.insert().values(rows[start:start + 10000]))
+            db.session.commit()
+            account['lists'] = list_ids
+            account['items'] = {
+                shoppinglist_id: [item_id for item_id, in db.session.query(
+                    ShoppingListItem.item_id).filter(
+                    ShoppingListItem.shoppinglist_id == shoppinglist_id).order_by(
+                    ShoppingListItem.item_id)]
+                for shoppinglist_id in list_ids}
+        db.session.remove()
+    return accounts
+
+
+class Context(object):
+    """What a scenario builds its requests from
+
+    Unique numbers keep titles and emails from colliding across threads.
+    """
+
+    def __init__(self, transport, accounts):
+        self.transport = transport
+        self.accounts = accounts
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+
+    def unique(self):
+        with self.lock:
+            return next(self.counter)
+
+    def account(self, n):
+        return self.accounts[n % len(self.accounts)]
+
+    def some_list(self, n):
+        account = self.account(n)
+        lists = account['lists']
+        return account, lists[(n // len(self.accounts)) % len(lists)]
+
+    def some_item(self, n):
+        account, shoppinglist_id = self.some_list(n)
+        items = account['items'][shoppinglist_id]
+        return account, shoppinglist_id, items[n % len(items)]
+
+    def create_list(self, account):
+        status, body = self.transport.request(
+            'POST', '/shoppinglists', account['headers'],
+            data={'title': 'Load list number {}'.format(self.unique()),
+                  'description': 'Made for a load test request'})
+        return json.loads(body.decode())['id']
+
+    def create_items(self, account, shoppinglist_id, count):
+        status, body = self.transport.request(
+            'POST', '/shoppinglist/{}/items/batch'.format(shoppinglist_id), account['headers'],
+            json_body=[{'item_title': 'Load item number {}'.format(self.unique()),
+                        'item_description': 'Made for a load test request'}
+                       for _ in range(count)])
+        return [result['item_id'] for result in json.loads(body.decode())['results']]
+
+
+# Each scenario takes the context and the request number and returns the
+# keyword arguments of the request it times, consuming nothing shared.
+
+def home(ctx, n):
+    return {'path': '/'}
+
+
+def register_user(ctx, n):
+    return {'data': {
+        'username': 'Load user',
+        'email': 'register{}@test.com'.format(ctx.unique()),
+        'password': 'benchmark',
+        'confirm_password': 'benchmark'}}
+
+
+def login_user(ctx, n):
+    return {'data': {'email': ctx.account(n)['email'], 'password': 'benchmark'}}
+
+
+def logout_user(ctx, n):
+    status, body = ctx.transport.request(
+        'POST', '/auth/login', data={'email': ctx.account(n)['email'], 'password': 'benchmark'})
+    return {'headers': {'Authorization': 'Bearer ' + json.loads(body.decode())['token']}}
+
+
+def get_shoppinglists(ctx, n):
+    return {'headers': ctx.account(n)['headers']}
+
+
+def create_shoppinglist(ctx, n):
+    return {'headers': ctx.account(n)['headers'], 'data': {
+        'title': 'Load list number {}'.format(ctx.unique()),
+        'description': 'Made for a load test request'}}
+
+
+def get_shoppinglist(ctx, n):
+    account, shoppinglist_id = ctx.some_list(n)
+    return {'headers': account['headers'], 'path': '/shoppinglist/{}'.format(shoppinglist_id)}
+
+
+def update_shoppinglist(ctx, n):
+    account, shoppinglist_id = ctx.some_list(n)
+    return {'headers': account['headers'], 'path': '/shoppinglist/{}'.format(shoppinglist_id),
+            'data': {'title': 'Renamed list number {}'.format(ctx.unique()),
+                     'description': 'Renamed by a load test request'}}
+
+
+def delete_shoppinglist(ctx, n):
+    account = ctx.account(n)
+    return {'headers': account['headers'],
+            'path': '/shoppinglist/{}'.format(ctx.create_list(account))}
+
+
+def get_items(ctx, n):
+    account, shoppinglist_id = ctx.some_list(n)
+    return {'headers': account['headers'], 'path': '/shoppinglist/{}/items'.format(shoppinglist_id)}
+
+
+def create_item(ctx, n):
+    account, shoppinglist_id = ctx.some_list(n)
+    return {'headers': account['headers'], 'path': '/shoppinglist/{}/items'.format(shoppinglist_id),
+            'data': {'item_title': 'Load item number {}'.format(ctx.unique()),
+                     'item_description': 'Made for a load test request'}}
+
+
+def update_items(ctx, n):
+    account, shoppinglist_id = ctx.some_list(n)
+    return {'headers': account['headers'], 'path': '/shoppinglist/{}/items'.format(shoppinglist_id),
+            'json_body': {'item_ids': account['items'][shoppinglist_id][:10],
+                          'item_description': 'Updated by load test number {}'.format(n)}}
+
+
+def delete_items(ctx, n):
+    account, shoppinglist_id = ctx.some_list(n)
+    return {'headers': account['headers'], 'path': '/shoppinglist/{}/items'.format(shoppinglist_id),
+            'json_body': {'item_ids': ctx.create_items(account, shoppinglist_id, 10)}}
+
+
+def create_items_batch(ctx, n):
+    account, shoppinglist_id = ctx.some_list(n)
+    return {'headers': account['headers'],
+            'path': '/shoppinglist/{}/items/batch'.format(shoppinglist_id),
+            'json_body': [{'item_title': 'Batch item number {}'.format(ctx.unique()),
+                           'item_description': 'Made for a load test request'}
+                          for _ in range(10)]}
+
+
+def get_item(ctx, n):
+    account, shoppinglist_id, item_id = ctx.some_item(n)
+    return {'headers': account['headers'],
+            'path': '/shoppinglist/{}/item/{}'.format(shoppinglist_id, item_id)}
+
+
+def update_item(ctx, n):
+    account, shoppinglist_id, item_id = ctx.some_item(n)
+    return {'headers': account['headers'],
+            'path': '/shoppinglist/{}/item/{}'.format(shoppinglist_id, item_id),
+            'data': {'item_title': 'Renamed item number {}'.format(ctx.unique()),
+                     'item_description': 'Renamed by a load test request'}}
+
+
+def delete_item(ctx, n):
+    account, shoppinglist_id = ctx.some_list(n)
+    item_id, = ctx.create_items(account, shoppinglist_id, 1)
+    return {'headers': account['headers'],
+            'path': '/shoppinglist/{}/item/{}'.format(shoppinglist_id, item_id)}
+
+
+def sync(ctx, n):
+    return {'headers': ctx.account(n)['headers'], 'path': '/sync'}
+
+
+def search(ctx, n):
+    return {'headers': ctx.account(n)['headers'], 'path': '/search?q=seeded+vegetables'}
+
+
+def metrics(ctx, n):
+    return {}
+
+
+# 'METHOD rule' as in app.url_map, every route of create_app needs one
+SCENARIOS = collections.OrderedDict([
+    ('GET /', home),
+    ('POST /auth/register', register_user),
+    ('POST /auth/login', login_user),
+    ('POST /auth/logout', logout_user),
+    ('GET /shoppinglists', get_shoppinglists),
+    ('POST /shoppinglists', create_shoppinglist),
+    ('GET /shoppinglist/<int:shoppinglist_id>', get_shoppinglist),
+    ('PUT /shoppinglist/<int:shoppinglist_id>', update_shoppinglist),
+    ('DELETE /shoppinglist/<int:shoppinglist_id>', delete_shoppinglist),
+    ('GET /shoppinglist/<int:shoppinglist_id>/items', get_items),
+    ('POST /shoppinglist/<int:shoppinglist_id>/items', create_item),
+    ('PATCH /shoppinglist/<int:shoppinglist_id>/items', update_items),
+    ('DELETE /shoppinglist/<int:shoppinglist_id>/items', delete_items),
+    ('POST /shoppinglist/<int:shoppinglist_id>/items/batch', create_items_batch),
+    ('GET /shoppinglist/<int:shoppinglist_id>/item/<int:shoppinglistitem_id>', get_item),
+    ('PUT /shoppinglist/<int:shoppinglist_id>/item/<int:shoppinglistitem_id>', update_item),
+    ('DELETE /shoppinglist/<int:shoppinglist_id>/item/<int:shoppinglistitem_id>', delete_item),
+    ('GET /sync', sync),
+    ('GET /search', search),
+    ('GET /metrics', metrics),
+])
+
+
+def routes(app):
+    """'METHOD rule' for every route the app registers"""
+    return sorted(
+        '{} {}'.format(method, rule.rule)
+        for rule in app.url_map.iter_rules() if rule.endpoint != 'static'
+        for method in rule.methods - IMPLICIT_METHODS)
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of sorted values"""
+    if not ordered:
+        return None
+    return ordered[max(0, int(round(fraction * len(ordered))) - 1)]
+
+
+def run(ctx, name, scenario, requests, concurrency):
+    method, rule = name.split(' ', 1)
+    numbers = iter(range(requests))
+    prepared = queue.Queue()
+    lock = threading.Lock()
+
+    def prepare():
+        while True:
+            with lock:
+                n = next(numbers, None)
+            if n is None:
+                return
+            kwargs = scenario(ctx, n)
+            kwargs.setdefault('path', rule)
+            prepared.put(kwargs)
+    workers = [threading.Thread(target=prepare) for _ in range(concurrency)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    latencies = []
+    statuses = collections.Counter()
+
+    def send():
+        while True:
+            try:
+                kwargs = prepared.get_nowait()
+            except queue.Empty:
+                return
+            start = time.perf_counter()
+            try:
+                status, _ = ctx.transport.request(method, **kwargs)
+            except Exception as err:
+                status = type(err).__name__
+            seconds = time.perf_counter() - start
+            with lock:
+                latencies.append(seconds)
+                statuses[str(status)] += 1
+    workers = [threading.Thread(target=send) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    seconds = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': sum(count for status, count in statuses.items()
+                      if not status.isdigit() or int(status) >= 500),
+        'status': dict(statuses),
+        'seconds': seconds,
+        'throughput': len(latencies) / seconds if seconds else None,
+        'mean_ms': 1000 * sum(latencies) / len(latencies) if latencies else None,
+        'p50_ms': 1000 * percentile(latencies, 0.50) if latencies else None,
+        'p95_ms': 1000 * percentile(latencies, 0.95) if latencies else None,
+        'p99_ms': 1000 * percentile(latencies, 0.99) if latencies else None,
+    }
+
+
+def regressions(report, baseline, tolerance):
+    """Endpoints slower than the baseline by more than tolerance"""
+    slower = []
+    for name, result in report['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(name)
+        if not before:
+            continue
+        if result['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            slower.append({'endpoint': name, 'metric': 'p95_ms',
+                           'baseline': before['p95_ms'], 'current': result['p95_ms']})
+        if result['throughput'] < before['throughput'] * (1 - tolerance):
+            slower.append({'endpoint': name, 'metric': 'throughput',
+                           'baseline': before['throughput'], 'current': result['throughput']})
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--users', type=int, default=4)
+    parser.add_argument('--lists', type=int, default=20)
+    parser.add_argument('--items', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--server', choices=sorted(TRANSPORTS), default='test-client')
+    parser.add_argument('--only', nargs='+', metavar='ENDPOINT')
+    parser.add_argument('--database-url')
+    parser.add_argument('--output')
+    parser.add_argument('--baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+    if args.lists < 1 or args.items < 10:
+        parser.error('the item scenarios need --lists of at least 1 and --items of at least 10')
+
+    app = make_app(args.database_url)
+    transport = None
+    try:
+        transport = TRANSPORTS[args.server](app, args.concurrency)
+        accounts = seed(app, args.users, args.lists, args.items)
+        ctx = Context(transport, accounts)
+        names = args.only or list(SCENARIOS)
+        report = {
+            'server': transport.name,
+            'database': app.config['SQLALCHEMY_DATABASE_URI'].split(':', 1)[0],
+            'users': args.users,
+            'lists': args.lists,
+            'items': args.items,
+            'concurrency': args.concurrency,
+            'endpoints': collections.OrderedDict(
+                (name, run(ctx, name, SCENARIOS[name], args.requests, args.concurrency))
+                for name in names),
+            'uncovered': [name for name in routes(app) if name not in SCENARIOS],
+        }
+        if args.baseline:
+            with open(args.baseline) as baseline:
+                report['regressions'] = regressions(report, json.load(baseline), args.tolerance)
+        output = json.dumps(report, indent=2)
+        if args.output:
+            with open(args.output, 'w') as handle:
+                handle.write(output + '\n')
+        print(output)
+    finally:
+        if transport is not None:
+            transport.close()
+        drop_app(app)
+    if report.get('regressions'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
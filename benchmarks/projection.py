@@ -0,0 +1,87 @@
+"""Compare ORM hydration and column projection for an owner's lists
+
+Usage: python -m benchmarks.projection [--rows 1000 10000 100000] [--repeat 3] [--database-url URL]
+
+Seeds one owner with --rows shopping lists and serializes all of them,
+once from full ShoppingList instances and once from a query selecting
+only the serialized columns, reporting the best of --repeat runs.
+"""
+import argparse
+import datetime
+import json
+import time
+
+from benchmarks.common import make_app, drop_app
+
+
+def seed(db, owner_id, rows):
+    from app.models import ShoppingList
+    db.session.query(ShoppingList).delete()
+    now = datetime.datetime.utcnow()
+    for start in range(0, rows, 10000):
+        db.session.execute(ShoppingList.__table__.insert().values([{
+            'owner_id': owner_id,
+            'title': 'Benchmark list number {}'.format(i),
+            'description': 'Benchmark description',
+            'date_created': now,
+            'date_modified': now,
+        } for i in range(start, min(start + 10000, rows))]))
+    db.session.commit()
+
+
+def orm(db, owner_id):
+    from app.models import ShoppingList
+    from app.serializers import shoppinglist_serializer
+    return shoppinglist_serializer.many(
+        ShoppingList.query.filter_by(owner_id=owner_id).order_by(
+            ShoppingList.date_created, ShoppingList.id).all())
+
+
+def projected(db, owner_id):
+    from app.models import ShoppingList
+    from app.serializers import shoppinglist_serializer
+    return shoppinglist_serializer.rows(
+        db.session.query(*shoppinglist_serializer.columns(ShoppingList)).filter(
+            ShoppingList.owner_id == owner_id).order_by(
+            ShoppingList.date_created, ShoppingList.id).all())
+
+
+def best_of(db, func, owner_id, repeat):
+    timings = []
+    for _ in range(repeat):
+        # Start each run with an empty identity map, as a new request does
+        db.session.remove()
+        start = time.perf_counter()
+        count = len(func(db, owner_id))
+        timings.append(time.perf_counter() - start)
+    return {'rows': count, 'seconds': min(timings)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    app = make_app(args.database_url)
+    try:
+        from app.app import db
+        results = []
+        with app.app_context():
+            for rows in args.rows:
+                seed(db, 1, rows)
+                result = {
+                    'rows': rows,
+                    'orm': best_of(db, orm, 1, args.repeat),
+                    'projected': best_of(db, projected, 1, args.repeat),
+                }
+                result['speedup'] = result['orm']['seconds'] / result['projected']['seconds']
+                results.append(result)
+        print(json.dumps(results, indent=2))
+    finally:
+        drop_app(app)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Compare revoked token lookups by raw token and by jti
+
+Usage: python -m benchmarks.revoked_tokens [--rows 1000000] [--database-url URL]
+
+Fills one table keyed by the raw token string (the old user_token layout)
+and one keyed by a BIGINT jti (the current layout), then reports the size
+of each unique index and the time taken by point lookups against them.
+Defaults to a throwaway SQLite file, pass a Postgres URL to measure there.
+"""
+import argparse
+import base64
+import datetime
+import json
+import os
+import random
+import tempfile
+import time
+
+import jwt
+import sqlalchemy as sa
+
+from app.revocation import new_jti
+
+metadata = sa.MetaData()
+
+token_table = sa.Table(
+    'bench_token_by_string', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('token', sa.String(500), nullable=False),
+    sa.Index('ix_bench_token_by_string', 'token', unique=True),
+)
+
+jti_table = sa.Table(
+    'bench_token_by_jti', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('jti', sa.BigInteger, nullable=False),
+    sa.Index('ix_bench_token_by_jti', 'jti', unique=True),
+)
+
+
+def token_length():
+    """Length of a token as issued by Users.encode_token"""
+    now = datetime.datetime.utcnow()
+    payload = {'exp': now, 'iat': now, 'sub': 1, 'jti': new_jti()}
+    return len(jwt.encode(payload, 'secret', algorithm='HS256'))
+
+
+def fake_token(length):
+    return base64.urlsafe_b64encode(os.urandom(length)).decode('ascii')[:length]
+
+
+def index_size(engine, name):
+    """Size in bytes of an index"""
+    if engine.dialect.name == 'postgresql':
+        return engine.execute(
+            sa.text('SELECT pg_relation_size(CAST(:name AS regclass))'),
+            name=name).scalar()
+    if engine.dialect.name == 'sqlite':
+        return engine.execute(
+            sa.text('SELECT SUM(pgsize) FROM dbstat WHERE name = :name'),
+            name=name).scalar()
+    return None
+
+
+def fill(engine, rows, batch_size=10000):
+    length = token_length()
+    keys = []
+    for start in range(0, rows, batch_size):
+        batch = [(fake_token(length), new_jti()) for _ in range(min(batch_size, rows - start))]
+        with engine.begin() as conn:
+            conn.execute(token_table.insert(), [{'token': t} for t, _ in batch])
+            conn.execute(jti_table.insert(), [{'jti': j} for _, j in batch])
+        keys.extend(batch)
+    if engine.dialect.name == 'postgresql':
+        engine.execute('ANALYZE bench_token_by_string')
+        engine.execute('ANALYZE bench_token_by_jti')
+    return keys, length
+
+
+def time_lookups(engine, column, values):
+    """Mean seconds per point lookup"""
+    query = sa.select([sa.literal(1)]).where(column == sa.bindparam('value'))
+    with engine.connect() as conn:
+        compiled = query.compile(conn)
+        start = time.perf_counter()
+        for value in values:
+            conn.execute(compiled, value=value).first()
+        return (time.perf_counter() - start) / len(values)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--lookups', type=int, default=10000)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    path = None
+    url = args.database_url
+    if url is None:
+        handle, path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        url = 'sqlite:///' + path
+    engine = sa.create_engine(url)
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+    try:
+        keys, length = fill(engine, args.rows)
+        sample = random.sample(keys, min(args.lookups, len(keys)))
+        missing = [(fake_token(length), new_jti()) for _ in sample]
+        results = {
+            'rows': args.rows,
+            'dialect': engine.dialect.name,
+            'token': {
+                'index_bytes': index_size(engine, 'ix_bench_token_by_string'),
+                'hit_us': time_lookups(engine, token_table.c.token, [t for t, _ in sample]) * 1e6,
+                'miss_us': time_lookups(engine, token_table.c.token, [t for t, _ in missing]) * 1e6,
+            },
+            'jti': {
+                'index_bytes': index_size(engine, 'ix_bench_token_by_jti'),
+                'hit_us': time_lookups(engine, jti_table.c.jti, [j for _, j in sample]) * 1e6,
+                'miss_us': time_lookups(engine, jti_table.c.jti, [j for _, j in missing]) * 1e6,
+            },
+        }
+        print(json.dumps(results, indent=2))
+    finally:
+        metadata.drop_all(engine)
+        engine.dispose()
+        if path is not None:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Serialize shoppinglist item rows to a JSON response body
+
+Usage: python -m benchmarks.serialize [--rows 10000] [--repeat 5]
+
+Builds the body of an items page for --rows in-memory items, once the way
+the handlers used to (a dict per row built by hand, then jsonify) and once
+through app.serializers with each available encoder. Reports the best of
+--repeat runs.
+"""
+import argparse
+import datetime
+import json
+import time
+
+from benchmarks.common import make_app, drop_app
+
+
+def make_rows(count):
+    from app.models import ShoppingListItem
+    now = datetime.datetime(2017, 11, 22, 7, 26, 30)
+    rows = []
+    for i in range(count):
+        item = ShoppingListItem(
+            owner_id=1, shoppinglist_id=1,
+            item_title='Benchmark item number {}'.format(i),
+            item_description='Benchmark description')
+        item.item_id = i + 1
+        item.date_created = now
+        item.date_modified = now
+        rows.append(item)
+    return rows
+
+
+def legacy(rows):
+    from flask import jsonify
+    results = []
+    for shoppinglistitem in rows:
+        results.append({
+            'item_id': shoppinglistitem.item_id,
+            'item_title': shoppinglistitem.item_title,
+            'item_description': shoppinglistitem.item_description,
+            'shoppinglist_id': shoppinglistitem.shoppinglist_id,
+            'date_created': shoppinglistitem.date_created,
+            'date_modified': shoppinglistitem.date_modified,
+            'owner_id': shoppinglistitem.owner_id
+        })
+    return jsonify({'items': results, 'next_cursor': None}).get_data()
+
+
+def serializer(dumps):
+    from app.serializers import shoppinglistitem_serializer
+
+    def run(rows):
+        return dumps({'items': shoppinglistitem_serializer.many(rows), 'next_cursor': None})
+    return run
+
+
+def best_of(func, rows, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = func(rows)
+        timings.append(time.perf_counter() - start)
+    return {'seconds': min(timings), 'bytes': len(body)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = make_app()
+    try:
+        from app.serializers import ENCODERS
+        with app.test_request_context():
+            rows = make_rows(args.rows)
+            cases = {'legacy_jsonify': legacy}
+            for name, dumps in ENCODERS.items():
+                cases['serializer_' + name] = serializer(dumps)
+            results = {'rows': args.rows}
+            for name, func in cases.items():
+                results[name] = best_of(func, rows, args.repeat)
+        print(json.dumps(results, indent=2))
+    finally:
+        drop_app(app)
+
+
+if __name__ == '__main__':
+    main()
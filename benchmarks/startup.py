@@ -0,0 +1,122 @@
+"""Measure app startup and per-request argument parsing
+
+Usage: python -m benchmarks.startup [--requests 100000] [--repeat 5]
+
+Reports the cold import + create_app time and the import time of run.py,
+each in a fresh interpreter, and the cost of parsing a login request at
+the start and at the end of a long run. The same run with a single shared
+parser that gains its arguments again on every request, as the handlers
+used to do, is included for comparison.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COLD_CREATE_APP = '''
+import time
+start = time.perf_counter()
+from app.app import create_app
+create_app(config_name='testing')
+print(time.perf_counter() - start)
+'''
+
+IMPORT_RUN = '''
+import time
+start = time.perf_counter()
+import run
+print(time.perf_counter() - start)
+'''
+
+
+def fresh_interpreter(code, repeat):
+    """Median seconds printed by code over repeat new interpreters"""
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URL', 'sqlite:///startup-benchmark.db')
+    env.setdefault('SECRET', 'benchmark')
+    env.setdefault('APP_SETTINGS', 'testing')
+    timings = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, '-c', code], cwd=ROOT, env=env,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            return {'error': result.stderr.decode().strip().splitlines()[-1]}
+        timings.append(float(result.stdout.decode().strip()))
+    return {'median_seconds': statistics.median(timings)}
+
+
+def time_parses(app, parse, count):
+    """Seconds taken by each of count parses of a login request"""
+    timings = []
+    with app.test_request_context(
+            '/auth/login', method='POST',
+            data={'email': 'rocky@test.com', 'password': 'secret'}):
+        for _ in range(count):
+            start = time.perf_counter()
+            parse()
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def parse_timings(app, requests, parser, window=1000):
+    """Mean microseconds per parse over the first and last window requests"""
+    timings = time_parses(app, parser.parse_args, requests)
+    return {
+        'first_us': statistics.mean(timings[:window]) * 1e6,
+        'last_us': statistics.mean(timings[-window:]) * 1e6,
+    }
+
+
+def legacy_parse_timings(app, requests, window=10):
+    """The same for a shared parser that gains two arguments per request
+
+    Parsing cost grows with the number of arguments, so the parser is
+    grown to its size after requests requests before timing it instead of
+    parsing every request, which would be quadratic.
+    """
+    from flask_restful import reqparse
+    shared_parser = reqparse.RequestParser()
+    for arg in ['email', 'password']:
+        shared_parser.add_argument(arg)
+    first = time_parses(app, shared_parser.parse_args, window)
+    for _ in range(requests - 1):
+        for arg in ['email', 'password']:
+            shared_parser.add_argument(arg)
+    last = time_parses(app, shared_parser.parse_args, window)
+    return {
+        'first_us': statistics.mean(first) * 1e6,
+        'last_us': statistics.mean(last) * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--requests', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    from benchmarks.common import make_app, drop_app
+
+    app = make_app()
+    from app.resources import login_parser
+    try:
+        results = {
+            'cold_create_app': fresh_interpreter(COLD_CREATE_APP, args.repeat),
+            'import_run': fresh_interpreter(IMPORT_RUN, args.repeat),
+            'requests': args.requests,
+            'parse': parse_timings(app, args.requests, login_parser),
+            'legacy_parse': legacy_parse_timings(app, args.requests),
+        }
+        print(json.dumps(results, indent=2))
+    finally:
+        drop_app(app)
+
+
+if __name__ == '__main__':
+    main()
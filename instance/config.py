@@ -13,6 +13,70 @@ class Config(object):
     SQLALCHEMY_TRACK_MODIFICATIONS = True
     BCRYPT_LOG_ROUNDS = 13
     DEBUG = False
+    # Keyset pagination for collection endpoints
+    PAGE_SIZE = 20
+    MAX_PAGE_SIZE = 100
+    # Most items accepted by one batch request
+    MAX_BATCH_SIZE = 500
+    # Verified token claims cache, see app/auth.py
+    VERIFIED_TOKEN_CACHE_SIZE = 10000
+    # Revoked token cache, see app/revocation.py
+    REVOCATION_CACHE_SIZE = 10000
+    REVOCATION_BLOOM_CAPACITY = 100000
+    REVOCATION_BLOOM_ERROR_RATE = 0.001
+    REVOCATION_REFRESH_SECONDS = 1
+    REVOCATION_REBUILD_SECONDS = 300
+    # How late a user_token row may commit after rows with higher ids
+    REVOCATION_SYNC_LAG_SECONDS = 10
+    # Expired token purge, see app/sweeper.py
+    TOKEN_PURGE_INTERVAL = 300
+    TOKEN_PURGE_BATCH_SIZE = 1000
+    TOKEN_PURGE_PAUSE_SECONDS = 0.05
+    # bcrypt process pool, see app/passwords.py. None is one worker per core,
+    # keep the pending limit below the number of waitress threads
+    HASH_POOL_WORKERS = None
+    HASH_POOL_MAX_PENDING = 4
+    # Password checks timed per hash cost for the latency report
+    HASH_LATENCY_SAMPLES = 1000
+    # Serialized GET responses, see app/cache.py. None is an in-process LRU
+    # of RESPONSE_CACHE_SIZE scopes kept RESPONSE_CACHE_TTL seconds, or an
+    # import path of a backend factory
+    RESPONSE_CACHE_BACKEND = None
+    RESPONSE_CACHE_SIZE = 10000
+    RESPONSE_CACHE_TTL = 60
+    RESPONSE_CACHE_VARIANTS = 32
+    # Encoder for JSON responses, see app/serializers.py. None takes orjson
+    # when it is installed
+    JSON_ENCODER = None
+    # Rows fetched and written at a time by streamed responses
+    STREAM_CHUNK_SIZE = 500
+    # Request timing, see app/metrics.py. Slower requests are logged with
+    # their statements, None turns the log off
+    SLOW_REQUEST_SECONDS = 0.5
+    SERVER_TIMING = True
+    # Prometheus scrape path, None leaves it unrouted
+    METRICS_PATH = '/metrics'
+    REQUEST_DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+    # Connections per app process, see app/pool.py. Waitress runs 8
+    # threads, keep (POOL_SIZE + MAX_OVERFLOW) * processes below the
+    # database's connection limit. A checkout waits POOL_TIMEOUT seconds
+    # for a free connection before failing
+    SQLALCHEMY_POOL_SIZE = 8
+    SQLALCHEMY_MAX_OVERFLOW = 2
+    SQLALCHEMY_POOL_TIMEOUT = 10
+    # Seconds after which a connection is replaced, below server-side idle timeouts
+    SQLALCHEMY_POOL_RECYCLE = 1800
+    # Test connections with SELECT 1 as they are checked out
+    SQLALCHEMY_POOL_PRE_PING = True
+    # Read-only handlers read from these, see app/replicas.py
+    SQLALCHEMY_REPLICA_URIS = [
+        uri for uri in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if uri]
+    # ASGI mode, see app/asgi.py. Requests without an async handler run
+    # on the Flask app in this many threads, as waitress does
+    ASGI_WSGI_THREADS = 8
+    # App processes serving the database, over all dynos. The in-process
+    # response cache is turned off above 1, see app/cache.py
+    APP_PROCESSES = int(os.getenv('APP_PROCESSES', os.getenv('WEB_CONCURRENCY', 1)))
 
 class DevelopmentConfig(Config):
     """Development configurations"""
@@ -21,6 +85,11 @@ class DevelopmentConfig(Config):
     DEBUG = True
     BCRYPT_LOG_ROUNDS = 4
     SQLALCHEMY_DATABASE_URI = postgres_local_database
+    # One developer, fail fast instead of queueing
+    SQLALCHEMY_POOL_SIZE = 2
+    SQLALCHEMY_MAX_OVERFLOW = 4
+    SQLALCHEMY_POOL_TIMEOUT = 5
+    SQLALCHEMY_POOL_PRE_PING = False
 
 class TestingConfig(Config):
     """Testing configurations"""
@@ -30,7 +99,17 @@ class TestingConfig(Config):
     DEBUG = True
     TESTING = True
     BCRYPT_LOG_ROUNDS = 4
+    TOKEN_PURGE_INTERVAL = None
+    HASH_POOL_WORKERS = 0
     SQLALCHEMY_DATABASE_URI = postgres_local_database + "{}".format('_test')
+    # Tests run one request at a time. None keeps SQLite on NullPool
+    SQLALCHEMY_POOL_SIZE = None
+    SQLALCHEMY_MAX_OVERFLOW = None
+    SQLALCHEMY_POOL_TIMEOUT = 5
+    SQLALCHEMY_POOL_RECYCLE = None
+    SQLALCHEMY_POOL_PRE_PING = False
+    SQLALCHEMY_REPLICA_URIS = []
+    APP_PROCESSES = 1
 
 class ProductionConfig(Config):
     """Production configurations"""
@@ -38,6 +117,9 @@ class ProductionConfig(Config):
     DEBUG = False
     TESTING = False
     SQLALCHEMY_DATABASE_URI = postgres_local_database
+    # Sized per dyno so every dyno fits in the plan's connection limit
+    SQLALCHEMY_POOL_SIZE = int(os.getenv('DATABASE_POOL_SIZE', 8))
+    SQLALCHEMY_MAX_OVERFLOW = int(os.getenv('DATABASE_MAX_OVERFLOW', 2))
 
 app_config = {
     'development': DevelopmentConfig,
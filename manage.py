@@ -27,5 +27,13 @@ def test():
         return 0
     return 1
 
+# define our command for purging expired tokens called "purge_tokens"
+# Usage: python manage.py purge_tokens
+@manager.command
+def purge_tokens():
+    """Deletes expired tokens from the user_token blacklist."""
+    stats = app.extensions['token_sweeper'].purge()
+    print('Purged {last_purged} expired tokens, {table_rows} remain'.format(**stats))
+
 if __name__ == '__main__':
     manager.run()
@@ -0,0 +1,26 @@
+"""add owner indexes to shoppinglists and shoppinglistitems
+
+Revision ID: 3f2a9c1d8b47
+Revises: 710c83b4682f
+Create Date: 2026-10-18 09:12:44.118203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f2a9c1d8b47'
+down_revision = '710c83b4682f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_shoppinglists_owner_id_date_created', 'shoppinglists', ['owner_id', 'date_created', 'id'], unique=False)
+    op.create_index('ix_shoppinglistitems_shoppinglist_id_owner_id', 'shoppinglistitems', ['shoppinglist_id', 'owner_id', 'item_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_shoppinglistitems_shoppinglist_id_owner_id', table_name='shoppinglistitems')
+    op.drop_index('ix_shoppinglists_owner_id_date_created', table_name='shoppinglists')
@@ -0,0 +1,29 @@
+"""add expires_at to user_token
+
+Revision ID: 5c8d21e7f03a
+Revises: b71e04c2a9d5
+Create Date: 2026-10-18 10:41:52.730164
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c8d21e7f03a'
+down_revision = 'b71e04c2a9d5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing rows can't be purged without an expiry and have all expired
+    op.execute('DELETE FROM user_token')
+    op.add_column('user_token', sa.Column('expires_at', sa.DateTime(), nullable=True))
+    op.create_index(op.f('ix_user_token_expires_at'), 'user_token', ['expires_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_user_token_expires_at'), table_name='user_token')
+    with op.batch_alter_table('user_token') as batch_op:
+        batch_op.drop_column('expires_at')
@@ -0,0 +1,45 @@
+"""scope list titles to their owner and item titles to their list
+
+Revision ID: 9e4b6a0d2c18
+Revises: 5c8d21e7f03a
+Create Date: 2026-10-18 14:21:09.637120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e4b6a0d2c18'
+down_revision = '5c8d21e7f03a'
+branch_labels = None
+depends_on = None
+
+# The first revision left the title constraints unnamed, this names them
+# the way SQLite's batch mode reflects them
+naming_convention = {'uq': 'uq_%(table_name)s_%(column_0_name)s'}
+
+
+def title_constraint(table, column):
+    if op.get_bind().dialect.name == 'postgresql':
+        return '{}_{}_key'.format(table, column)
+    return 'uq_{}_{}'.format(table, column)
+
+
+def upgrade():
+    with op.batch_alter_table('shoppinglists', naming_convention=naming_convention) as batch_op:
+        batch_op.drop_constraint(title_constraint('shoppinglists', 'title'), type_='unique')
+        batch_op.create_index('uq_shoppinglists_owner_id_title', ['owner_id', 'title'], unique=True)
+    with op.batch_alter_table('shoppinglistitems', naming_convention=naming_convention) as batch_op:
+        batch_op.drop_constraint(title_constraint('shoppinglistitems', 'item_title'), type_='unique')
+        batch_op.create_index('uq_shoppinglistitems_shoppinglist_id_item_title', ['shoppinglist_id', 'item_title'], unique=True)
+
+
+def downgrade():
+    # Fails if two owners or lists have since used the same title
+    with op.batch_alter_table('shoppinglistitems', naming_convention=naming_convention) as batch_op:
+        batch_op.drop_index('uq_shoppinglistitems_shoppinglist_id_item_title')
+        batch_op.create_unique_constraint(title_constraint('shoppinglistitems', 'item_title'), ['item_title'])
+    with op.batch_alter_table('shoppinglists', naming_convention=naming_convention) as batch_op:
+        batch_op.drop_index('uq_shoppinglists_owner_id_title')
+        batch_op.create_unique_constraint(title_constraint('shoppinglists', 'title'), ['title'])
@@ -0,0 +1,35 @@
+"""store revoked tokens by jti instead of the raw token
+
+Revision ID: b71e04c2a9d5
+Revises: 3f2a9c1d8b47
+Create Date: 2026-10-18 10:03:17.502941
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b71e04c2a9d5'
+down_revision = '3f2a9c1d8b47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Tokens live for 60 seconds so every stored row has already expired
+    # and can be dropped instead of being backfilled
+    op.execute('DELETE FROM user_token')
+    with op.batch_alter_table('user_token') as batch_op:
+        batch_op.drop_column('token')
+        batch_op.add_column(sa.Column('jti', sa.BigInteger(), nullable=False))
+        batch_op.create_unique_constraint('uq_user_token_jti', ['jti'])
+
+
+def downgrade():
+    op.execute('DELETE FROM user_token')
+    with op.batch_alter_table('user_token') as batch_op:
+        batch_op.drop_constraint('uq_user_token_jti', type_='unique')
+        batch_op.drop_column('jti')
+        batch_op.add_column(sa.Column('token', sa.String(length=500), nullable=False))
+        batch_op.create_unique_constraint('user_token_token_key', ['token'])
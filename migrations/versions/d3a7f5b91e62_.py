@@ -0,0 +1,47 @@
+"""add change versions and tombstones for delta sync
+
+Revision ID: d3a7f5b91e62
+Revises: 9e4b6a0d2c18
+Create Date: 2026-10-18 15:02:51.274408
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3a7f5b91e62'
+down_revision = '9e4b6a0d2c18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('users', 'shoppinglists', 'shoppinglistitems'):
+        op.add_column(table, sa.Column('version', sa.BigInteger(), server_default='0', nullable=False))
+    # Existing rows count as the first change so a sync from 0 returns them
+    op.execute('UPDATE users SET version = 1')
+    op.execute('UPDATE shoppinglists SET version = 1')
+    op.execute('UPDATE shoppinglistitems SET version = 1')
+    op.create_index('ix_shoppinglists_owner_id_version', 'shoppinglists', ['owner_id', 'version'], unique=False)
+    op.create_index('ix_shoppinglistitems_owner_id_version', 'shoppinglistitems', ['owner_id', 'version'], unique=False)
+    op.create_table('tombstones',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('owner_id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('object_id', sa.Integer(), nullable=False),
+    sa.Column('shoppinglist_id', sa.Integer(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_tombstones_owner_id_version', 'tombstones', ['owner_id', 'version'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_tombstones_owner_id_version', table_name='tombstones')
+    op.drop_table('tombstones')
+    op.drop_index('ix_shoppinglistitems_owner_id_version', table_name='shoppinglistitems')
+    op.drop_index('ix_shoppinglists_owner_id_version', table_name='shoppinglists')
+    for table in ('shoppinglistitems', 'shoppinglists', 'users'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('version')
@@ -0,0 +1,58 @@
+"""add full-text search vectors to lists and items
+
+Revision ID: e8c4b2d07a93
+Revises: d3a7f5b91e62
+Create Date: 2026-10-18 17:41:09.508213
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8c4b2d07a93'
+down_revision = 'd3a7f5b91e62'
+branch_labels = None
+depends_on = None
+
+TABLES = (
+    ('shoppinglists', 'title', 'description'),
+    ('shoppinglistitems', 'item_title', 'item_description'),
+)
+
+
+
+def search_vector_ddl(table, title, description):
+    return [
+        'CREATE FUNCTION {0}_search_vector() RETURNS trigger AS $$ BEGIN '
+        "NEW.search_vector := setweight(to_tsvector('pg_catalog.english', coalesce(NEW.{1}, '')), 'A') || "
+        "setweight(to_tsvector('pg_catalog.english', coalesce(NEW.{2}, '')), 'B'); "
+        'RETURN NEW; END $$ LANGUAGE plpgsql'.format(table, title, description),
+        'CREATE TRIGGER {0}_search_vector BEFORE INSERT OR UPDATE OF {1}, {2} ON {0} '
+        'FOR EACH ROW EXECUTE PROCEDURE {0}_search_vector()'.format(table, title, description),
+        'CREATE INDEX ix_{0}_search_vector ON {0} USING gin (search_vector)'.format(table),
+    ]
+
+
+def upgrade():
+    postgres = op.get_bind().dialect.name == 'postgresql'
+    for table, title, description in TABLES:
+        op.add_column(table, sa.Column(
+            'search_vector', postgresql.TSVECTOR() if postgres else sa.Text(), nullable=True))
+        if postgres:
+            for statement in search_vector_ddl(table, title, description):
+                op.execute(statement)
+            # Fires the trigger for every existing row
+            op.execute('UPDATE {0} SET {1} = {1}'.format(table, title))
+
+
+def downgrade():
+    postgres = op.get_bind().dialect.name == 'postgresql'
+    for table, title, description in reversed(TABLES):
+        if postgres:
+            op.drop_index('ix_{}_search_vector'.format(table), table_name=table)
+            op.execute('DROP TRIGGER {0}_search_vector ON {0}'.format(table))
+            op.execute('DROP FUNCTION {}_search_vector()'.format(table))
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('search_vector')